@@ -0,0 +1,93 @@
+"""
+Measures time from start of the daemon process to its first API call, with empty and with filled discovery
+document cache. Every run is a separate Python process, so no module is imported in advance.
+
+    python -m benchmarks.cold_start --runs 5
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.fake_server import FakeYoutubeServer
+
+DEFAULT_RUNS = 3
+
+_CHILD_SCRIPT = '''
+import json, sys, time
+started = time.perf_counter()
+import ytarchiver.main
+from ytarchiver.api import YoutubeAPI
+imported = time.perf_counter()
+api = YoutubeAPI('fake', base_url=sys.argv[1], discovery_cache_dir=sys.argv[2])
+built = time.perf_counter()
+next(api.find_channels(['UC000000']))
+called = time.perf_counter()
+print(json.dumps({
+    'import_time': imported - started,
+    'build_time': built - imported,
+    'first_call_time': called - built,
+    'total_time': called - started
+}))
+'''
+
+
+def measure(runs: int) -> dict:
+    """
+    Starts daemon processes against the local fake server
+
+    :param runs: number of processes started for every cache state, the fastest one is reported
+    :return: times of imports, API client creation and the first API call, and total time from process start
+    """
+    server = FakeYoutubeServer(videos_per_channel=1)
+    server.start()
+    try:
+        return {
+            'benchmark': 'cold_start',
+            'runs': runs,
+            'cold_cache': _fastest([_run_with_cache(server.base_url, warm=False) for _ in range(runs)]),
+            'warm_cache': _fastest([_run_with_cache(server.base_url, warm=True) for _ in range(runs)])
+        }
+    finally:
+        server.stop()
+
+
+def _run_with_cache(base_url: str, warm: bool) -> dict:
+    cache_dir = tempfile.mkdtemp()
+    try:
+        if warm:
+            _run_process(base_url, cache_dir)
+        return _run_process(base_url, cache_dir)
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+def _run_process(base_url: str, cache_dir: str) -> dict:
+    started = time.perf_counter()
+    output = subprocess.check_output(
+        [sys.executable, '-c', _CHILD_SCRIPT, base_url, cache_dir],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    )
+    result = json.loads(output.decode('utf-8'))
+    result['process_time'] = time.perf_counter() - started
+    return result
+
+
+def _fastest(results: list) -> dict:
+    return min(results, key=lambda result: result['total_time'])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=DEFAULT_RUNS)
+    args = parser.parse_args()
+
+    print(json.dumps(measure(args.runs), indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+import argparse
+import logging
+
+from ytarchiver.common import Context, RecordersController, ContentItem, EventBus, PluginsManager
+from ytarchiver.sqlite import Sqlite3StorageManager
+
+
+class NoopRecordersController(RecordersController):
+    """
+    Recorders controller which only counts started recordings
+    """
+
+    def __init__(self):
+        self.started_recordings = 0
+
+    def update(self, context):
+        pass
+
+    def is_recording_active(self, recording_id: str) -> bool:
+        return False
+
+    def start_recording(self, context, item: ContentItem):
+        self.started_recordings += 1
+
+
+def create_context(api, output_dir: str, channels_list, **options) -> Context:
+    """
+    Creates execution context backed by sqlite storage in given directory and recorders which download nothing
+
+    :param api: API or its stand-in
+    :param output_dir: directory for the storage
+    :param channels_list: IDs of monitored channels
+    :param options: overrides of default configuration
+    :return: context
+    """
+    config = argparse.Namespace(
+        output_dir=output_dir,
+        channels_list=channels_list,
+        archive_all=False,
+        monitor_livestreams=False,
+        livestream_detection='search',
+        api_concurrency=1,
+        index_type='set',
+        index_capacity=1000000,
+        index_error_rate=0.001,
+        write_batch_size=1000,
+        write_batch_interval=5
+    )
+    for key, value in options.items():
+        setattr(config, key, value)
+
+    logger = logging.getLogger('ytarchiver.benchmarks')
+    logger.setLevel(logging.WARNING)
+
+    return Context(
+        config,
+        logger,
+        api=api,
+        video_recorders_controller=NoopRecordersController(),
+        livestream_recorders_controller=NoopRecordersController(),
+        storage_manager=Sqlite3StorageManager(),
+        bus=EventBus(),
+        plugins=PluginsManager()
+    )
@@ -0,0 +1,96 @@
+"""
+Runs lookup and video downloads of the real daemon components against the local fake server and reports
+their throughput.
+
+    python -m benchmarks.end_to_end --channels 20 --videos 5 --workers 4 --segments 4 --api-backend http
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.common import create_context
+from benchmarks.fake_server import FakeYoutubeServer
+from ytarchiver.api import YoutubeAPI, LightweightYoutubeAPI, API_BACKENDS, API_BACKEND_HTTP, \
+    API_BACKEND_GOOGLEAPICLIENT
+from ytarchiver.lookup import lookup
+from ytarchiver.recording import ThreadPoolVideoRecordersController
+
+
+def measure(channels: int,
+            videos: int,
+            video_size: int,
+            workers: int,
+            segments: int,
+            failure_rate: float,
+            api_backend: str=API_BACKEND_GOOGLEAPICLIENT) -> dict:
+    server = FakeYoutubeServer(videos_per_channel=videos, video_size=video_size, failure_rate=failure_rate, seed=0)
+    server.start()
+    output_dir = tempfile.mkdtemp()
+    try:
+        api_class = LightweightYoutubeAPI if api_backend == API_BACKEND_HTTP else YoutubeAPI
+        api = api_class('fake', base_url=server.base_url)
+        channels_list = ['UC{:06d}'.format(i) for i in range(channels)]
+        context = create_context(
+            api,
+            output_dir,
+            channels_list,
+            archive_all=True,
+            base_url=server.base_url,
+            download_segments=segments,
+            min_segment_size=1
+        )
+        recorders = ThreadPoolVideoRecordersController(workers)
+        context.video_recorders = recorders
+
+        started = time.perf_counter()
+        lookup(context, True)
+        lookup_time = time.perf_counter() - started
+        recorders._pending.join()
+        total_time = time.perf_counter() - started
+
+        context.storage.close()
+        downloaded_files = [name for name in os.listdir(output_dir) if name.endswith('.mp4')]
+        downloaded = sum(os.path.getsize(os.path.join(output_dir, name)) for name in downloaded_files)
+        return {
+            'api_backend': api_backend,
+            'channels': channels,
+            'videos': channels * videos,
+            'downloaded_videos': len(downloaded_files),
+            'lookup_time': lookup_time,
+            'total_time': total_time,
+            'download_throughput': downloaded / total_time,
+            'server_requests': dict(server.requests)
+        }
+    finally:
+        server.stop()
+        shutil.rmtree(output_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--channels', type=int, default=20)
+    parser.add_argument('--videos', type=int, default=5, help='videos per channel')
+    parser.add_argument('--video-size', type=int, default=16 * 1024 * 1024, help='size of every video (in bytes)')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--segments', type=int, default=1)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--api-backend', choices=API_BACKENDS, default=API_BACKEND_GOOGLEAPICLIENT)
+    args = parser.parse_args()
+
+    result = measure(
+        args.channels,
+        args.videos,
+        args.video_size,
+        args.workers,
+        args.segments,
+        args.failure_rate,
+        args.api_backend
+    )
+    print(json.dumps(result, indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
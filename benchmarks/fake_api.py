@@ -0,0 +1,95 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional
+
+from ytarchiver.api import YoutubeChannel, UploadsPage, CHANNELS_LIST_MAX_IDS, PLAYLIST_ITEMS_MAX_RESULTS, \
+    VIDEOS_LIST_MAX_IDS, CHANNELS_LIST_COST, PLAYLIST_ITEMS_LIST_COST, SEARCH_LIST_COST, VIDEOS_LIST_COST
+from ytarchiver.common import ContentItem
+from ytarchiver.quota import QuotaLedger
+
+FIRST_UPLOAD = datetime(2010, 1, 1)
+
+
+class FakeYoutubeAPI:
+    """
+    Stand-in for YoutubeAPI which generates channels and videos instead of calling YouTube. Every call sleeps
+    for the configured latency and is counted, so lookups might be measured offline.
+    """
+
+    def __init__(self, videos_per_channel: int, latency: float=0.0):
+        self.videos_per_channel = videos_per_channel
+        self.latency = latency
+        self.quota = QuotaLedger()
+        self.calls = {}
+        self._new_uploads = {}
+        self._lock = threading.Lock()
+
+    def publish(self, channel_id: str, count: int=1):
+        """
+        Simulates upload of new videos on the channel
+        """
+        with self._lock:
+            self._new_uploads[channel_id] = self._new_uploads.get(channel_id, 0) + count
+
+    def total_calls(self) -> int:
+        with self._lock:
+            return sum(self.calls.values())
+
+    def find_channels(self, channels_ids_list: List[str], concurrency: int=1) -> Iterator[YoutubeChannel]:
+        for i in range(0, len(channels_ids_list), CHANNELS_LIST_MAX_IDS):
+            self._call('channels.list', CHANNELS_LIST_COST)
+            for channel_id in channels_ids_list[i:i + CHANNELS_LIST_MAX_IDS]:
+                yield YoutubeChannel(channel_id, 'UU' + channel_id)
+
+    def fetch_channel_livestream(self, channel: YoutubeChannel) -> Optional[ContentItem]:
+        self._call('search.list', SEARCH_LIST_COST)
+        return None
+
+    def find_live_videos(self, videos_ids_list: List[str]) -> List[ContentItem]:
+        for _ in range(0, len(videos_ids_list), VIDEOS_LIST_MAX_IDS):
+            self._call('videos.list', VIDEOS_LIST_COST)
+        return []
+
+    def find_channel_uploaded_videos(self, channel: YoutubeChannel, find_all: bool=False) -> Iterator[ContentItem]:
+        next_page_token = ''
+        while next_page_token is not None:
+            page = self.fetch_channel_uploads_page(channel, page_token=next_page_token)
+            yield from page.items
+            next_page_token = page.next_page_token if find_all else None
+
+    def fetch_channel_uploads_page(self,
+                                   channel: YoutubeChannel,
+                                   page_token: str='',
+                                   max_results: int=PLAYLIST_ITEMS_MAX_RESULTS,
+                                   etag: str=None) -> UploadsPage:
+        self._call('playlistItems.list', PLAYLIST_ITEMS_LIST_COST)
+
+        with self._lock:
+            total_videos = self.videos_per_channel + self._new_uploads.get(channel.id, 0)
+        page_etag = '"{}:{}:{}:{}"'.format(channel.id, total_videos, page_token, max_results)
+        if etag == page_etag:
+            return UploadsPage([], None, etag=etag, not_modified=True)
+        offset = int(page_token or 0)
+        items = [
+            self._video(channel.id, total_videos - i - 1)
+            for i in range(offset, min(offset + max_results, total_videos))
+        ]
+        next_offset = offset + max_results
+        return UploadsPage(items, str(next_offset) if next_offset < total_videos else None, etag=page_etag)
+
+    def _video(self, channel_id: str, number: int) -> ContentItem:
+        return ContentItem(
+            video_id='{}-{}'.format(channel_id, number),
+            channel_id=channel_id,
+            timestamp=(FIRST_UPLOAD + timedelta(days=number)).strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+            title='video #{}'.format(number),
+            channel_name='channel ' + channel_id
+        )
+
+    def _call(self, method: str, cost: int):
+        self.quota.charge(method, cost)
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+        if self.latency > 0:
+            time.sleep(self.latency)
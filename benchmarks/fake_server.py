@@ -0,0 +1,529 @@
+"""
+Local stand-in for YouTube Data API, video hosting and livestreams. Daemon is pointed at it with --base-url option,
+so whole-daemon tests run without network access.
+
+    python -m benchmarks.fake_server --port 8080 --videos 120 --live-every 10 --failure-rate 0.01
+    ytarchiver -k fake -c UC0001 UC0002 -s --base-url http://localhost:8080
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qs
+
+DEFAULT_VIDEOS_PER_CHANNEL = 120
+DEFAULT_VIDEO_SIZE = 64 * 1024 * 1024
+DEFAULT_VIDEO_BITRATE = 0
+DEFAULT_LIVESTREAM_BITRATES = [800 * 1000, 2500 * 1000]
+DEFAULT_SEGMENT_DURATION_SEC = 2
+DEFAULT_LIVESTREAM_DURATION_SEC = 600
+PLAYLIST_WINDOW = 3
+MAX_RESULTS = 50
+TS_PACKET_SIZE = 188
+SEND_CHUNK_SIZE = 64 * 1024
+FIRST_UPLOAD = datetime(2010, 1, 1)
+RESOLUTIONS = ['144p', '240p', '360p', '480p', '720p', '1080p']
+
+
+class FakeYoutubeServer:
+    """
+    HTTP server generating channels, videos and livestreams on demand. Every channel ID is valid. Content is
+    deterministic, so repeated requests return the same bytes, which allows resumed and segmented downloads.
+    """
+
+    def __init__(self,
+                 host: str='127.0.0.1',
+                 port: int=0,
+                 videos_per_channel: int=DEFAULT_VIDEOS_PER_CHANNEL,
+                 upload_interval: float=0,
+                 live_every: int=0,
+                 video_size: int=DEFAULT_VIDEO_SIZE,
+                 video_bitrate: int=DEFAULT_VIDEO_BITRATE,
+                 livestream_bitrates: list=None,
+                 segment_duration: float=DEFAULT_SEGMENT_DURATION_SEC,
+                 livestream_duration: float=DEFAULT_LIVESTREAM_DURATION_SEC,
+                 failure_rate: float=0.0,
+                 latency: float=0.0,
+                 seed: int=None):
+        self.videos_per_channel = videos_per_channel
+        self.upload_interval = upload_interval
+        self.live_every = live_every
+        self.video_size = video_size
+        self.video_bitrate = video_bitrate
+        self.livestream_bitrates = livestream_bitrates or DEFAULT_LIVESTREAM_BITRATES
+        self.segment_duration = segment_duration
+        self.livestream_duration = livestream_duration
+        self.failure_rate = failure_rate
+        self.latency = latency
+        self.started_at = time.time()
+        self.requests = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+        handler = type('FakeYoutubeHandler', (_FakeYoutubeHandler,), {'server_state': self})
+        self._server = _ThreadingHTTPServer((host, port), handler)
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def start(self):
+        """
+        Starts serving in a background thread
+        """
+        self._thread = threading.Thread(name='fake-youtube-server', target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def count_request(self, kind: str):
+        with self._lock:
+            self.requests[kind] = self.requests.get(kind, 0) + 1
+
+    def should_fail(self) -> bool:
+        if self.failure_rate <= 0:
+            return False
+        with self._lock:
+            return self._random.random() < self.failure_rate
+
+    def random_cut(self, length: int) -> int:
+        with self._lock:
+            return self._random.randint(0, max(length - 1, 0))
+
+    def uploads_count(self) -> int:
+        if self.upload_interval <= 0:
+            return self.videos_per_channel
+        return self.videos_per_channel + int((time.time() - self.started_at) / self.upload_interval)
+
+    def is_live(self, channel_id: str) -> bool:
+        return self.live_every > 0 and _stable_hash(channel_id) % self.live_every == 0 and \
+            time.time() - self.started_at < self.livestream_duration
+
+    def livestream_sequence(self) -> int:
+        return int((time.time() - self.started_at) / self.segment_duration)
+
+    def livestream_finished(self) -> bool:
+        return time.time() - self.started_at >= self.livestream_duration
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super(_ThreadingHTTPServer, self).handle_error(request, client_address)
+
+
+class _FakeYoutubeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    server_state = None
+
+    ROUTES = [
+        (re.compile(r'^/discovery/v1/apis/youtube/v3/rest$'), '_discovery'),
+        (re.compile(r'^/youtube/v3/channels$'), '_channels_list'),
+        (re.compile(r'^/youtube/v3/playlistItems$'), '_playlist_items_list'),
+        (re.compile(r'^/youtube/v3/search$'), '_search_list'),
+        (re.compile(r'^/youtube/v3/videos$'), '_videos_list'),
+        (re.compile(r'^/media/(?P<video_id>[^/]+)\.mp4$'), '_media'),
+        (re.compile(r'^/live/(?P<video_id>[^/]+)/master\.m3u8$'), '_master_playlist'),
+        (re.compile(r'^/live/(?P<video_id>[^/]+)/(?P<bitrate>\d+)\.m3u8$'), '_media_playlist'),
+        (re.compile(r'^/live/(?P<video_id>[^/]+)/(?P<bitrate>\d+)/(?P<sequence>\d+)\.ts$'), '_segment')
+    ]
+
+    def do_GET(self):
+        self._dispatch(send_body=True)
+
+    def do_HEAD(self):
+        self._dispatch(send_body=False)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _dispatch(self, send_body: bool):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        for pattern, handler_name in self.ROUTES:
+            match = pattern.match(url.path)
+            if match is not None:
+                self.server_state.count_request(handler_name.lstrip('_'))
+                getattr(self, handler_name)(query, send_body, **match.groupdict())
+                return
+        self._send_error(404, 'notFound')
+
+    # API
+
+    def _discovery(self, query: dict, send_body: bool):
+        self._send_json(_discovery_document(self._base_url()), send_body, etag=False)
+
+    def _channels_list(self, query: dict, send_body: bool):
+        if self._api_call_failed():
+            return
+        items = [
+            {
+                'kind': 'youtube#channel',
+                'id': channel_id,
+                'contentDetails': {'relatedPlaylists': {'uploads': _uploads_playlist_id(channel_id)}}
+            }
+            for channel_id in query.get('id', '').split(',') if channel_id
+        ]
+        self._send_api_response('youtube#channelListResponse', items, None, send_body)
+
+    def _playlist_items_list(self, query: dict, send_body: bool):
+        if self._api_call_failed():
+            return
+        channel_id = _channel_of_playlist(query.get('playlistId', ''))
+        uploads = self._uploads(channel_id)
+        offset = int(query.get('pageToken') or 0)
+        max_results = min(int(query.get('maxResults', 5)), MAX_RESULTS)
+        items = [
+            {
+                'kind': 'youtube#playlistItem',
+                'id': 'item-' + video['id'],
+                'snippet': dict(video['snippet'], resourceId={'kind': 'youtube#video', 'videoId': video['id']})
+            }
+            for video in uploads[offset:offset + max_results]
+        ]
+        next_offset = offset + max_results
+        next_page_token = str(next_offset) if next_offset < len(uploads) else None
+        self._send_api_response('youtube#playlistItemListResponse', items, next_page_token, send_body)
+
+    def _search_list(self, query: dict, send_body: bool):
+        if self._api_call_failed():
+            return
+        channel_id = query.get('channelId', '')
+        items = []
+        if self.server_state.is_live(channel_id):
+            livestream = _livestream(channel_id)
+            items.append({
+                'kind': 'youtube#searchResult',
+                'id': {'kind': 'youtube#video', 'videoId': livestream['id']},
+                'snippet': livestream['snippet']
+            })
+        self._send_api_response('youtube#searchListResponse', items, None, send_body)
+
+    def _videos_list(self, query: dict, send_body: bool):
+        if self._api_call_failed():
+            return
+        items = []
+        for video_id in query.get('id', '').split(','):
+            video = _video_by_id(video_id)
+            if video is None:
+                continue
+            if video_id.startswith('live-'):
+                live = self.server_state.is_live(video['snippet']['channelId'])
+                video['snippet']['liveBroadcastContent'] = 'live' if live else 'none'
+            items.append({'kind': 'youtube#video', 'id': video_id, 'snippet': video['snippet']})
+        self._send_api_response('youtube#videoListResponse', items, None, send_body)
+
+    def _uploads(self, channel_id: str) -> list:
+        count = self.server_state.uploads_count()
+        uploads = [_video(channel_id, count - i - 1) for i in range(count)]
+        if self.server_state.is_live(channel_id):
+            uploads.insert(0, _livestream(channel_id))
+        return uploads
+
+    def _api_call_failed(self) -> bool:
+        if self.server_state.latency > 0:
+            time.sleep(self.server_state.latency)
+        if self.server_state.should_fail():
+            self._send_error(503, 'backendError')
+            return True
+        return False
+
+    def _send_api_response(self, kind: str, items: list, next_page_token, send_body: bool):
+        document = {
+            'kind': kind,
+            'pageInfo': {'totalResults': len(items), 'resultsPerPage': len(items)},
+            'items': items
+        }
+        if next_page_token is not None:
+            document['nextPageToken'] = next_page_token
+        self._send_json(document, send_body)
+
+    def _send_json(self, document: dict, send_body: bool, etag: bool=True):
+        body = json.dumps(document, sort_keys=True).encode('utf-8')
+        headers = {'Content-Type': 'application/json; charset=UTF-8'}
+        if etag:
+            tag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+            if self.headers.get('If-None-Match') == tag:
+                self._send_headers(304, {'ETag': tag}, 0)
+                return
+            document['etag'] = tag
+            body = json.dumps(document, sort_keys=True).encode('utf-8')
+            headers['ETag'] = tag
+
+        self._send_headers(200, headers, len(body))
+        if send_body:
+            self.wfile.write(body)
+
+    def _send_error(self, status: int, reason: str):
+        body = json.dumps({'error': {'code': status, 'message': reason, 'errors': [{'reason': reason}]}})
+        body = body.encode('utf-8')
+        self._send_headers(status, {'Content-Type': 'application/json; charset=UTF-8'}, len(body))
+        self.wfile.write(body)
+
+    # media
+
+    def _media(self, query: dict, send_body: bool, video_id: str):
+        size = self.server_state.video_size
+        start, end = 0, size - 1
+        status = 200
+        headers = {'Content-Type': 'video/mp4', 'Accept-Ranges': 'bytes'}
+
+        range_header = self.headers.get('Range')
+        if range_header is not None:
+            match = re.match(r'bytes=(\d+)-(\d*)$', range_header)
+            if match is None or int(match.group(1)) >= size:
+                self._send_headers(416, {'Content-Range': 'bytes */{}'.format(size)}, 0)
+                return
+            start = int(match.group(1))
+            end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            status = 206
+            headers['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, size)
+
+        self._send_headers(status, headers, end - start + 1)
+        if send_body:
+            self._send_content(video_id, start, end + 1, self.server_state.video_bitrate)
+
+    def _master_playlist(self, query: dict, send_body: bool, video_id: str):
+        lines = ['#EXTM3U']
+        for i, bitrate in enumerate(sorted(self.server_state.livestream_bitrates)):
+            resolution = RESOLUTIONS[min(i + 2, len(RESOLUTIONS) - 1)]
+            height = int(resolution[:-1])
+            lines.append('#EXT-X-STREAM-INF:BANDWIDTH={},RESOLUTION={}x{}'.format(bitrate, height * 16 // 9, height))
+            lines.append('{}.m3u8'.format(bitrate))
+        self._send_playlist(lines, send_body)
+
+    def _media_playlist(self, query: dict, send_body: bool, video_id: str, bitrate: str):
+        if self.server_state.should_fail():
+            self._send_error(503, 'backendError')
+            return
+
+        sequence = self.server_state.livestream_sequence()
+        first = max(sequence - PLAYLIST_WINDOW + 1, 0)
+        lines = [
+            '#EXTM3U',
+            '#EXT-X-VERSION:3',
+            '#EXT-X-TARGETDURATION:{}'.format(int(self.server_state.segment_duration + 0.999)),
+            '#EXT-X-MEDIA-SEQUENCE:{}'.format(first)
+        ]
+        for number in range(first, sequence + 1):
+            lines.append('#EXTINF:{:.3f},'.format(self.server_state.segment_duration))
+            lines.append('{}/{}.ts'.format(bitrate, number))
+        if self.server_state.livestream_finished():
+            lines.append('#EXT-X-ENDLIST')
+        self._send_playlist(lines, send_body)
+
+    def _segment(self, query: dict, send_body: bool, video_id: str, bitrate: str, sequence: str):
+        size = int(int(bitrate) * self.server_state.segment_duration / 8)
+        size -= size % TS_PACKET_SIZE
+        self._send_headers(200, {'Content-Type': 'video/mp2t'}, size)
+        if send_body:
+            self._send_content(video_id + sequence, 0, size, 0, ts_packets=True)
+
+    def _send_playlist(self, lines: list, send_body: bool):
+        body = ('\n'.join(lines) + '\n').encode('utf-8')
+        self._send_headers(200, {'Content-Type': 'application/vnd.apple.mpegurl'}, len(body))
+        if send_body:
+            self.wfile.write(body)
+
+    def _send_content(self, seed: str, start: int, end: int, bitrate: int, ts_packets: bool=False):
+        stop = end
+        if self.server_state.should_fail():
+            stop = start + self.server_state.random_cut(end - start)
+
+        pattern = _ts_pattern(seed) if ts_packets else _content_pattern(seed)
+        position = start
+        try:
+            while position < stop:
+                chunk_end = min(position + SEND_CHUNK_SIZE, stop)
+                self.wfile.write(_slice_pattern(pattern, position, chunk_end))
+                if bitrate > 0:
+                    time.sleep((chunk_end - position) * 8 / bitrate)
+                position = chunk_end
+        except (ConnectionError, BrokenPipeError):
+            pass
+        if position < end:
+            self.close_connection = True
+
+    def _send_headers(self, status: int, headers: dict, length: int):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(length))
+        self.end_headers()
+
+    def _base_url(self) -> str:
+        return 'http://{}'.format(self.headers.get('Host'))
+
+
+def _discovery_document(base_url: str) -> dict:
+    def method(resource: str, parameters: list) -> dict:
+        return {
+            'id': 'youtube.{}.list'.format(resource),
+            'path': resource,
+            'httpMethod': 'GET',
+            'parameters': dict(
+                {'part': {'type': 'string', 'required': True, 'location': 'query'}},
+                **{name: {'type': kind, 'location': 'query'} for name, kind in parameters}
+            ),
+            'parameterOrder': ['part'],
+            'response': {'$ref': 'ListResponse'}
+        }
+
+    return {
+        'kind': 'discovery#restDescription',
+        'discoveryVersion': 'v1',
+        'id': 'youtube:v3',
+        'name': 'youtube',
+        'version': 'v3',
+        'rootUrl': base_url + '/',
+        'servicePath': 'youtube/v3/',
+        'baseUrl': base_url + '/youtube/v3/',
+        'batchPath': 'batch/youtube/v3',
+        'protocol': 'rest',
+        'parameters': {
+            'key': {'type': 'string', 'location': 'query'},
+            'fields': {'type': 'string', 'location': 'query'},
+            'alt': {'type': 'string', 'location': 'query', 'default': 'json'}
+        },
+        'schemas': {'ListResponse': {'id': 'ListResponse', 'type': 'object'}},
+        'resources': {
+            'channels': {'methods': {'list': method('channels', [('id', 'string'), ('maxResults', 'integer')])}},
+            'playlistItems': {'methods': {'list': method('playlistItems', [
+                ('playlistId', 'string'), ('maxResults', 'integer'), ('pageToken', 'string')
+            ])}},
+            'search': {'methods': {'list': method('search', [
+                ('channelId', 'string'), ('type', 'string'), ('eventType', 'string'), ('maxResults', 'integer')
+            ])}},
+            'videos': {'methods': {'list': method('videos', [('id', 'string'), ('maxResults', 'integer')])}}
+        }
+    }
+
+
+def _uploads_playlist_id(channel_id: str) -> str:
+    return 'UU' + channel_id
+
+
+def _channel_of_playlist(playlist_id: str) -> str:
+    return playlist_id[2:] if playlist_id.startswith('UU') else playlist_id
+
+
+def _video(channel_id: str, number: int) -> dict:
+    return {
+        'id': 'v{}-{}'.format(channel_id, number),
+        'snippet': {
+            'publishedAt': (FIRST_UPLOAD + timedelta(hours=number)).strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+            'channelId': channel_id,
+            'channelTitle': 'channel ' + channel_id,
+            'title': 'video #{} of {}'.format(number, channel_id),
+            'liveBroadcastContent': 'none'
+        }
+    }
+
+
+def _livestream(channel_id: str) -> dict:
+    return {
+        'id': 'live-' + channel_id,
+        'snippet': {
+            'publishedAt': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+            'channelId': channel_id,
+            'channelTitle': 'channel ' + channel_id,
+            'title': 'livestream of {}'.format(channel_id),
+            'liveBroadcastContent': 'live'
+        }
+    }
+
+
+def _video_by_id(video_id: str):
+    if video_id.startswith('live-'):
+        return _livestream(video_id[len('live-'):])
+    match = re.match(r'^v(?P<channel_id>.+)-(?P<number>\d+)$', video_id)
+    if match is None:
+        return None
+    return _video(match.group('channel_id'), int(match.group('number')))
+
+
+def _stable_hash(s: str) -> int:
+    return int(hashlib.sha1(s.encode('utf-8')).hexdigest()[:8], 16)
+
+
+def _content_pattern(seed: str) -> bytes:
+    return hashlib.sha256(seed.encode('utf-8')).digest() * (SEND_CHUNK_SIZE // 32)
+
+
+def _ts_pattern(seed: str) -> bytes:
+    packet = b'\x47\x1f\xff\x10' + hashlib.sha256(seed.encode('utf-8')).digest() * 6
+    packet = packet[:TS_PACKET_SIZE]
+    return packet * (SEND_CHUNK_SIZE // TS_PACKET_SIZE + 1)
+
+
+def _slice_pattern(pattern: bytes, start: int, end: int) -> bytes:
+    offset = start % len(pattern)
+    data = pattern[offset:offset + end - start]
+    while len(data) < end - start:
+        data += pattern[:end - start - len(data)]
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--videos', type=int, default=DEFAULT_VIDEOS_PER_CHANNEL, help='videos per channel')
+    parser.add_argument('--upload-interval', type=float, default=0,
+                        help='every channel uploads a new video every given number of seconds, 0 disables uploads')
+    parser.add_argument('--live-every', type=int, default=0, help='roughly every N-th channel is live, 0 disables')
+    parser.add_argument('--video-size', type=int, default=DEFAULT_VIDEO_SIZE, help='size of every video (in bytes)')
+    parser.add_argument('--video-bitrate', type=int, default=DEFAULT_VIDEO_BITRATE,
+                        help='bitrate of every video download connection (in bits per second), 0 means no limit')
+    parser.add_argument('--livestream-bitrates', type=int, nargs='+', default=DEFAULT_LIVESTREAM_BITRATES,
+                        help='bitrates of livestream variants (in bits per second)')
+    parser.add_argument('--segment-duration', type=float, default=DEFAULT_SEGMENT_DURATION_SEC)
+    parser.add_argument('--livestream-duration', type=float, default=DEFAULT_LIVESTREAM_DURATION_SEC)
+    parser.add_argument('--failure-rate', type=float, default=0.0,
+                        help='probability of a failed API call or a dropped media connection')
+    parser.add_argument('--latency', type=float, default=0.0, help='latency of every API call (in seconds)')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    server = FakeYoutubeServer(
+        host=args.host,
+        port=args.port,
+        videos_per_channel=args.videos,
+        upload_interval=args.upload_interval,
+        live_every=args.live_every,
+        video_size=args.video_size,
+        video_bitrate=args.video_bitrate,
+        livestream_bitrates=args.livestream_bitrates,
+        segment_duration=args.segment_duration,
+        livestream_duration=args.livestream_duration,
+        failure_rate=args.failure_rate,
+        latency=args.latency,
+        seed=args.seed
+    )
+    print('serving fake YouTube on {}'.format(server.base_url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Compares serial and concurrent lookup against a fake API with injected latency.
+
+    python -m benchmarks.lookup_engines --channels 200 --latency 0.05 --concurrency 16
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+from benchmarks.common import create_context
+from benchmarks.fake_api import FakeYoutubeAPI
+from ytarchiver.lookup import lookup, lookup_concurrently
+
+
+def measure(lookup_function, channels: int, videos: int, latency: float, concurrency: int) -> dict:
+    output_dir = tempfile.mkdtemp()
+    try:
+        api = FakeYoutubeAPI(videos_per_channel=videos, latency=latency)
+        channels_list = ['channel{}'.format(i) for i in range(channels)]
+        context = create_context(api, output_dir, channels_list, api_concurrency=concurrency)
+
+        started = time.perf_counter()
+        lookup_function(context, True)
+        first_run = time.perf_counter() - started
+
+        for channel_id in channels_list:
+            api.publish(channel_id)
+
+        started = time.perf_counter()
+        lookup_function(context, False)
+        steady_state = time.perf_counter() - started
+
+        context.storage.close()
+        return {'first_run': first_run, 'steady_state': steady_state, 'api_calls': api.total_calls()}
+    finally:
+        shutil.rmtree(output_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--channels', type=int, default=100)
+    parser.add_argument('--videos', type=int, default=120)
+    parser.add_argument('--latency', type=float, default=0.05, help='latency of every API call (in seconds)')
+    parser.add_argument('--concurrency', type=int, default=16)
+    args = parser.parse_args()
+
+    for name, lookup_function in [('serial', lookup), ('concurrent', lookup_concurrently)]:
+        result = measure(lookup_function, args.channels, args.videos, args.latency, args.concurrency)
+        print('{:>8}: first run {:.2f}s, steady state {:.2f}s, {} API calls'.format(
+            name,
+            result['first_run'],
+            result['steady_state'],
+            result['api_calls']
+        ))
+
+
+if __name__ == '__main__':
+    main()
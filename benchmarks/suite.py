@@ -0,0 +1,281 @@
+"""
+Runs lookup, storage, recorders and cold start benchmarks offline and prints results as JSON.
+
+    python -m benchmarks.suite --channels 10 1000 10000 --output results.json
+    python -m benchmarks.suite --baseline results.json
+"""
+import argparse
+import json
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from unittest.mock import patch
+
+from benchmarks import cold_start
+from benchmarks.common import create_context
+from benchmarks.fake_api import FakeYoutubeAPI
+from ytarchiver.api import PLAYLIST_ITEMS_MAX_RESULTS
+from ytarchiver.cache import ResponseCache
+from ytarchiver.common import ContentItem, Context
+from ytarchiver.lookup import lookup
+from ytarchiver.recording import ThreadPoolVideoRecordersController
+from ytarchiver.sqlite import Sqlite3Storage
+
+DEFAULT_CHANNELS = [10, 1000, 10000]
+DEFAULT_VIDEOS_PER_CHANNEL = 50
+DEFAULT_STORAGE_ROWS = 100000
+DEFAULT_RECORDINGS = 1000
+DEFAULT_REGRESSION_THRESHOLD = 0.2
+EXISTENCE_CHECK_BATCH = 50
+
+
+def benchmark_lookup(channels: int, videos: int, latency: float, trace_memory: bool) -> dict:
+    """
+    Runs the first lookup, a steady state lookup, after every channel uploaded one video, and a lookup after
+    none of the channels uploaded anything, answered from the response cache
+
+    :return: cycle time, API calls and started recordings of all runs, and peak memory of the first two if traced
+    """
+    output_dir = tempfile.mkdtemp()
+    try:
+        api = FakeYoutubeAPI(videos_per_channel=videos, latency=latency)
+        channels_list = ['channel{}'.format(i) for i in range(channels)]
+        context = create_context(api, output_dir, channels_list)
+        context.response_cache = ResponseCache(capacity=channels)
+
+        first_run = _measure_lookup(context, api, True, trace_memory)
+        for channel_id in channels_list:
+            api.publish(channel_id)
+        steady_state = _measure_lookup(context, api, False, trace_memory)
+        unchanged = _measure_lookup(context, api, False, False)
+
+        context.storage.close()
+        return {
+            'benchmark': 'lookup',
+            'channels': channels,
+            'videos_per_channel': videos,
+            'latency': latency,
+            'first_run': first_run,
+            'steady_state': steady_state,
+            'unchanged': unchanged
+        }
+    finally:
+        shutil.rmtree(output_dir)
+
+
+def benchmark_storage(rows: int) -> dict:
+    """
+    Measures rate of inserts and existence checks of videos in sqlite storage. Inserts are committed after every
+    page of videos, like during the first lookup.
+
+    :return: inserted and checked videos per second
+    """
+    output_dir = tempfile.mkdtemp()
+    try:
+        storage = Sqlite3Storage(output_dir)
+        videos = [_video(i) for i in range(rows)]
+
+        started = time.perf_counter()
+        for i, video in enumerate(videos):
+            storage.add_video(video)
+            if (i + 1) % PLAYLIST_ITEMS_MAX_RESULTS == 0:
+                storage.commit()
+        storage.sync()
+        insert_time = time.perf_counter() - started
+
+        video_ids = [video.video_id for video in videos] + ['missing{}'.format(i) for i in range(rows)]
+        started = time.perf_counter()
+        for i in range(0, len(video_ids), EXISTENCE_CHECK_BATCH):
+            storage.find_existing_videos(video_ids[i:i + EXISTENCE_CHECK_BATCH])
+        lookup_time = time.perf_counter() - started
+
+        storage.close()
+        return {
+            'benchmark': 'storage',
+            'rows': rows,
+            'inserts_per_sec': rows / insert_time,
+            'lookups_per_sec': len(video_ids) / lookup_time
+        }
+    finally:
+        shutil.rmtree(output_dir)
+
+
+def benchmark_recorders(recordings: int, workers: int) -> dict:
+    """
+    Measures overhead of queueing and completing downloads in the pooled recorders controller.
+    Downloads themselves do nothing.
+
+    :return: completed recordings per second
+    """
+    controller = ThreadPoolVideoRecordersController(workers)
+    context = create_context(FakeYoutubeAPI(videos_per_channel=0), tempfile.gettempdir(), [])
+    videos = [_video(i) for i in range(recordings)]
+
+    with patch('ytarchiver.recording.download_video'):
+        started = time.perf_counter()
+        for video in videos:
+            controller.start_recording(context, video)
+        controller._pending.join()
+        elapsed = time.perf_counter() - started
+
+    return {
+        'benchmark': 'recorders',
+        'recordings': recordings,
+        'workers': workers,
+        'recordings_per_sec': recordings / elapsed
+    }
+
+
+def find_regressions(results: list, baseline: dict, threshold: float) -> list:
+    """
+    Compares results with results of previous run
+
+    :param results: current results
+    :param baseline: document written by previous run
+    :param threshold: relative change treated as a regression
+    :return: descriptions of regressions
+    """
+    regressions = []
+    baseline_results = {_result_key(result): result for result in baseline.get('results', [])}
+    for result in results:
+        previous = baseline_results.get(_result_key(result))
+        if previous is None:
+            continue
+        for metric, value, previous_value, lower_is_better in _comparable_metrics(result, previous):
+            change = (value - previous_value) / previous_value if previous_value else 0.0
+            if (change if lower_is_better else -change) > threshold:
+                regressions.append('{} {}: {:.4g} -> {:.4g} ({:+.0%})'.format(
+                    _result_key(result),
+                    metric,
+                    previous_value,
+                    value,
+                    change
+                ))
+    return regressions
+
+
+def _measure_lookup(context: Context, api: FakeYoutubeAPI, is_first_run: bool, trace_memory: bool) -> dict:
+    calls_before = dict(api.calls)
+    recordings_before = context.video_recorders.started_recordings
+
+    started = time.perf_counter()
+    lookup(context, is_first_run)
+    cycle_time = time.perf_counter() - started
+
+    result = {
+        'cycle_time': cycle_time,
+        'api_calls': {method: count - calls_before.get(method, 0) for method, count in api.calls.items()},
+        'started_recordings': context.video_recorders.started_recordings - recordings_before
+    }
+    if trace_memory:
+        result['peak_memory'] = _peak_memory_of_lookup(context, api, is_first_run)
+    return result
+
+
+def _peak_memory_of_lookup(context: Context, api: FakeYoutubeAPI, is_first_run: bool) -> int:
+    # memory is measured on a separate run, as tracing slows lookup down
+    output_dir = tempfile.mkdtemp()
+    try:
+        traced_api = FakeYoutubeAPI(videos_per_channel=api.videos_per_channel)
+        traced_context = create_context(traced_api, output_dir, context.config.channels_list)
+        traced_context.response_cache = ResponseCache(capacity=len(context.config.channels_list))
+        if not is_first_run:
+            lookup(traced_context, True)
+            for channel_id in context.config.channels_list:
+                traced_api.publish(channel_id)
+
+        tracemalloc.start()
+        try:
+            lookup(traced_context, is_first_run)
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+            traced_context.storage.close()
+    finally:
+        shutil.rmtree(output_dir)
+
+
+def _comparable_metrics(result: dict, previous: dict):
+    if result['benchmark'] == 'lookup':
+        for run in ('first_run', 'steady_state', 'unchanged'):
+            if run not in result or run not in previous:
+                continue
+            yield run + '.cycle_time', result[run]['cycle_time'], previous[run]['cycle_time'], True
+            if 'peak_memory' in result[run] and 'peak_memory' in previous[run]:
+                yield run + '.peak_memory', result[run]['peak_memory'], previous[run]['peak_memory'], True
+    if result['benchmark'] == 'cold_start':
+        for cache in ('cold_cache', 'warm_cache'):
+            yield cache + '.total_time', result[cache]['total_time'], previous[cache]['total_time'], True
+    for metric in ('inserts_per_sec', 'lookups_per_sec', 'recordings_per_sec'):
+        if metric in result and metric in previous:
+            yield metric, result[metric], previous[metric], False
+
+
+def _result_key(result: dict) -> str:
+    if result['benchmark'] == 'lookup':
+        return 'lookup[channels={}]'.format(result['channels'])
+    return result['benchmark']
+
+
+def _video(number: int) -> ContentItem:
+    return ContentItem(
+        video_id='video{}'.format(number),
+        channel_id='channel{}'.format(number % 100),
+        timestamp='2018-06-01T12:00:00.000Z',
+        title='video #{}'.format(number),
+        channel_name='some channel',
+        filename='video{}.mp4'.format(number)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--channels', type=int, nargs='+', default=DEFAULT_CHANNELS)
+    parser.add_argument('--videos', type=int, default=DEFAULT_VIDEOS_PER_CHANNEL, help='videos per channel')
+    parser.add_argument('--latency', type=float, default=0.0, help='latency of every API call (in seconds)')
+    parser.add_argument('--storage-rows', type=int, default=DEFAULT_STORAGE_ROWS)
+    parser.add_argument('--recordings', type=int, default=DEFAULT_RECORDINGS)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--cold-start-runs', type=int, default=cold_start.DEFAULT_RUNS,
+                        help='started processes per cache state in cold start benchmark')
+    parser.add_argument('--no-memory', dest='trace_memory', action='store_false', help='skip peak memory runs')
+    parser.add_argument('--output', help='file to write results to, standard output by default')
+    parser.add_argument('--baseline', help='results of previous run to compare with')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_REGRESSION_THRESHOLD,
+                        help='relative change reported as a regression, default: ' +
+                             str(DEFAULT_REGRESSION_THRESHOLD))
+    args = parser.parse_args()
+
+    results = [benchmark_lookup(channels, args.videos, args.latency, args.trace_memory) for channels in args.channels]
+    results.append(benchmark_storage(args.storage_rows))
+    results.append(benchmark_recorders(args.recordings, args.workers))
+    results.append(cold_start.measure(args.cold_start_runs))
+
+    document = {
+        'created_at': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results
+    }
+    output = json.dumps(document, indent=2, sort_keys=True)
+    if args.output is None:
+        print(output)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as f:
+            regressions = find_regressions(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print('regression: ' + regression, file=sys.stderr)
+        if len(regressions) > 0:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -29,7 +29,7 @@ setup(
     author='Michal Korman',
     author_email='michal.korman@icloud.com',
     url='https://github.com/mkorman9/yt-archiver',
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks', 'benchmarks.*']),
     classifiers=[
         'License :: OSI Approved :: MIT License',
         'Operating System :: MacOS',
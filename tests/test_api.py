@@ -0,0 +1,165 @@
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mock import MagicMock
+
+from benchmarks.fake_server import FakeYoutubeServer
+from ytarchiver.api import YoutubeAPI, LightweightYoutubeAPI, APIError
+
+
+class YoutubeAPITest(TestCase):
+    def test_should_request_channels_in_batches_of_50(self):
+        # given
+        channels_ids = ['channel{}'.format(i) for i in range(120)]
+        api = _create_api()
+        api._service.channels.return_value.list.side_effect = _channels_list_response
+
+        for concurrency in [1, 4]:
+            api._service.channels.return_value.list.reset_mock()
+
+            # when
+            channels = list(api.find_channels(channels_ids, concurrency=concurrency))
+
+            # then
+            self.assertEqual([channel.id for channel in channels], channels_ids)
+            self.assertEqual(
+                [channel.uploads_playlist_id for channel in channels],
+                ['uploads_' + channel_id for channel_id in channels_ids]
+            )
+            requested_batches = [
+                c[1]['id'].split(',') for c in api._service.channels.return_value.list.call_args_list
+            ]
+            self.assertEqual([len(batch) for batch in requested_batches], [50, 50, 20])
+
+    def test_should_talk_to_server_given_by_base_url(self):
+        # given
+        server = FakeYoutubeServer(videos_per_channel=7, live_every=1)
+        server.start()
+
+        try:
+            # when
+            api = YoutubeAPI('key', base_url=server.base_url)
+            channel = next(api.find_channels(['UC1']))
+            first_page = api.fetch_channel_uploads_page(channel, max_results=5)
+            second_page = api.fetch_channel_uploads_page(channel, page_token=first_page.next_page_token)
+            livestream = api.fetch_channel_livestream(channel)
+        finally:
+            server.stop()
+
+        # then
+        self.assertEqual(len(first_page.items) + len(second_page.items), 8)
+        self.assertIsNone(second_page.next_page_token)
+        self.assertEqual(first_page.items[0].video_id, livestream.video_id)
+
+    def test_should_reuse_cached_discovery_document(self):
+        # given
+        cache_dir = tempfile.mkdtemp()
+        server = FakeYoutubeServer(videos_per_channel=1)
+        server.start()
+
+        try:
+            YoutubeAPI('key', base_url=server.base_url, discovery_cache_dir=cache_dir)
+            server.stop()
+
+            # when
+            api = YoutubeAPI('key', base_url=server.base_url, discovery_cache_dir=cache_dir)
+        finally:
+            shutil.rmtree(cache_dir)
+
+        # then
+        self.assertEqual(server.requests.get('discovery'), 1)
+        self.assertTrue(hasattr(api._service, 'channels'))
+
+    def test_lightweight_backend_should_return_the_same_results(self):
+        # given
+        server = FakeYoutubeServer(videos_per_channel=7, live_every=1)
+        server.start()
+
+        try:
+            # when
+            results = []
+            for api_class in [YoutubeAPI, LightweightYoutubeAPI]:
+                api = api_class('key', base_url=server.base_url)
+                channel = next(api.find_channels(['UC1']))
+                first_page = api.fetch_channel_uploads_page(channel, max_results=5)
+                second_page = api.fetch_channel_uploads_page(channel, page_token=first_page.next_page_token)
+                livestream = api.fetch_channel_livestream(channel)
+                live_videos = api.find_live_videos([first_page.items[0].video_id, first_page.items[1].video_id])
+                results.append([
+                    channel.uploads_playlist_id,
+                    [_describe(item) for item in first_page.items + second_page.items],
+                    second_page.next_page_token,
+                    _describe(livestream),
+                    [_describe(item) for item in live_videos]
+                ])
+        finally:
+            server.stop()
+
+        # then
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(len(results[1][1]), 8)
+        self.assertEqual(len(results[1][4]), 1)
+
+    def test_should_return_not_modified_page_for_current_etag(self):
+        # given
+        server = FakeYoutubeServer(videos_per_channel=7)
+        server.start()
+
+        try:
+            for api_class in [YoutubeAPI, LightweightYoutubeAPI]:
+                api = api_class('key', base_url=server.base_url)
+                channel = next(api.find_channels(['UC1']))
+                page = api.fetch_channel_uploads_page(channel, max_results=5)
+
+                # when
+                unchanged_page = api.fetch_channel_uploads_page(channel, max_results=5, etag=page.etag)
+                other_page = api.fetch_channel_uploads_page(channel, max_results=3, etag=page.etag)
+
+                # then
+                self.assertIsNotNone(page.etag)
+                self.assertTrue(unchanged_page.not_modified)
+                self.assertEqual(unchanged_page.items, [])
+                self.assertFalse(other_page.not_modified)
+                self.assertEqual(len(other_page.items), 3)
+        finally:
+            server.stop()
+
+    def test_lightweight_backend_should_raise_api_error_on_failed_request(self):
+        # given
+        server = FakeYoutubeServer(failure_rate=1.0)
+        server.start()
+
+        try:
+            api = LightweightYoutubeAPI('key', base_url=server.base_url)
+
+            # when
+            with self.assertRaises(APIError):
+                list(api.find_channels(['UC1']))
+        finally:
+            server.stop()
+
+        # then
+        self.assertEqual(api.quota.charged_total, 1)
+
+
+def _describe(item):
+    # timestamps of livestreams in fake server follow the clock
+    return item.video_id, item.channel_id, item.title, item.channel_name
+
+
+def _create_api():
+    api = YoutubeAPI(None)
+    api._service = MagicMock()
+    return api
+
+
+def _channels_list_response(part, id, maxResults):
+    request = MagicMock()
+    request.execute.return_value = {
+        'items': [
+            {'id': channel_id, 'contentDetails': {'relatedPlaylists': {'uploads': 'uploads_' + channel_id}}}
+            for channel_id in id.split(',')
+        ]
+    }
+    return request
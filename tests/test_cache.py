@@ -0,0 +1,62 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from ytarchiver.cache import ResponseCache, CachedResponse
+
+
+class ResponseCacheTest(TestCase):
+    def test_should_evict_least_recently_used_response(self):
+        # given
+        cache = ResponseCache(capacity=2)
+        cache.put('a', CachedResponse('"1"', ['video1']))
+        cache.put('b', CachedResponse('"2"', ['video2']))
+
+        # when
+        cache.get('a')
+        cache.put('c', CachedResponse('"3"', ['video3']))
+
+        # then
+        self.assertEqual(cache.get('a').etag, '"1"')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c').videos_ids, ['video3'])
+
+    def test_should_restore_saved_responses(self):
+        # given
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'response_cache.json')
+
+        try:
+            cache = ResponseCache(path, capacity=2)
+            for key in ['a', 'b', 'c']:
+                cache.put(key, CachedResponse('"{}"'.format(key), [key]))
+            cache.save()
+
+            # when
+            restored = ResponseCache(path, capacity=2)
+        finally:
+            shutil.rmtree(directory)
+
+        # then
+        self.assertEqual(len(restored), 2)
+        self.assertIsNone(restored.get('a'))
+        self.assertEqual(restored.get('c').etag, '"c"')
+
+    def test_should_start_empty_when_saved_responses_are_corrupt(self):
+        # given
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'response_cache.json')
+
+        try:
+            with open(path, 'w') as f:
+                f.write('{"responses": [["a", ')
+
+            # when
+            with self.assertLogs('ytarchiver', level='ERROR'):
+                restored = ResponseCache(path, capacity=2)
+        finally:
+            shutil.rmtree(directory)
+
+        # then
+        self.assertEqual(len(restored), 0)
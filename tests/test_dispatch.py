@@ -0,0 +1,93 @@
+import threading
+import time
+from datetime import datetime
+from unittest import TestCase
+
+from ytarchiver import metrics
+from ytarchiver.common import ContentItem, Event, Plugin
+from ytarchiver.dispatch import ThreadedEventBus, ThreadedPluginsManager, DispatchQueue
+
+
+def _event(number: int) -> Event:
+    return Event(type=Event.NEW_VIDEO, content=ContentItem(
+        video_id='video{}'.format(number),
+        channel_id='channel_id',
+        timestamp=datetime.utcnow(),
+        title='video #{}'.format(number),
+        channel_name='some channel'
+    ))
+
+
+class _RecordingPlugin(Plugin):
+    def __init__(self, blocked: threading.Event=None):
+        self.events = []
+        self._blocked = blocked
+
+    def on_event(self, event: Event, is_first_run: bool):
+        if self._blocked is not None:
+            self._blocked.wait()
+        self.events.append((event, is_first_run))
+
+
+class ThreadedEventBusTest(TestCase):
+    def test_should_deliver_events_in_order_without_waiting_for_slow_plugin(self):
+        # given
+        slow_plugin_blocked = threading.Event()
+        slow_plugin = _RecordingPlugin(blocked=slow_plugin_blocked)
+        fast_plugin = _RecordingPlugin()
+        plugins = ThreadedPluginsManager(max_queue_size=100, drop_policy='block')
+        plugins.register_plugin(slow_plugin)
+        plugins.register_plugin(fast_plugin)
+        bus = ThreadedEventBus(plugins, max_queue_size=100, drop_policy='block')
+
+        # when
+        bus.begin_cycle(is_first_run=False)
+        for i in range(5):
+            bus.add_event(_event(i))
+        bus.join()
+        _wait_until(lambda: plugins.stats()['plugin-1-_RecordingPlugin']['delivered'] == 5)
+
+        # then
+        self.assertEqual(fast_plugin.events, [(_event(i), False) for i in range(5)])
+        self.assertEqual(slow_plugin.events, [])
+        self.assertEqual(list(bus.retrieve_events()), [])
+
+        slow_plugin_blocked.set()
+        plugins.join()
+        self.assertEqual(slow_plugin.events, [(_event(i), False) for i in range(5)])
+        self.assertEqual(bus.stats()['delivered'], 5)
+        self.assertEqual(plugins.stats()['plugin-0-_RecordingPlugin']['queue_depth'], 0)
+
+    def test_should_drop_oldest_events_when_queue_is_full(self):
+        # given
+        consumer_blocked = threading.Event()
+        delivered = []
+        dispatch_queue = DispatchQueue(
+            'test-drop-oldest',
+            lambda event, is_first_run: (consumer_blocked.wait(), delivered.append(event)),
+            max_size=2,
+            drop_policy='drop-oldest'
+        )
+
+        # when
+        for i in range(6):
+            dispatch_queue.put(_event(i), is_first_run=False)
+        consumer_blocked.set()
+        dispatch_queue.join()
+
+        # then
+        stats = dispatch_queue.stats()
+        self.assertEqual(delivered[-2:], [_event(4), _event(5)])
+        self.assertEqual(stats['published'], 6)
+        self.assertEqual(stats['dropped'] + stats['delivered'], 6)
+        self.assertEqual(stats['queue_depth'], 0)
+        self.assertEqual(metrics.DISPATCH_PUBLISHED.value('test-drop-oldest'), 6)
+        self.assertEqual(metrics.DISPATCH_DROPPED.value('test-drop-oldest'), stats['dropped'])
+        self.assertEqual(metrics.DISPATCH_DELIVERED.value('test-drop-oldest'), stats['delivered'])
+        self.assertEqual(metrics.DISPATCH_QUEUE_DEPTH.value('test-drop-oldest'), 0)
+
+
+def _wait_until(condition, timeout: float=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
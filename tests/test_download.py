@@ -0,0 +1,286 @@
+import io
+import logging
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from unittest import TestCase
+
+from mock import create_autospec, patch, MagicMock, ANY
+
+from ytarchiver.common import ContentItem
+from ytarchiver.download import _record_stream, RecordingStatistics, download_livestream, LivestreamInterrupted, \
+    generate_segment_filename, download_video, PART_FILE_SUFFIX, DownloadError, VIDEO_DOWNLOAD_MAX_FAILURES
+from ytarchiver.sqlite import Sqlite3StorageManager
+
+LIVESTREAM_1 = ContentItem(
+    video_id='livestream',
+    channel_id='channel_id',
+    timestamp=datetime.utcnow(),
+    title='livestream #live',
+    channel_name='some channel'
+)
+
+
+class _ReadOnlyHandle:
+    def __init__(self, data: bytes, max_read: int):
+        self._data = io.BytesIO(data)
+        self._max_read = max_read
+
+    def read(self, size: int) -> bytes:
+        return self._data.read(min(size, self._max_read))
+
+
+class RecordStreamTest(TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.logger = create_autospec(logging.Logger, spec_set=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_should_copy_whole_stream_through_buffer_pool(self):
+        data = os.urandom(1024 * 1024 + 123)
+        for handle in [io.BytesIO(data), _ReadOnlyHandle(data, max_read=1000)]:
+            # given
+            path = os.path.join(self.output_dir, 'stream.ts')
+            statistics = RecordingStatistics()
+
+            # when
+            with open(path, 'wb') as out:
+                _record_stream(handle, out, 64 * 1024, 3, 0.001, statistics, LIVESTREAM_1, self.logger)
+
+            # then
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), data)
+            self.assertEqual(statistics.bytes_read, len(data))
+            self.assertEqual(statistics.bytes_written, len(data))
+
+    def test_should_write_chunks_of_read_only_handle_without_copying(self):
+        # given
+        chunks = [os.urandom(1000) for _ in range(5)]
+        handle = MagicMock(spec=['read'])
+        handle.read.side_effect = chunks + [b'']
+        written = []
+        out = MagicMock()
+        out.write.side_effect = lambda view: written.append(view.obj)
+
+        # when
+        _record_stream(handle, out, 64 * 1024, 2, 0, RecordingStatistics(), LIVESTREAM_1, self.logger)
+
+        # then
+        self.assertEqual(len(written), len(chunks))
+        for chunk, written_chunk in zip(chunks, written):
+            self.assertIs(written_chunk, chunk)
+
+
+class _InterruptedHandle(io.BytesIO):
+    def readinto(self, buffer) -> int:
+        read = super(_InterruptedHandle, self).readinto(buffer)
+        if read == 0:
+            raise IOError('connection lost')
+        return read
+
+
+def _live_streams(data: bytes, interrupted: bool=False):
+    stream = MagicMock()
+    stream.shortname.return_value = 'hls'
+    stream.open.return_value = _InterruptedHandle(data) if interrupted else io.BytesIO(data)
+    return {'720p': stream}
+
+
+@patch('ytarchiver.download.time.sleep')
+@patch('ytarchiver.download.streamlink.api.streams')
+class DownloadLivestreamTest(TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.logger = create_autospec(logging.Logger, spec_set=True)
+        self.livestream = ContentItem(
+            video_id='livestream',
+            channel_id='channel_id',
+            timestamp=datetime.utcnow(),
+            title='livestream #live',
+            channel_name='some channel',
+            filename=os.path.join(self.output_dir, 'livestream.ts')
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_should_continue_in_new_segment_after_reconnect(self, streams, sleep):
+        # given
+        streams.side_effect = [_live_streams(b'first', interrupted=True), _live_streams(b'second')]
+        segments = []
+
+        # when
+        download_livestream(self.livestream, self.logger, chunk_size=16, on_segment_started=segments.append)
+
+        # then
+        expected_segments = [generate_segment_filename(self.livestream.filename, i) for i in range(2)]
+        self.assertEqual(segments, expected_segments)
+        with open(expected_segments[0], 'rb') as f:
+            self.assertEqual(f.read(), b'first')
+        with open(expected_segments[1], 'rb') as f:
+            self.assertEqual(f.read(), b'second')
+
+    def test_should_not_reconnect_after_stream_ended_without_error(self, streams, sleep):
+        # given
+        streams.side_effect = [_live_streams(b'whole broadcast'), _live_streams(b'replayed playlist')]
+        segments = []
+
+        # when
+        download_livestream(self.livestream, self.logger, chunk_size=16, on_segment_started=segments.append)
+
+        # then
+        self.assertEqual(streams.call_count, 1)
+        sleep.assert_not_called()
+        self.assertEqual(segments, [generate_segment_filename(self.livestream.filename, 0)])
+        with open(segments[0], 'rb') as f:
+            self.assertEqual(f.read(), b'whole broadcast')
+
+    def test_should_give_up_after_reconnect_attempts_without_data(self, streams, sleep):
+        # given
+        streams.side_effect = IOError('connection lost')
+
+        # when
+        with self.assertRaises(LivestreamInterrupted):
+            download_livestream(self.livestream, self.logger, max_reconnects=3)
+
+        # then
+        self.assertEqual(streams.call_count, 4)
+        self.assertEqual(sleep.call_count, 3)
+
+
+def _video_response(status_code: int, data: bytes):
+    response = MagicMock()
+    response.status_code = status_code
+    response.iter_content.return_value = [data[i:i + 4] for i in range(0, len(data), 4)]
+    response.__enter__.return_value = response
+    return response
+
+
+@patch('ytarchiver.download.requests.get')
+@patch('ytarchiver.download.pytube.YouTube')
+class DownloadVideoTest(TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.context = MagicMock()
+        self.context.config.output_dir = self.output_dir
+        self.context.config.index_type = 'set'
+        self.context.config.download_segments = 1
+        self.context.config.min_segment_size = 1
+        self.context.config.base_url = None
+        self.context.config.write_batch_size = 1000
+        self.context.config.write_batch_interval = 5
+        self.context.storage = Sqlite3StorageManager()
+        self.video = ContentItem(
+            video_id='video1',
+            channel_id='channel_id',
+            timestamp='2018-06-01T12:00:00.000Z',
+            title='video',
+            channel_name='some channel',
+            filename=os.path.join(self.output_dir, 'video.mp4')
+        )
+
+    def tearDown(self):
+        self.context.storage.close()
+        shutil.rmtree(self.output_dir)
+
+    def _stream(self, youtube, size: int):
+        stream = MagicMock(filesize=size, url='https://example.com/video', includes_audio_track=True,
+                           includes_video_track=True, resolution='720p', mime_type='video/mp4')
+        youtube.return_value.streams.all.return_value = [stream]
+
+    def test_should_resume_download_from_saved_offset(self, youtube, get):
+        # given
+        data = b'0123456789abcdefghij'
+        self._stream(youtube, len(data))
+        with open(self.video.filename + PART_FILE_SUFFIX, 'wb') as f:
+            f.write(data[:12])
+        with self.context.storage.open(self.context.config) as storage:
+            storage.set_download_progress(self.video.video_id, 10, len(data))
+        get.return_value = _video_response(206, data[10:])
+
+        # when
+        download_video(self.context, self.video)
+
+        # then
+        get.assert_called_once_with(ANY, headers={'Range': 'bytes=10-'}, stream=True, timeout=ANY)
+        with open(self.video.filename, 'rb') as f:
+            self.assertEqual(f.read(), data)
+        self.assertFalse(os.path.exists(self.video.filename + PART_FILE_SUFFIX))
+        with self.context.storage.open(self.context.config) as storage:
+            self.assertIsNone(storage.get_download_progress(self.video.video_id))
+
+    def test_should_finish_download_interrupted_before_rename(self, youtube, get):
+        # given
+        data = b'0123456789abcdefghij'
+        self._stream(youtube, len(data))
+        with open(self.video.filename + PART_FILE_SUFFIX, 'wb') as f:
+            f.write(data)
+        with self.context.storage.open(self.context.config) as storage:
+            storage.set_download_progress(self.video.video_id, len(data), len(data))
+
+        # when
+        download_video(self.context, self.video)
+
+        # then
+        get.assert_not_called()
+        with open(self.video.filename, 'rb') as f:
+            self.assertEqual(f.read(), data)
+        with self.context.storage.open(self.context.config) as storage:
+            self.assertIsNone(storage.get_download_progress(self.video.video_id))
+
+    def test_should_give_up_persistently_failing_download(self, youtube, get):
+        # given
+        data = b'0123456789abcdefghij'
+        self._stream(youtube, len(data))
+        get.side_effect = lambda url, headers, **kwargs: _video_response(200, data[:8])
+
+        # when
+        for _ in range(VIDEO_DOWNLOAD_MAX_FAILURES):
+            with self.assertRaises(DownloadError):
+                download_video(self.context, self.video)
+
+        # then
+        self.assertFalse(os.path.exists(self.video.filename + PART_FILE_SUFFIX))
+        with self.context.storage.open(self.context.config) as storage:
+            self.assertIsNone(storage.get_download_progress(self.video.video_id))
+
+    def test_should_keep_part_file_and_progress_when_interrupted(self, youtube, get):
+        # given
+        data = b'0123456789abcdefghij'
+        self._stream(youtube, len(data))
+        get.return_value = _video_response(200, data[:8])
+
+        # when
+        with self.assertRaises(DownloadError):
+            download_video(self.context, self.video)
+
+        # then
+        self.assertFalse(os.path.exists(self.video.filename))
+        with open(self.video.filename + PART_FILE_SUFFIX, 'rb') as f:
+            self.assertEqual(f.read(), data[:8])
+        with self.context.storage.open(self.context.config) as storage:
+            self.assertEqual(storage.get_download_progress(self.video.video_id), (8, len(data)))
+
+    def test_should_download_segments_in_parallel(self, youtube, get):
+        # given
+        data = os.urandom(1000)
+        self._stream(youtube, len(data))
+        self.context.config.download_segments = 4
+        with patch('ytarchiver.download.MEGABYTE', 100):
+            get.side_effect = lambda url, headers, **kwargs: _video_response(206, _requested_range(data, headers))
+
+            # when
+            download_video(self.context, self.video)
+
+        # then
+        self.assertEqual(get.call_count, 4)
+        with open(self.video.filename, 'rb') as f:
+            self.assertEqual(f.read(), data)
+
+
+def _requested_range(data: bytes, headers: dict) -> bytes:
+    start, end = headers['Range'][len('bytes='):].split('-')
+    return data[int(start):int(end) + 1]
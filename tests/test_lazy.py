@@ -0,0 +1,20 @@
+import sys
+from unittest import TestCase
+
+from ytarchiver.lazy import lazy_import
+
+
+class LazyImportTest(TestCase):
+    def test_should_import_module_on_first_attribute_access(self):
+        # given
+        sys.modules.pop('colorsys', None)
+
+        # when
+        colorsys = lazy_import('colorsys')
+        imported_before_access = 'colorsys' in sys.modules
+        result = colorsys.rgb_to_hsv(1.0, 0.0, 0.0)
+
+        # then
+        self.assertFalse(imported_before_access)
+        self.assertEqual(result, (0.0, 1.0, 1.0))
+        self.assertIn('colorsys', sys.modules)
@@ -2,11 +2,14 @@ import logging
 from datetime import datetime
 from unittest import TestCase
 
-from mock import MagicMock, create_autospec, call
+from mock import MagicMock, create_autospec, call, ANY
 
-from ytarchiver.api import YoutubeAPI, YoutubeChannel
-from ytarchiver.common import Context, RecordersController, StorageManager, ContentItem, EventBus, Event, PluginsManager
-from ytarchiver.lookup import lookup
+from ytarchiver import metrics
+from ytarchiver.api import YoutubeAPI, YoutubeChannel, UploadsPage, APIError
+from ytarchiver.cache import ResponseCache
+from ytarchiver.common import Context, RecordersController, StorageManager, ContentItem, EventBus, Event, \
+    PluginsManager, ChannelWatermark
+from ytarchiver.lookup import lookup, lookup_concurrently
 
 
 CHANNEL_1 = YoutubeChannel('id1',  'uploads_playlistid1')
@@ -24,6 +27,13 @@ VIDEO_2 = ContentItem(
     title='video #2',
     channel_name='some channel'
 )
+VIDEO_3 = ContentItem(
+    video_id='video3',
+    channel_id='channel_id',
+    timestamp=datetime.utcnow(),
+    title='video #3',
+    channel_name='some channel'
+)
 LIVESTREAM_1 = ContentItem(
     video_id='livestream',
     channel_id='channel_id',
@@ -41,28 +51,64 @@ class LookupTest(TestCase):
         context.config.archive_all = False
         context.config.monitor_livestreams = False
 
-        storage.video_exist.return_value = False
+        storage.find_existing_videos.return_value = set()
 
         context.video_recorders.is_recording_active.return_value = False
         context.livestream_recorders.is_recording_active.return_value = False
 
         context.api.find_channels.return_value = [CHANNEL_1]
-        context.api.find_channel_uploaded_videos.return_value = [VIDEO_1, VIDEO_2]
+        context.api.fetch_channel_uploads_page.return_value = UploadsPage([VIDEO_1, VIDEO_2], next_page_token=None)
 
         # when
         lookup(context, is_first_run=True)
 
         # then
         storage.add_video.assert_has_calls([
-            call(context.api.find_channel_uploaded_videos.return_value[0]),
-            call(context.api.find_channel_uploaded_videos.return_value[1])
+            call(VIDEO_1),
+            call(VIDEO_2)
         ], any_order=True)
         storage.add_livestream.assert_not_called()
         context.livestream_recorders.start_recording.assert_not_called()
         context.video_recorders.start_recording.assert_not_called()
         context.bus.add_event.assert_has_calls([
-            call(Event(type=Event.NEW_VIDEO, content=context.api.find_channel_uploaded_videos.return_value[0])),
-            call(Event(type=Event.NEW_VIDEO, content=context.api.find_channel_uploaded_videos.return_value[1]))
+            call(Event(type=Event.NEW_VIDEO, content=VIDEO_1)),
+            call(Event(type=Event.NEW_VIDEO, content=VIDEO_2))
+        ], any_order=True)
+        context.bus.retrieve_events.assert_called_once()
+        storage.commit.assert_called()
+
+    def test_should_check_channels_concurrently(self):
+        # given
+        context, storage = _create_context_and_storage()
+
+        context.config.archive_all = False
+        context.config.monitor_livestreams = False
+        context.config.api_concurrency = 4
+        context.config.channels_list = ['id1', 'id2']
+
+        storage.find_existing_videos.return_value = set()
+
+        context.video_recorders.is_recording_active.return_value = False
+        context.livestream_recorders.is_recording_active.return_value = False
+
+        context.api.find_channels.return_value = [CHANNEL_1, YoutubeChannel('id2', 'uploads_playlistid2')]
+        context.api.fetch_channel_uploads_page.side_effect = lambda channel, page_token, max_results: UploadsPage(
+            [VIDEO_1] if channel.id == 'id1' else [VIDEO_2],
+            next_page_token=None
+        )
+
+        # when
+        lookup_concurrently(context, is_first_run=False)
+
+        # then
+        storage.add_video.assert_has_calls([call(VIDEO_1), call(VIDEO_2)], any_order=True)
+        context.video_recorders.start_recording.assert_has_calls([
+            call(context, VIDEO_1),
+            call(context, VIDEO_2)
+        ], any_order=True)
+        context.bus.add_event.assert_has_calls([
+            call(Event(type=Event.NEW_VIDEO, content=VIDEO_1)),
+            call(Event(type=Event.NEW_VIDEO, content=VIDEO_2))
         ], any_order=True)
         context.bus.retrieve_events.assert_called_once()
         storage.commit.assert_called()
@@ -74,13 +120,13 @@ class LookupTest(TestCase):
         context.config.archive_all = False
         context.config.monitor_livestreams = True
 
-        storage.video_exist.return_value = False
+        storage.find_existing_videos.return_value = set()
 
         context.video_recorders.is_recording_active.return_value = False
         context.livestream_recorders.is_recording_active.return_value = False
 
         context.api.find_channels.return_value = [CHANNEL_1]
-        context.api.find_channel_uploaded_videos.return_value = [VIDEO_1, VIDEO_2]
+        context.api.fetch_channel_uploads_page.return_value = UploadsPage([VIDEO_1, VIDEO_2], next_page_token=None)
         context.api.fetch_channel_livestream.return_value = LIVESTREAM_1
 
         # when
@@ -88,8 +134,8 @@ class LookupTest(TestCase):
 
         # then
         storage.add_video.assert_has_calls([
-            call(context.api.find_channel_uploaded_videos.return_value[0]),
-            call(context.api.find_channel_uploaded_videos.return_value[1])
+            call(VIDEO_1),
+            call(VIDEO_2)
         ], any_order=True)
         storage.add_livestream.assert_has_calls([
             call(context.api.fetch_channel_livestream.return_value)
@@ -104,6 +150,40 @@ class LookupTest(TestCase):
         context.bus.retrieve_events.assert_called_once()
         storage.commit.assert_called()
 
+    def test_should_detect_livestreams_among_newest_uploads(self):
+        # given
+        context, storage = _create_context_and_storage()
+
+        context.config.archive_all = False
+        context.config.monitor_livestreams = True
+        context.config.livestream_detection = 'uploads'
+
+        storage.find_existing_videos.return_value = set()
+
+        context.video_recorders.is_recording_active.return_value = False
+        context.livestream_recorders.is_recording_active.return_value = False
+
+        context.api.find_channels.return_value = [CHANNEL_1]
+        context.api.fetch_channel_uploads_page.return_value = UploadsPage(
+            [LIVESTREAM_1, VIDEO_1, VIDEO_2],
+            next_page_token=None
+        )
+        context.api.find_live_videos.return_value = [LIVESTREAM_1]
+
+        # when
+        lookup(context, is_first_run=False)
+
+        # then
+        context.api.fetch_channel_livestream.assert_not_called()
+        context.api.find_live_videos.assert_called_once_with(
+            [LIVESTREAM_1.video_id, VIDEO_1.video_id, VIDEO_2.video_id]
+        )
+        storage.add_livestream.assert_called_once_with(LIVESTREAM_1)
+        context.livestream_recorders.start_recording.assert_called_once_with(context, LIVESTREAM_1)
+        context.bus.add_event.assert_has_calls([
+            call(Event(type=Event.LIVESTREAM_STARTED, content=LIVESTREAM_1))
+        ], any_order=True)
+
     def test_should_search_for_videos_and_archive_all(self):
         # given
         context, storage = _create_context_and_storage()
@@ -111,31 +191,31 @@ class LookupTest(TestCase):
         context.config.archive_all = True
         context.config.monitor_livestreams = False
 
-        storage.video_exist.return_value = False
+        storage.find_existing_videos.return_value = set()
 
         context.video_recorders.is_recording_active.return_value = False
         context.livestream_recorders.is_recording_active.return_value = False
 
         context.api.find_channels.return_value = [CHANNEL_1]
-        context.api.find_channel_uploaded_videos.return_value = [VIDEO_1, VIDEO_2]
+        context.api.fetch_channel_uploads_page.return_value = UploadsPage([VIDEO_1, VIDEO_2], next_page_token=None)
 
         # when
         lookup(context, is_first_run=True)
 
         # then
         storage.add_video.assert_has_calls([
-            call(context.api.find_channel_uploaded_videos.return_value[0]),
-            call(context.api.find_channel_uploaded_videos.return_value[1])
+            call(VIDEO_1),
+            call(VIDEO_2)
         ], any_order=True)
         storage.add_livestream.assert_not_called()
         context.video_recorders.start_recording.assert_has_calls([
-            call(context, context.api.find_channel_uploaded_videos.return_value[0]),
-            call(context, context.api.find_channel_uploaded_videos.return_value[1])
+            call(context, VIDEO_1),
+            call(context, VIDEO_2)
         ], any_order=True)
         context.livestream_recorders.start_recording.assert_not_called()
         context.bus.add_event.assert_has_calls([
-            call(Event(type=Event.NEW_VIDEO, content=context.api.find_channel_uploaded_videos.return_value[0])),
-            call(Event(type=Event.NEW_VIDEO, content=context.api.find_channel_uploaded_videos.return_value[1]))
+            call(Event(type=Event.NEW_VIDEO, content=VIDEO_1)),
+            call(Event(type=Event.NEW_VIDEO, content=VIDEO_2))
         ], any_order=True)
         context.bus.retrieve_events.assert_called_once()
         storage.commit.assert_called()
@@ -147,31 +227,31 @@ class LookupTest(TestCase):
         context.config.archive_all = False
         context.config.monitor_livestreams = False
 
-        storage.video_exist.return_value = False
+        storage.find_existing_videos.return_value = set()
 
         context.video_recorders.is_recording_active.return_value = False
         context.livestream_recorders.is_recording_active.return_value = False
 
         context.api.find_channels.return_value = [CHANNEL_1]
-        context.api.find_channel_uploaded_videos.return_value = [VIDEO_1, VIDEO_2]
+        context.api.fetch_channel_uploads_page.return_value = UploadsPage([VIDEO_1, VIDEO_2], next_page_token=None)
 
         # when
         lookup(context, is_first_run=False)
 
         # then
         storage.add_video.assert_has_calls([
-            call(context.api.find_channel_uploaded_videos.return_value[0]),
-            call(context.api.find_channel_uploaded_videos.return_value[1])
+            call(VIDEO_1),
+            call(VIDEO_2)
         ], any_order=True)
         storage.add_livestream.assert_not_called()
         context.video_recorders.start_recording.assert_has_calls([
-            call(context, context.api.find_channel_uploaded_videos.return_value[0]),
-            call(context, context.api.find_channel_uploaded_videos.return_value[1])
+            call(context, VIDEO_1),
+            call(context, VIDEO_2)
         ], any_order=True)
         context.livestream_recorders.start_recording.assert_not_called()
         context.bus.add_event.assert_has_calls([
-            call(Event(type=Event.NEW_VIDEO, content=context.api.find_channel_uploaded_videos.return_value[0])),
-            call(Event(type=Event.NEW_VIDEO, content=context.api.find_channel_uploaded_videos.return_value[1]))
+            call(Event(type=Event.NEW_VIDEO, content=VIDEO_1)),
+            call(Event(type=Event.NEW_VIDEO, content=VIDEO_2))
         ], any_order=True)
         context.bus.retrieve_events.assert_called_once()
         storage.commit.assert_called()
@@ -183,13 +263,13 @@ class LookupTest(TestCase):
         context.config.archive_all = False
         context.config.monitor_livestreams = False
 
-        storage.video_exist.return_value = True
+        storage.find_existing_videos.return_value = {VIDEO_1.video_id, VIDEO_2.video_id}
 
         context.video_recorders.is_recording_active.return_value = False
         context.livestream_recorders.is_recording_active.return_value = False
 
         context.api.find_channels.return_value = [CHANNEL_1]
-        context.api.find_channel_uploaded_videos.return_value = [VIDEO_1, VIDEO_2]
+        context.api.fetch_channel_uploads_page.return_value = UploadsPage([VIDEO_1, VIDEO_2], next_page_token=None)
 
         # when
         lookup(context, is_first_run=False)
@@ -203,10 +283,254 @@ class LookupTest(TestCase):
         context.bus.retrieve_events.assert_called_once()
         storage.commit.assert_called()
 
+    def test_should_count_only_videos_added_to_archive(self):
+        # given
+        context, storage = _create_context_and_storage()
+
+        context.config.archive_all = False
+        context.config.monitor_livestreams = False
+
+        storage.find_existing_videos.return_value = {VIDEO_1.video_id}
+
+        context.video_recorders.is_recording_active.return_value = False
+        context.livestream_recorders.is_recording_active.return_value = False
+
+        context.api.find_channels.return_value = [CHANNEL_1]
+        context.api.fetch_channel_uploads_page.return_value = UploadsPage([VIDEO_1, VIDEO_2], next_page_token=None)
+        archived_before = metrics.VIDEOS.value(VIDEO_2.channel_id)
+
+        # when
+        lookup(context, is_first_run=False)
+
+        # then
+        storage.add_video.assert_called_once_with(VIDEO_2)
+        self.assertEqual(metrics.VIDEOS.value(VIDEO_2.channel_id) - archived_before, 1)
+
+    def test_should_not_check_any_channel_when_none_is_due(self):
+        # given
+        context, storage = _create_context_and_storage()
+
+        context.config.archive_all = False
+        context.config.monitor_livestreams = False
+        storage.find_uploads_playlists.return_value = {CHANNEL_1.id: CHANNEL_1.uploads_playlist_id}
+
+        # when
+        lookup(context, is_first_run=False, channels_ids=[])
+
+        # then
+        context.api.find_channels.assert_not_called()
+        context.api.fetch_channel_uploads_page.assert_not_called()
+        storage.add_video.assert_not_called()
+
+    def test_should_stop_paging_at_first_known_video(self):
+        # given
+        context, storage = _create_context_and_storage()
+
+        context.config.archive_all = False
+        context.config.monitor_livestreams = False
+
+        storage.get_watermark.return_value = ChannelWatermark(
+            CHANNEL_1.id,
+            video_id=VIDEO_2.video_id,
+            timestamp=VIDEO_2.timestamp,
+            backfill_complete=True
+        )
+        storage.find_existing_videos.return_value = {VIDEO_2.video_id, VIDEO_3.video_id}
+
+        context.video_recorders.is_recording_active.return_value = False
+        context.livestream_recorders.is_recording_active.return_value = False
+
+        context.api.find_channels.return_value = [CHANNEL_1]
+        context.api.fetch_channel_uploads_page.return_value = UploadsPage(
+            [VIDEO_1, VIDEO_2, VIDEO_3],
+            next_page_token='next_page'
+        )
+
+        # when
+        lookup(context, is_first_run=True)
+
+        # then
+        context.api.fetch_channel_uploads_page.assert_called_once_with(ANY, page_token='', max_results=5)
+        storage.add_video.assert_called_once_with(VIDEO_1)
+        context.bus.add_event.assert_called_once_with(Event(type=Event.NEW_VIDEO, content=VIDEO_1))
+        watermark = storage.set_watermark.call_args[0][0]
+        self.assertEqual(watermark.video_id, VIDEO_1.video_id)
+
+    def test_should_store_new_videos_only_after_paging_reaches_known_video(self):
+        # given
+        context, storage = _create_context_and_storage()
+
+        context.config.archive_all = False
+        context.config.monitor_livestreams = False
+
+        storage.get_watermark.return_value = ChannelWatermark(
+            CHANNEL_1.id,
+            video_id=VIDEO_3.video_id,
+            timestamp=VIDEO_3.timestamp,
+            backfill_complete=True
+        )
+        storage.find_existing_videos.side_effect = lambda ids: {VIDEO_3.video_id} & set(ids)
+
+        context.video_recorders.is_recording_active.return_value = False
+        context.livestream_recorders.is_recording_active.return_value = False
+
+        context.api.find_channels.return_value = [CHANNEL_1]
+        pages = {
+            '': UploadsPage([VIDEO_1], next_page_token='page_2'),
+            'page_2': UploadsPage([VIDEO_2, VIDEO_3], next_page_token='page_3')
+        }
+
+        def fetch_channel_uploads_page_failing_at_page_2(channel, page_token, max_results):
+            if page_token == 'page_2':
+                raise APIError('quota exceeded')
+            return pages[page_token]
+        context.api.fetch_channel_uploads_page.side_effect = fetch_channel_uploads_page_failing_at_page_2
+
+        # when
+        lookup(context, is_first_run=False)
+
+        # then
+        storage.add_video.assert_not_called()
+        storage.set_watermark.assert_not_called()
+
+        # when
+        context.api.fetch_channel_uploads_page.side_effect = lambda channel, page_token, max_results: pages[page_token]
+        lookup(context, is_first_run=False)
+
+        # then
+        storage.add_video.assert_has_calls([call(VIDEO_2), call(VIDEO_1)])
+        watermark = storage.set_watermark.call_args[0][0]
+        self.assertEqual(watermark.video_id, VIDEO_1.video_id)
+
+    def test_should_resume_interrupted_backfill(self):
+        # given
+        context, storage = _create_context_and_storage()
+
+        context.config.archive_all = False
+        context.config.monitor_livestreams = False
+
+        storage.get_watermark.return_value = ChannelWatermark(
+            CHANNEL_1.id,
+            video_id=VIDEO_1.video_id,
+            timestamp=VIDEO_1.timestamp,
+            backfill_page_token='page_2',
+            backfill_complete=False
+        )
+        storage.find_existing_videos.side_effect = lambda ids: {VIDEO_1.video_id} & set(ids)
+
+        context.video_recorders.is_recording_active.return_value = False
+        context.livestream_recorders.is_recording_active.return_value = False
+
+        context.api.find_channels.return_value = [CHANNEL_1]
+        pages = {
+            '': UploadsPage([VIDEO_1], next_page_token='page_2'),
+            'page_2': UploadsPage([VIDEO_2], next_page_token='page_3'),
+            'page_3': UploadsPage([VIDEO_3], next_page_token=None)
+        }
+        context.api.fetch_channel_uploads_page.side_effect = lambda channel, page_token, max_results: pages[page_token]
+
+        # when
+        lookup(context, is_first_run=True)
+
+        # then
+        self.assertEqual(
+            [c[1]['page_token'] for c in context.api.fetch_channel_uploads_page.call_args_list],
+            ['', 'page_2', 'page_3']
+        )
+        storage.add_video.assert_has_calls([call(VIDEO_2), call(VIDEO_3)])
+        watermark = storage.set_watermark.call_args[0][0]
+        self.assertTrue(watermark.backfill_complete)
+        self.assertIsNone(watermark.backfill_page_token)
+
+    def test_should_skip_channel_with_unchanged_newest_uploads(self):
+        # given
+        context, storage = _create_context_and_storage()
+        context.response_cache = ResponseCache(capacity=10)
+
+        context.config.archive_all = False
+        context.config.monitor_livestreams = True
+        context.config.livestream_detection = 'uploads'
+
+        storage.find_uploads_playlists.return_value = {CHANNEL_1.id: CHANNEL_1.uploads_playlist_id}
+        storage.get_watermark.return_value = ChannelWatermark(
+            CHANNEL_1.id,
+            video_id=VIDEO_1.video_id,
+            timestamp=VIDEO_1.timestamp,
+            backfill_complete=True
+        )
+        storage.find_existing_videos.return_value = {VIDEO_1.video_id, VIDEO_2.video_id}
+
+        context.video_recorders.is_recording_active.return_value = False
+        context.livestream_recorders.is_recording_active.return_value = False
+        context.api.find_live_videos.return_value = []
+
+        def fetch_channel_uploads_page(channel, page_token, max_results, etag=None):
+            if etag == '"etag1"':
+                return UploadsPage([], None, etag=etag, not_modified=True)
+            return UploadsPage([VIDEO_1, VIDEO_2], next_page_token=None, etag='"etag1"')
+        context.api.fetch_channel_uploads_page.side_effect = fetch_channel_uploads_page
+
+        lookup(context, is_first_run=False)
+        storage.reset_mock()
+
+        # when
+        lookup(context, is_first_run=False)
+
+        # then
+        self.assertEqual(
+            [c[1]['etag'] for c in context.api.fetch_channel_uploads_page.call_args_list],
+            [None, '"etag1"']
+        )
+        storage.find_existing_videos.assert_not_called()
+        storage.set_watermark.assert_not_called()
+        context.api.find_live_videos.assert_called_with([VIDEO_1.video_id, VIDEO_2.video_id])
+        self.assertEqual((context.response_cache.hits, context.response_cache.misses), (1, 1))
+
+    def test_should_not_cache_etag_of_interrupted_scan(self):
+        # given
+        context, storage = _create_context_and_storage()
+        context.response_cache = ResponseCache(capacity=10)
+
+        context.config.archive_all = False
+        context.config.monitor_livestreams = False
+
+        storage.find_uploads_playlists.return_value = {CHANNEL_1.id: CHANNEL_1.uploads_playlist_id}
+        storage.get_watermark.return_value = ChannelWatermark(
+            CHANNEL_1.id,
+            video_id=VIDEO_3.video_id,
+            timestamp=VIDEO_3.timestamp,
+            backfill_complete=True
+        )
+        storage.find_existing_videos.side_effect = lambda ids: {VIDEO_3.video_id} & set(ids)
+
+        context.video_recorders.is_recording_active.return_value = False
+        context.livestream_recorders.is_recording_active.return_value = False
+
+        def fetch_channel_uploads_page(channel, page_token, max_results, etag=None):
+            if page_token == 'page_2':
+                raise APIError('quota exceeded')
+            return UploadsPage([VIDEO_1, VIDEO_2], next_page_token='page_2', etag='"etag1"')
+        context.api.fetch_channel_uploads_page.side_effect = fetch_channel_uploads_page
+
+        lookup(context, is_first_run=False)
+
+        # when
+        lookup(context, is_first_run=False)
+
+        # then
+        self.assertEqual(
+            [c[1].get('etag') for c in context.api.fetch_channel_uploads_page.call_args_list],
+            [None, None, None, None]
+        )
+        self.assertEqual(len(context.response_cache), 0)
+
 
 def _create_context_and_storage():
     config = MagicMock()
     config.output_dir = 'fake_output_directory'
+    config.channels_list = [CHANNEL_1.id]
+    config.api_concurrency = 1
+    config.livestream_detection = 'search'
     logger = create_autospec(logging.Logger, spec_set=True)
     api = create_autospec(YoutubeAPI, spec_set=True)
     video_recorders_controller = create_autospec(RecordersController, spec_set=True)
@@ -217,6 +541,8 @@ def _create_context_and_storage():
     storage_manager = create_autospec(StorageManager, spec_set=True)
     storage_manager.open.return_value.__enter__.return_value = MagicMock()
     storage = storage_manager.open.return_value.__enter__.return_value
+    storage.find_uploads_playlists.return_value = {}
+    storage.get_watermark.return_value = None
 
     context = Context(
         config,
@@ -0,0 +1,32 @@
+import logging
+from datetime import datetime
+from unittest import TestCase
+
+from mock import MagicMock, create_autospec
+
+from ytarchiver import metrics
+from ytarchiver.common import Context
+from ytarchiver.main import report_quota_usage
+from ytarchiver.quota import QuotaLedger
+
+
+class QuotaReportTest(TestCase):
+    def test_should_log_and_export_projected_exhaustion(self):
+        # given
+        api = MagicMock()
+        api.quota = QuotaLedger(daily_budget=10000)
+        api.quota.charge('search.list', 9000)
+        api.quota.projected_exhaustion = MagicMock(return_value=datetime(2018, 6, 10, 18, 0, 0))
+        logger = create_autospec(logging.Logger, spec_set=True)
+        context = Context(MagicMock(), logger, api, None, None, None, None, None)
+
+        # when
+        report_quota_usage(context, 100, 'polling intervals stretched 1.50x')
+
+        # then
+        logger.info.assert_called_once_with(
+            'quota used today: 9000/10000 units, lookup cost: 100 units, polling intervals stretched 1.50x, '
+            'projected exhaustion: 2018-06-10 18:00:00 UTC'
+        )
+        self.assertEqual(metrics.QUOTA_USED_TODAY.value(), 9000)
+        self.assertEqual(metrics.QUOTA_PROJECTED_EXHAUSTION.value(), 1528653600)
@@ -0,0 +1,48 @@
+from unittest import TestCase
+from urllib.request import urlopen
+
+from ytarchiver.metrics import MetricsRegistry, Counter, Gauge, Histogram, start_metrics_server
+
+
+class MetricsTest(TestCase):
+    def test_should_render_metrics_in_prometheus_format(self):
+        # given
+        registry = MetricsRegistry()
+        calls = registry.register(Counter('api_calls_total', 'API calls', ['method']))
+        recorders = registry.register(Gauge('active_recorders', 'Active recorders'))
+        duration = registry.register(Histogram('lookup_seconds', 'Lookup duration', buckets=(1, 5)))
+
+        # when
+        calls.inc('search.list')
+        calls.inc('search.list')
+        recorders.set(value=3)
+        duration.observe(value=0.5)
+        duration.observe(value=2)
+        output = registry.render()
+
+        # then
+        self.assertIn('# TYPE api_calls_total counter', output)
+        self.assertIn('api_calls_total{method="search.list"} 2', output)
+        self.assertIn('active_recorders 3', output)
+        self.assertIn('lookup_seconds_bucket{le="1"} 1', output)
+        self.assertIn('lookup_seconds_bucket{le="5"} 2', output)
+        self.assertIn('lookup_seconds_bucket{le="+Inf"} 2', output)
+        self.assertIn('lookup_seconds_sum 2.5', output)
+        self.assertIn('lookup_seconds_count 2', output)
+
+    def test_should_serve_metrics_over_http(self):
+        # given
+        registry = MetricsRegistry()
+        registry.register(Gauge('active_recorders', 'Active recorders')).set(value=1)
+        server = start_metrics_server(0, address='127.0.0.1', registry=registry)
+
+        # when
+        try:
+            with urlopen('http://127.0.0.1:{}/metrics'.format(server.server_address[1])) as response:
+                body = response.read().decode('utf-8')
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        # then
+        self.assertIn('active_recorders 1', body)
@@ -0,0 +1,126 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+from mock import patch, MagicMock
+
+from ytarchiver.common import ContentItem, Event
+from ytarchiver.plugins import HttpPlugin
+
+VIDEO_1 = ContentItem(
+    video_id='video1',
+    channel_id='channel_id',
+    timestamp='2018-06-01T12:00:00.000Z',
+    title='video #1',
+    channel_name='some channel'
+)
+VIDEO_2 = ContentItem(
+    video_id='video2',
+    channel_id='channel_id',
+    timestamp='2018-06-01T13:00:00.000Z',
+    title='video #2',
+    channel_name='some channel'
+)
+
+
+class HttpPluginTest(TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_should_deliver_events_in_background_in_order(self):
+        # given
+        with patch('ytarchiver.plugins.requests.Session') as session_class:
+            session_class.return_value.post.return_value = MagicMock(status_code=200)
+            plugin = HttpPlugin({'url': 'http://localhost/hook'})
+
+            # when
+            plugin.on_event(Event(type=Event.NEW_VIDEO, content=VIDEO_1), is_first_run=False)
+            plugin.on_event(Event(type=Event.VIDEO_DOWNLOADED, content=VIDEO_1), is_first_run=False)
+            plugin.on_event(Event(type=Event.NEW_VIDEO, content=VIDEO_2), is_first_run=True)
+            _wait_until_delivered(plugin)
+
+        # then
+        posted = [c[1]['json'] for c in session_class.return_value.post.call_args_list]
+        self.assertEqual([payload['event_type'] for payload in posted], ['new_video', 'video_downloaded'])
+        self.assertEqual(posted[0]['data']['video_id'], VIDEO_1.video_id)
+
+    def test_should_keep_undelivered_events_in_spool(self):
+        # given
+        spool = os.path.join(self.output_dir, 'http.spool')
+        endpoint_available = threading.Event()
+
+        def post(url, json, timeout):
+            return MagicMock(status_code=200 if endpoint_available.is_set() else 503)
+
+        with patch('ytarchiver.plugins.requests.Session') as session_class:
+            session_class.return_value.post.side_effect = post
+            config = {'url': 'http://localhost/hook', 'spool': spool, 'batch_size': 10, 'retry_backoff': 0.01}
+            plugin = HttpPlugin(config)
+
+            # when
+            plugin.on_event(Event(type=Event.NEW_VIDEO, content=VIDEO_1), is_first_run=False)
+            plugin.on_event(Event(type=Event.NEW_VIDEO, content=VIDEO_2), is_first_run=False)
+            _wait_until(lambda: os.path.isfile(spool) and len(_read_lines(spool)) == 2)
+            restarted_plugin = HttpPlugin(config)
+
+            # then
+            self.assertEqual(restarted_plugin.pending_events(), 2)
+
+            endpoint_available.set()
+            _wait_until_delivered(plugin)
+            _wait_until_delivered(restarted_plugin)
+
+        self.assertEqual(_read_lines(spool), [])
+
+    def test_should_drop_oldest_events_when_too_many_are_pending(self):
+        # given
+        endpoint_available = threading.Event()
+
+        def post(url, json, timeout):
+            endpoint_available.wait()
+            return MagicMock(status_code=200)
+
+        with patch('ytarchiver.plugins.requests.Session') as session_class:
+            session_class.return_value.post.side_effect = post
+            plugin = HttpPlugin({'url': 'http://localhost/hook', 'max_pending': 2, 'drop_policy': 'drop-oldest'})
+
+            # when
+            for event_type in [Event.NEW_VIDEO, Event.VIDEO_DOWNLOADED]:
+                for video in [VIDEO_1, VIDEO_2]:
+                    plugin.on_event(Event(type=event_type, content=video), is_first_run=False)
+
+            # then
+            self.assertEqual(plugin.pending_events(), 2)
+            self.assertEqual(plugin.dropped, 2)
+
+            endpoint_available.set()
+            _wait_until_delivered(plugin)
+
+        posted = [c[1]['json'] for c in session_class.return_value.post.call_args_list]
+        self.assertEqual(
+            [(payload['event_type'], payload['data']['video_id']) for payload in posted[-2:]],
+            [('video_downloaded', VIDEO_1.video_id), ('video_downloaded', VIDEO_2.video_id)]
+        )
+
+
+def _read_lines(path: str) -> list:
+    with open(path) as f:
+        return f.readlines()
+
+
+def _wait_until(condition, timeout: float=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def _wait_until_delivered(plugin: HttpPlugin, timeout: float=5):
+    deadline = time.time() + timeout
+    while plugin.pending_events() > 0 and time.time() < deadline:
+        time.sleep(0.01)
@@ -0,0 +1,67 @@
+import logging
+import os
+import shutil
+import tempfile
+import time
+from unittest import TestCase
+
+from mock import create_autospec
+
+from ytarchiver import profiling
+from ytarchiver.profiling import LookupProfiler, PROFILES_DIRECTORY
+
+
+class LookupProfilerTest(TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.logger = create_autospec(logging.Logger, spec_set=True)
+
+    def tearDown(self):
+        profiling.enable(None)
+        shutil.rmtree(self.output_dir)
+
+    def test_should_log_stages_per_cycle_and_channel(self):
+        # given
+        profiling.enable(LookupProfiler(self.output_dir))
+
+        # when
+        profiling.begin_cycle()
+        with profiling.stage('find_channels'):
+            pass
+        with profiling.channel('channel1'):
+            with profiling.stage('playlist_page'):
+                time.sleep(0.01)
+        profiling.end_cycle(self.logger)
+
+        # then
+        messages = [c[0][0] for c in self.logger.info.call_args_list]
+        self.assertTrue(messages[0].startswith('lookup profile:'))
+        self.assertIn('playlist_page', messages[0])
+        self.assertIn('find_channels', messages[0])
+        self.assertTrue(messages[1].startswith('channel "channel1" profile:'))
+        self.assertNotIn('find_channels', messages[1])
+
+    def test_should_keep_dumps_of_slowest_cycles_only(self):
+        # given
+        profiling.enable(LookupProfiler(self.output_dir, dump_slowest=2))
+
+        # when
+        for delay in [0.03, 0.01, 0.05, 0.02]:
+            profiling.begin_cycle()
+            time.sleep(delay)
+            profiling.end_cycle(self.logger)
+
+        # then
+        dumps = sorted(os.listdir(os.path.join(self.output_dir, PROFILES_DIRECTORY)))
+        self.assertEqual(len(dumps), 2)
+        self.assertTrue(all(dump.endswith('.pstats') for dump in dumps))
+
+    def test_should_do_nothing_when_disabled(self):
+        # when
+        profiling.begin_cycle()
+        with profiling.channel('channel1'), profiling.stage('playlist_page'):
+            pass
+        profiling.end_cycle(self.logger)
+
+        # then
+        self.logger.info.assert_not_called()
@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from unittest import TestCase
+
+from ytarchiver.quota import QuotaLedger, pacific_time
+
+
+class QuotaLedgerTest(TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_should_convert_to_pacific_time_with_daylight_saving(self):
+        self.assertEqual(pacific_time(datetime(2018, 1, 15, 12, 0)), datetime(2018, 1, 15, 4, 0))
+        self.assertEqual(pacific_time(datetime(2018, 7, 15, 12, 0)), datetime(2018, 7, 15, 5, 0))
+        self.assertEqual(pacific_time(datetime(2018, 3, 11, 9, 59)), datetime(2018, 3, 11, 1, 59))
+        self.assertEqual(pacific_time(datetime(2018, 3, 11, 10, 0)), datetime(2018, 3, 11, 3, 0))
+        self.assertEqual(pacific_time(datetime(2018, 11, 4, 8, 59)), datetime(2018, 11, 4, 1, 59))
+        self.assertEqual(pacific_time(datetime(2018, 11, 4, 9, 0)), datetime(2018, 11, 4, 1, 0))
+
+    def test_should_persist_used_units(self):
+        # given
+        path = os.path.join(self.output_dir, 'quota.json')
+        ledger = QuotaLedger(path)
+
+        # when
+        ledger.charge('search.list', 100)
+        ledger.charge('playlistItems.list', 1)
+        ledger.save()
+
+        # then
+        restored = QuotaLedger(path)
+        self.assertEqual(restored.used_today(), 101)
+        self.assertEqual(restored.used_by_method(), {'search.list': 100, 'playlistItems.list': 1})
+
+    def test_should_assume_no_usage_when_saved_state_is_corrupt(self):
+        # given
+        path = os.path.join(self.output_dir, 'quota.json')
+        open(path, 'w').close()
+
+        # when
+        with self.assertLogs('ytarchiver', level='ERROR'):
+            ledger = QuotaLedger(path)
+
+        # then
+        self.assertEqual(ledger.used_today(), 0)
+        self.assertEqual(ledger.used_by_method(), {})
+
+    def test_should_spread_remaining_budget_until_reset(self):
+        # given
+        ledger = QuotaLedger(daily_budget=10000)
+        ledger.charge('playlistItems.list', 4000)
+        now = datetime(2018, 1, 15, 20, 0)  # noon in Pacific time, 12 hours until reset
+
+        # when
+        refresh_time = ledger.suggest_refresh_time(cycle_cost=100, min_time=30, max_time=3600, now=now)
+
+        # then
+        self.assertAlmostEqual(refresh_time, 100 * 12 * 3600 / 6000)
+        self.assertEqual(ledger.suggest_refresh_time(cycle_cost=1, min_time=30, max_time=3600, now=now), 30)
+        self.assertEqual(ledger.suggest_refresh_time(cycle_cost=10000, min_time=30, max_time=3600, now=now), 3600)
@@ -0,0 +1,79 @@
+import multiprocessing
+import time
+from datetime import datetime
+from unittest import TestCase
+
+from mock import patch
+
+from ytarchiver.args import parse_command_line
+from ytarchiver.ratelimit import TokenBucket, BandwidthLimiter, parse_bandwidth_schedule, PRIORITY_LIVESTREAM, \
+    PRIORITY_VIDEO
+
+
+def _consume_in_child(bucket: TokenBucket, tokens: int):
+    bucket.consume(tokens)
+
+
+class TokenBucketTest(TestCase):
+    def test_should_delay_consumers_above_rate(self):
+        # given
+        bucket = TokenBucket(rate=1000)
+        bucket.consume(1000)
+
+        # when
+        started_at = time.monotonic()
+        bucket.consume(200)
+
+        # then
+        self.assertGreaterEqual(time.monotonic() - started_at, 0.15)
+
+    def test_should_share_tokens_between_processes(self):
+        # given
+        bucket = TokenBucket(rate=1000)
+
+        # when
+        process = multiprocessing.Process(target=_consume_in_child, args=(bucket, 1000))
+        process.start()
+        process.join()
+        started_at = time.monotonic()
+        bucket.consume(200)
+
+        # then
+        self.assertGreaterEqual(time.monotonic() - started_at, 0.15)
+
+
+class BandwidthLimiterTest(TestCase):
+    def test_should_let_livestreams_go_before_videos(self):
+        # given
+        limiter = BandwidthLimiter(total_rate=1000)
+
+        # when
+        started_at = time.monotonic()
+        limiter.acquire(1000, PRIORITY_LIVESTREAM)
+        limiter.acquire(500, PRIORITY_LIVESTREAM)
+        livestream_wait = time.monotonic() - started_at
+        limiter.acquire(100, PRIORITY_VIDEO)
+        video_wait = time.monotonic() - started_at
+
+        # then
+        self.assertLess(livestream_wait, 0.1)
+        self.assertGreaterEqual(video_wait, 0.5)
+
+    def test_should_follow_schedule(self):
+        # given
+        schedule = parse_bandwidth_schedule('08:00-23:00=1, 23:30-06:00=2')
+        limiter = BandwidthLimiter(total_rate=0, schedule=schedule)
+
+        # then
+        self.assertEqual(schedule, [(480, 1380, 1024), (1410, 360, 2048)])
+        self.assertEqual(limiter._scheduled_rate(datetime(2018, 6, 1, 12, 0)), 1024)
+        self.assertEqual(limiter._scheduled_rate(datetime(2018, 6, 1, 23, 15)), 0)
+        self.assertEqual(limiter._scheduled_rate(datetime(2018, 6, 1, 2, 0)), 2048)
+
+    def test_should_reject_invalid_schedule(self):
+        # when / then
+        with self.assertRaises(ValueError):
+            parse_bandwidth_schedule('08:00-24:00=1')
+        with patch('sys.argv', ['ytarchiver', '--bandwidth-schedule', '24:30-06:00=1']), \
+                patch('sys.stderr'), self.assertRaises(SystemExit):
+            parse_command_line()
@@ -0,0 +1,125 @@
+import logging
+import threading
+import time
+from datetime import datetime
+from unittest import TestCase
+
+from mock import MagicMock, create_autospec, patch, call
+
+from ytarchiver import metrics
+from ytarchiver.common import ContentItem, EventBus, Event
+from ytarchiver.download import DownloadError
+from ytarchiver.recording import ThreadPoolVideoRecordersController, MultiprocessLivestreamRecordersController, \
+    RecorderSegmentMessage, RecorderShutdownMessage, RecorderProgressMessage
+
+
+VIDEO_1 = ContentItem(
+    video_id='video1',
+    channel_id='channel_id',
+    timestamp=datetime.utcnow(),
+    title='video #1',
+    channel_name='some channel'
+)
+VIDEO_2 = ContentItem(
+    video_id='video2',
+    channel_id='channel_id',
+    timestamp=datetime.utcnow(),
+    title='video #2',
+    channel_name='some channel'
+)
+
+
+class ThreadPoolVideoRecordersControllerTest(TestCase):
+    def test_should_download_in_background_and_publish_events(self):
+        # given
+        context = _create_context()
+        controller = ThreadPoolVideoRecordersController(workers=1)
+        download_allowed = threading.Event()
+
+        # when
+        with patch('ytarchiver.recording.download_video', side_effect=lambda c, v: download_allowed.wait()):
+            controller.start_recording(context, VIDEO_1)
+            controller.start_recording(context, VIDEO_2)
+
+            # then
+            self.assertTrue(controller.is_recording_active(VIDEO_1.video_id))
+            self.assertTrue(controller.is_recording_active(VIDEO_2.video_id))
+
+            download_allowed.set()
+            controller._pending.join()
+
+        self.assertFalse(controller.is_recording_active(VIDEO_1.video_id))
+        self.assertFalse(controller.is_recording_active(VIDEO_2.video_id))
+        self.assertEqual(
+            list(context.bus.retrieve_events()),
+            [Event(type=Event.VIDEO_DOWNLOADED, content=VIDEO_1), Event(type=Event.VIDEO_DOWNLOADED, content=VIDEO_2)]
+        )
+
+    def test_should_release_recording_after_failed_download(self):
+        # given
+        context = _create_context()
+        controller = ThreadPoolVideoRecordersController(workers=2)
+
+        # when
+        with patch('ytarchiver.recording.download_video', side_effect=DownloadError(VIDEO_1.title, None)):
+            controller.start_recording(context, VIDEO_1)
+            controller._pending.join()
+
+        # then
+        self.assertFalse(controller.is_recording_active(VIDEO_1.video_id))
+        self.assertEqual(list(context.bus.retrieve_events()), [])
+        context.logger.exception.assert_called_once()
+
+
+class MultiprocessLivestreamRecordersControllerTest(TestCase):
+    def test_should_handle_messages_from_recorders_as_soon_as_they_arrive(self):
+        # given
+        context = _create_context()
+        storage = context.storage.open.return_value.__enter__.return_value
+        controller = MultiprocessLivestreamRecordersController()
+        controller.active_recordings[VIDEO_1.video_id] = VIDEO_1
+        controller.listen(context)
+
+        # when
+        controller.recorders_queue.send_message(RecorderSegmentMessage(VIDEO_1.video_id, 'livestream.ts'))
+        controller.recorders_queue.send_message(RecorderSegmentMessage(VIDEO_1.video_id, 'livestream_segment1.ts'))
+        controller.recorders_queue.send_message(RecorderShutdownMessage(VIDEO_1.video_id))
+        _wait_until(lambda: not controller.is_recording_active(VIDEO_1.video_id))
+
+        # then
+        storage.update_livestream_segments.assert_has_calls([
+            call(VIDEO_1, ['livestream.ts']),
+            call(VIDEO_1, ['livestream.ts', 'livestream_segment1.ts'])
+        ])
+        self.assertEqual(
+            list(context.bus.retrieve_events()),
+            [Event(type=Event.LIVESTREAM_INTERRUPTED, content=VIDEO_1)]
+        )
+
+    def test_should_update_recording_metrics_when_progress_arrives(self):
+        # given
+        context = _create_context()
+        controller = MultiprocessLivestreamRecordersController()
+        controller.active_recordings[VIDEO_2.video_id] = VIDEO_2
+        controller.listen(context)
+
+        # when
+        controller.recorders_queue.send_message(RecorderProgressMessage(VIDEO_2.video_id, 4096, 1024.0))
+        _wait_until(lambda: metrics.RECORDING_BYTES_WRITTEN.value(VIDEO_2.video_id) == 4096)
+
+        # then
+        self.assertEqual(metrics.RECORDING_BYTES_WRITTEN.value(VIDEO_2.video_id), 4096)
+        self.assertEqual(metrics.RECORDING_THROUGHPUT.value(VIDEO_2.video_id), 1024.0)
+
+
+def _wait_until(condition, timeout: float=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def _create_context():
+    context = MagicMock()
+    context.logger = create_autospec(logging.Logger, spec_set=True)
+    context.bus = EventBus()
+    return context
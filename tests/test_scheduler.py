@@ -0,0 +1,42 @@
+from datetime import datetime
+from unittest import TestCase
+
+from ytarchiver.scheduler import ChannelScheduler
+
+
+class ChannelSchedulerTest(TestCase):
+    def test_should_poll_active_channels_more_often(self):
+        # given
+        scheduler = ChannelScheduler(min_interval=60, max_interval=24 * 3600, default_interval=300)
+        now = datetime(2018, 6, 10, 12, 0, 0)
+
+        # when
+        hourly = scheduler.interval_for(
+            ['2018-06-10T11:30:00.000Z', '2018-06-10T10:30:00.000Z', '2018-06-10T09:30:00.000Z'],
+            now
+        )
+        yearly = scheduler.interval_for(['2018-01-01T00:00:00.000Z', '2017-01-01T00:00:00.000Z'], now)
+        unknown = scheduler.interval_for(['2018-06-10T11:30:00.000Z'], now)
+        stored_hourly = scheduler.interval_for([1528630200, 1528626600, 1528623000], now)
+
+        # then
+        self.assertEqual(hourly, 360)
+        self.assertEqual(stored_hourly, 360)
+        self.assertEqual(yearly, 24 * 3600)
+        self.assertEqual(unknown, 300)
+
+    def test_should_return_channels_in_order_of_due_time(self):
+        # given
+        scheduler = ChannelScheduler(min_interval=60, max_interval=3600, default_interval=300, jitter=0)
+
+        # when
+        scheduler.schedule('rare', 3000, now=1000)
+        scheduler.schedule('often', 100, now=1000)
+        scheduler.schedule('sometimes', 500, now=1000)
+
+        # then
+        self.assertEqual(scheduler.next_due_time(), 1100)
+        self.assertEqual(scheduler.pop_due_channels(1000), [])
+        self.assertEqual(scheduler.pop_due_channels(1600), ['often', 'sometimes'])
+        self.assertEqual(scheduler.pop_due_channels(5000), ['rare'])
+        self.assertIsNone(scheduler.next_due_time())
@@ -0,0 +1,224 @@
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+from unittest import TestCase
+
+from mock import MagicMock
+
+from ytarchiver.common import ContentItem
+from ytarchiver.index import SetVideosIndex, BloomFilterVideosIndex
+from ytarchiver.sqlite import Sqlite3Storage, Sqlite3StorageManager, MIGRATIONS
+
+
+def _video(video_id: str) -> ContentItem:
+    return ContentItem(
+        video_id=video_id,
+        channel_id='channel_id',
+        timestamp='2018-06-01T12:00:00.000Z',
+        title='video ' + video_id,
+        channel_name='some channel'
+    )
+
+
+class Sqlite3StorageTest(TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_should_find_existing_videos_without_index(self):
+        # given
+        storage = Sqlite3Storage(self.output_dir)
+        storage.add_video(_video('video1'))
+        storage.add_video(_video('video2'))
+
+        # when
+        existing = storage.find_existing_videos(['video1', 'video2', 'video3'])
+
+        # then
+        self.assertEqual(existing, {'video1', 'video2'})
+        self.assertTrue(storage.video_exist('video1'))
+        self.assertFalse(storage.video_exist('video3'))
+        storage.close()
+
+    def test_should_store_livestream_segments(self):
+        # given
+        storage = Sqlite3Storage(self.output_dir)
+        livestream = _video('livestream1')
+        livestream.filename = 'livestream.ts'
+        storage.add_livestream(livestream)
+
+        # when
+        storage.update_livestream_segments(livestream, ['livestream.ts', 'livestream_segment1.ts'])
+
+        # then
+        row = storage.connection.execute('SELECT segments FROM LIVESTREAMS WHERE video_id=?', ('livestream1',))
+        self.assertEqual(json.loads(row.fetchone()[0]), ['livestream.ts', 'livestream_segment1.ts'])
+        storage.close()
+
+    def test_should_migrate_database_created_without_schema_version(self):
+        # given
+        connection = sqlite3.connect(os.path.join(self.output_dir, Sqlite3Storage.STORAGE_FILE))
+        connection.execute(
+            'CREATE TABLE VIDEOS(video_id VARCHAR(16) PRIMARY KEY, channel_id VARCHAR(32), timestamp DATETIME, '
+            'title TEXT, channel_name TEXT, filename TEXT)'
+        )
+        connection.execute(
+            'CREATE TABLE LIVESTREAMS(id INTEGER PRIMARY KEY AUTOINCREMENT, video_id VARCHAR(16), '
+            'channel_id VARCHAR(32), timestamp DATETIME, title TEXT, channel_name TEXT, filename TEXT)'
+        )
+        connection.executemany(
+            'INSERT INTO VIDEOS(video_id, channel_id, timestamp, title) VALUES (?, ?, ?, ?)',
+            [
+                ('video1', 'channel_id', '2018-06-01T12:00:00.000Z', 'video 1'),
+                ('video2', 'channel_id', '2018-06-02T12:00:00Z', 'video 2')
+            ]
+        )
+        connection.commit()
+        connection.close()
+
+        # when
+        storage = Sqlite3Storage(self.output_dir)
+        storage.add_video(_video('video3'))
+
+        # then
+        version = storage.connection.execute('SELECT version FROM SCHEMA_VERSION').fetchone()[0]
+        indexes = {row[0] for row in storage.connection.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+        self.assertEqual(version, len(MIGRATIONS))
+        self.assertTrue({'VIDEOS_CHANNEL_TIMESTAMP', 'VIDEOS_TIMESTAMP', 'LIVESTREAMS_VIDEO_ID'} <= indexes)
+        self.assertEqual(storage.list_upload_timestamps('channel_id', 2), [1527940800, 1527854400])
+        self.assertEqual(
+            {video.video_id: video.timestamp for video in storage.list_videos()},
+            {'video1': '2018-06-01T12:00:00Z', 'video2': '2018-06-02T12:00:00Z', 'video3': '2018-06-01T12:00:00Z'}
+        )
+        storage.close()
+
+    def test_should_commit_writes_in_batches(self):
+        # given
+        storage = Sqlite3Storage(self.output_dir, batch_size=3, batch_interval=3600)
+        reader = Sqlite3Storage(self.output_dir, read_only=True)
+
+        # when
+        storage.add_video(_video('video1'))
+        storage.add_video(_video('video2'))
+        storage.commit()
+        visible_before_full_batch = [video.video_id for video in reader.list_videos()]
+        storage.add_video(_video('video3'))
+        storage.commit()
+        visible_after_full_batch = [video.video_id for video in reader.list_videos()]
+
+        # then
+        self.assertEqual(visible_before_full_batch, [])
+        self.assertEqual(visible_after_full_batch, ['video1', 'video2', 'video3'])
+        self.assertEqual(storage.find_existing_videos(['video1', 'video4']), {'video1'})
+        reader.close()
+        storage.close()
+
+    def test_should_ignore_videos_stored_before_crash_when_batch_is_replayed(self):
+        # given
+        storage = Sqlite3Storage(self.output_dir)
+        storage.add_video(_video('video1'))
+        storage.sync()
+        storage.connection.close()
+
+        # when
+        storage = Sqlite3Storage(self.output_dir)
+        storage.add_video(_video('video1'))
+        storage.add_video(_video('video2'))
+        storage.sync()
+
+        # then
+        self.assertEqual([video.video_id for video in storage.list_videos()], ['video1', 'video2'])
+        storage.close()
+
+    def test_should_sync_livestreams_and_finished_downloads_immediately(self):
+        # given
+        storage = Sqlite3Storage(self.output_dir, batch_size=1000, batch_interval=3600)
+        reader = Sqlite3Storage(self.output_dir, read_only=True)
+        livestream = _video('livestream1')
+        livestream.filename = 'livestream.ts'
+        storage.add_video(_video('video1'))
+        storage.set_download_progress('video1', 0, None)
+        storage.sync()
+
+        # when
+        storage.add_livestream(livestream)
+        storage.add_livestream(livestream)
+        storage.remove_download('video1')
+
+        # then
+        self.assertEqual([item.video_id for item in reader.list_livestreams()], ['livestream1'])
+        self.assertEqual(list(reader.list_incomplete_downloads()), [])
+        reader.close()
+        storage.close()
+
+    def test_should_load_index_and_keep_it_up_to_date(self):
+        for index in [SetVideosIndex(), BloomFilterVideosIndex(capacity=1000, error_rate=0.01)]:
+            # given
+            storage = Sqlite3Storage(self.output_dir)
+            storage.add_video(_video('video1'))
+            storage.close()
+
+            # when
+            storage = Sqlite3Storage(self.output_dir)
+            storage.load_index(index)
+            storage.add_video(_video('video2'))
+
+            # then
+            self.assertIn('video1', index)
+            self.assertIn('video2', index)
+            self.assertEqual(storage.find_existing_videos(['video1', 'video2', 'video3']), {'video1', 'video2'})
+            self.assertFalse(storage.video_exist('video3'))
+
+            storage.connection.execute('DELETE FROM VIDEOS')
+            storage.close()
+
+
+class Sqlite3StorageManagerTest(TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.config = MagicMock()
+        self.config.output_dir = self.output_dir
+        self.config.index_type = 'set'
+        self.config.write_batch_size = 1000
+        self.config.write_batch_interval = 5
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_should_keep_storage_open_between_lookups(self):
+        # given
+        manager = Sqlite3StorageManager()
+
+        # when
+        with manager.open(self.config) as storage:
+            storage.add_video(_video('video1'))
+        with manager.open(self.config) as second_storage:
+            pass
+
+        # then
+        self.assertIs(storage, second_storage)
+        self.assertEqual(
+            storage.connection.execute('PRAGMA journal_mode').fetchone()[0].lower(),
+            'wal'
+        )
+        manager.close()
+
+    def test_should_allow_reading_while_writer_is_open(self):
+        # given
+        manager = Sqlite3StorageManager()
+
+        # when
+        with manager.open(self.config) as storage:
+            storage.add_video(_video('video1'))
+        with manager.open(self.config) as storage:
+            storage.add_video(_video('video2'))
+            with manager.open_reader(self.config) as reader:
+                videos = [video.video_id for video in reader.list_videos()]
+
+        # then
+        self.assertEqual(videos, ['video1'])
+        manager.close()
@@ -1,11 +1,51 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Iterator, Optional, List
 
-from googleapiclient.discovery import build
-
+from ytarchiver import metrics
 from ytarchiver.common import ContentItem
+from ytarchiver.lazy import lazy_import
+from ytarchiver.quota import QuotaLedger
+
+googleapiclient_discovery = lazy_import('googleapiclient.discovery')
+googleapiclient_errors = lazy_import('googleapiclient.errors')
+googleapiclient_http = lazy_import('googleapiclient.http')
+httplib2 = lazy_import('httplib2')
+requests = lazy_import('requests')
+requests_adapters = lazy_import('requests.adapters')
 
 YOUTUBE_API_SERVICE_NAME = "youtube"
 YOUTUBE_API_VERSION = "v3"
+DISCOVERY_PATH = '/discovery/v1/apis/{api}/{apiVersion}/rest'
+DISCOVERY_BASE_URL = 'https://www.googleapis.com'
+DISCOVERY_CACHE_MAX_AGE_SEC = 24 * 60 * 60
+API_PATH = '/youtube/v3/'
+API_TIMEOUT_SEC = 60
+API_USER_AGENT = 'yt-archiver (gzip)'
+CHANNELS_LIST_MAX_IDS = 50
+PLAYLIST_ITEMS_MAX_RESULTS = 50
+VIDEOS_LIST_MAX_IDS = 50
+
+CHANNELS_LIST_COST = 1
+PLAYLIST_ITEMS_LIST_COST = 1
+SEARCH_LIST_COST = 100
+VIDEOS_LIST_COST = 1
+
+API_BACKEND_GOOGLEAPICLIENT = 'googleapiclient'
+API_BACKEND_HTTP = 'http'
+API_BACKENDS = [API_BACKEND_GOOGLEAPICLIENT, API_BACKEND_HTTP]
+
+# partial responses, limited to the fields which are read from every kind of response
+RESPONSE_FIELDS = {
+    'channels': 'items(id,contentDetails/relatedPlaylists/uploads)',
+    'search': 'items(id/videoId,snippet(publishedAt,title,channelTitle))',
+    'videos': 'items(id,snippet(channelId,publishedAt,title,channelTitle,liveBroadcastContent))',
+    'playlistItems': 'etag,nextPageToken,items/snippet(resourceId/videoId,channelId,publishedAt,title,channelTitle)'
+}
 
 
 class APIError(Exception):
@@ -26,42 +66,62 @@ class YoutubeChannel:
         self.uploads_playlist_id = uploads_playlist_id
 
 
+class UploadsPage:
+    """
+    Single page of videos uploaded by a channel, ordered from the newest one. Page requested with ETag of
+    the previous response is not_modified and empty, if nothing changed since then.
+    """
+    def __init__(self,
+                 items: List[ContentItem],
+                 next_page_token: Optional[str],
+                 etag: str=None,
+                 not_modified: bool=False):
+        self.items = items
+        self.next_page_token = next_page_token
+        self.etag = etag
+        self.not_modified = not_modified
+
+
 class YoutubeAPI:
     """
-    Object allowing to make API calls
+    Object allowing to make API calls. Methods might be called from multiple threads, every thread uses its own
+    HTTP connection. Cost of every call is charged to the quota ledger.
     """
-    def __init__(self, key: str):
+    def __init__(self, key: str, quota: QuotaLedger=None, base_url: str=None, discovery_cache_dir: str=None):
+        self.quota = quota or QuotaLedger()
+        self._local = threading.local()
         if key is not None:
-            self._service = build(
-                YOUTUBE_API_SERVICE_NAME,
-                YOUTUBE_API_VERSION,
-                developerKey=key,
-                cache_discovery=False
+            discovery_url = (base_url or DISCOVERY_BASE_URL).rstrip('/') + DISCOVERY_PATH.format(
+                api=YOUTUBE_API_SERVICE_NAME,
+                apiVersion=YOUTUBE_API_VERSION
+            )
+            self._service = googleapiclient_discovery.build_from_document(
+                load_discovery_document(discovery_url, discovery_cache_dir),
+                developerKey=key
             )
 
-    def find_channels(self, channels_ids_list: List[str]) -> Iterator[YoutubeChannel]:
+    def find_channels(self, channels_ids_list: List[str], concurrency: int=1) -> Iterator[YoutubeChannel]:
         """
-        Returns channels represented by given ids
+        Returns channels represented by given ids. IDs are requested in batches of 50, the API limit for
+        a single call.
 
         :param channels_ids_list: IDs of channels
+        :param concurrency: number of batches requested at the same time
         :return: channels data
         :exception APIError
         """
-        try:
-            request_for = ','.join(channels_ids_list)
+        batches = [
+            channels_ids_list[i:i + CHANNELS_LIST_MAX_IDS]
+            for i in range(0, len(channels_ids_list), CHANNELS_LIST_MAX_IDS)
+        ]
 
-            results = self._service.channels().list(
-                part="snippet,contentDetails",
-                id=request_for
-            ).execute()
-
-            for data in results['items']:
-                yield YoutubeChannel(
-                    data['id'],
-                    data['contentDetails']['relatedPlaylists']['uploads']
-                )
-        except Exception as e:
-            raise APIError(e)
+        if concurrency > 1 and len(batches) > 1:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                for channels in executor.map(self._find_channels_batch, batches):
+                    yield from channels
+        else:
+            for batch in batches:
+                yield from self._find_channels_batch(batch)
 
     def fetch_channel_livestream(self, channel: YoutubeChannel) -> Optional[ContentItem]:
         """
@@ -72,12 +132,14 @@ class YoutubeAPI:
         :exception APIError
         """
         try:
-            live_streams = self._service.search().list(
+            live_streams = self._list(
+                'search',
+                SEARCH_LIST_COST,
                 part="id,snippet",
                 channelId=channel.id,
                 type='video',
                 eventType='live'
-            ).execute()
+            )
 
             for stream in live_streams['items']:
                 return ContentItem(
@@ -92,6 +154,42 @@ class YoutubeAPI:
         except Exception as e:
             raise APIError(e)
 
+    def find_live_videos(self, videos_ids_list: List[str]) -> List[ContentItem]:
+        """
+        Returns those of given videos which are currently live broadcasts. IDs are requested in batches of 50,
+        each batch costs a single quota unit.
+
+        :param videos_ids_list: IDs of videos to check
+        :return: livestreams' data
+        :exception APIError
+        """
+        try:
+            live_streams = []
+            for i in range(0, len(videos_ids_list), VIDEOS_LIST_MAX_IDS):
+                results = self._list(
+                    'videos',
+                    VIDEOS_LIST_COST,
+                    part='snippet',
+                    id=','.join(videos_ids_list[i:i + VIDEOS_LIST_MAX_IDS]),
+                    maxResults=VIDEOS_LIST_MAX_IDS
+                )
+
+                for video in results.get('items', []):
+                    snippet = video['snippet']
+                    if snippet.get('liveBroadcastContent') != 'live':
+                        continue
+                    live_streams.append(ContentItem(
+                        video_id=video['id'],
+                        channel_id=snippet['channelId'],
+                        timestamp=snippet['publishedAt'],
+                        title=snippet['title'],
+                        channel_name=snippet['channelTitle']
+                    ))
+
+            return live_streams
+        except Exception as e:
+            raise APIError(e)
+
     def find_channel_uploaded_videos(self,
                                      channel: YoutubeChannel,
                                      find_all: bool=False) -> Iterator[ContentItem]:
@@ -103,27 +201,203 @@ class YoutubeAPI:
         :return: videos
         :exception APIError
         """
+        next_page_token = ''
+
+        while next_page_token is not None:
+            page = self.fetch_channel_uploads_page(channel, page_token=next_page_token)
+            yield from page.items
+            next_page_token = page.next_page_token if find_all else None
+
+    def fetch_channel_uploads_page(self,
+                                   channel: YoutubeChannel,
+                                   page_token: str='',
+                                   max_results: int=PLAYLIST_ITEMS_MAX_RESULTS,
+                                   etag: str=None) -> UploadsPage:
+        """
+        Returns single page of videos uploaded from given channel.
+
+        :param channel: channel to check
+        :param page_token: token of the page to fetch, empty string for the newest videos
+        :param max_results: size of the page, at most 50
+        :param etag: ETag of previously fetched page, if given the page is returned only if it changed
+        :return: page of videos along with the token of the next page and its ETag
+        :exception APIError
+        """
         try:
-            next_page_token = ''
+            playlistitems_response = self._list(
+                'playlistItems',
+                PLAYLIST_ITEMS_LIST_COST,
+                etag=etag,
+                playlistId=channel.uploads_playlist_id,
+                part='snippet',
+                maxResults=max_results,
+                pageToken=page_token
+            )
+            if playlistitems_response is None:
+                return UploadsPage([], None, etag=etag, not_modified=True)
 
-            while next_page_token is not None:
-                playlistitems_response = self._service.playlistItems().list(
-                    playlistId=channel.uploads_playlist_id,
-                    part='snippet',
-                    maxResults=50,
-                    pageToken=next_page_token
-                ).execute()
-
-                for playlist_item in playlistitems_response['items']:
-                    upload = playlist_item['snippet']
-                    yield ContentItem(
-                        video_id=upload['resourceId']['videoId'],
-                        channel_id=upload['channelId'],
-                        timestamp=upload['publishedAt'],
-                        title=upload['title'],
-                        channel_name=upload['channelTitle']
-                    )
-
-                next_page_token = playlistitems_response.get('nextPageToken') if find_all else None
+            items = []
+            for playlist_item in playlistitems_response['items']:
+                upload = playlist_item['snippet']
+                items.append(ContentItem(
+                    video_id=upload['resourceId']['videoId'],
+                    channel_id=upload['channelId'],
+                    timestamp=upload['publishedAt'],
+                    title=upload['title'],
+                    channel_name=upload['channelTitle']
+                ))
+
+            return UploadsPage(
+                items,
+                playlistitems_response.get('nextPageToken'),
+                etag=playlistitems_response.get('etag')
+            )
+        except Exception as e:
+            raise APIError(e)
+
+    def _find_channels_batch(self, channels_ids_list: List[str]) -> List[YoutubeChannel]:
+        try:
+            results = self._list(
+                'channels',
+                CHANNELS_LIST_COST,
+                part="contentDetails",
+                id=','.join(channels_ids_list),
+                maxResults=CHANNELS_LIST_MAX_IDS
+            )
+
+            return [
+                YoutubeChannel(
+                    data['id'],
+                    data['contentDetails']['relatedPlaylists']['uploads']
+                )
+                for data in results.get('items', [])
+            ]
         except Exception as e:
             raise APIError(e)
+
+    def _list(self, resource: str, cost: int, etag: str=None, **params) -> Optional[dict]:
+        method = resource + '.list'
+        self.quota.charge(method, cost)
+        metrics.API_CALLS.inc(method)
+        metrics.QUOTA_UNITS.inc(method, amount=cost)
+        started_at = time.monotonic()
+        try:
+            return self._send(resource, params, etag)
+        except Exception:
+            metrics.API_ERRORS.inc(method)
+            raise
+        finally:
+            metrics.API_LATENCY.observe(method, value=time.monotonic() - started_at)
+
+    def _send(self, resource: str, params: dict, etag: Optional[str]) -> Optional[dict]:
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = googleapiclient_http.build_http()
+            self._local.http = http
+        request = getattr(self._service, resource)().list(**params)
+        if etag is not None:
+            request.headers['If-None-Match'] = etag
+        try:
+            return request.execute(http=http)
+        except googleapiclient_errors.HttpError as e:
+            if e.resp.status == 304:
+                return None
+            raise
+
+
+class LightweightYoutubeAPI(YoutubeAPI):
+    """
+    YoutubeAPI calling the API directly over a pooled keep-alive HTTP session, instead of through objects generated
+    by googleapiclient. Responses are gzipped and trimmed to the fields which are actually read. The session is
+    shared by all threads.
+    """
+    def __init__(self, key: str, quota: QuotaLedger=None, base_url: str=None, pool_size: int=1):
+        super(LightweightYoutubeAPI, self).__init__(None, quota=quota)
+        self._key = key
+        self._url = (base_url or DISCOVERY_BASE_URL).rstrip('/') + API_PATH
+        self._session = requests.Session()
+        # proxies are resolved from environment once, instead of on every request
+        self._session.trust_env = False
+        self._session.proxies = requests.utils.get_environ_proxies(self._url)
+        self._session.headers.update({'Accept-Encoding': 'gzip', 'User-Agent': API_USER_AGENT})
+        adapter = requests_adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size, 1))
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+    def _send(self, resource: str, params: dict, etag: Optional[str]) -> Optional[dict]:
+        query = {name: value for name, value in params.items() if value != ''}
+        query['key'] = self._key
+        query['fields'] = RESPONSE_FIELDS[resource]
+        headers = {'If-None-Match': etag} if etag is not None else None
+        response = self._session.get(self._url + resource, params=query, headers=headers, timeout=API_TIMEOUT_SEC)
+        if response.status_code == 304:
+            return None
+        if response.status_code >= 400:
+            raise APIError('{} request failed with status {}: {}'.format(
+                resource,
+                response.status_code,
+                response.text
+            ))
+        return json.loads(response.content.decode('utf-8'))
+
+
+def load_discovery_document(url: str, cache_dir: str=None, max_age: int=DISCOVERY_CACHE_MAX_AGE_SEC) -> str:
+    """
+    Returns discovery document of the API. Document is stored in cache directory and downloaded again only after
+    it gets older than max_age. If download fails, cached document is used regardless of its age.
+
+    :param url: URL of the discovery document
+    :param cache_dir: directory to cache the document in, or None to always download it
+    :param max_age: max age of cached document (in seconds)
+    :return: content of the document
+    :exception APIError: document could not be downloaded and it's not cached
+    """
+    cache_path, cached = None, None
+    if cache_dir is not None:
+        cache_path = os.path.join(
+            cache_dir,
+            '.discovery_{}.json'.format(hashlib.sha1(url.encode('utf-8')).hexdigest())
+        )
+        cached = _read_discovery_cache(cache_path)
+        if cached is not None and time.time() - cached[1] < max_age:
+            return cached[0]
+
+    try:
+        document = _fetch_discovery_document(url)
+    except APIError:
+        if cached is not None:
+            return cached[0]
+        raise
+
+    if cache_path is not None:
+        _write_discovery_cache(cache_path, document)
+    return document
+
+
+def _fetch_discovery_document(url: str) -> str:
+    try:
+        response, content = googleapiclient_http.build_http().request(url)
+    except (httplib2.HttpLib2Error, OSError) as e:
+        raise APIError(e)
+    if response.status >= 400:
+        raise APIError('discovery document request failed with status {}'.format(response.status))
+    return content.decode('utf-8')
+
+
+def _read_discovery_cache(path: str):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read(), os.fstat(f.fileno()).st_mtime
+    except OSError:
+        return None
+
+
+def _write_discovery_cache(path: str, document: str):
+    temporary_path = path + '.tmp'
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(temporary_path, 'w', encoding='utf-8') as f:
+            f.write(document)
+        os.replace(temporary_path, path)
+    except OSError:
+        pass
@@ -1,9 +1,34 @@
 import argparse
 
+from ytarchiver.api import API_BACKENDS, API_BACKEND_GOOGLEAPICLIENT
+from ytarchiver.dispatch import DROP_POLICIES, DROP_POLICY_BLOCK
+from ytarchiver.index import INDEX_TYPES
+from ytarchiver.ratelimit import parse_bandwidth_schedule
+from ytarchiver.sqlite import DEFAULT_WRITE_BATCH_SIZE, DEFAULT_WRITE_BATCH_INTERVAL_SEC
+
 DEFAULT_REFRESH_TIME_SEC = 5 * 60  # 5 min
+DEFAULT_MIN_REFRESH_TIME_SEC = 30
+DEFAULT_MAX_REFRESH_TIME_SEC = 60 * 60  # 1 h
 DEFAULT_OUTPUT_DIRECTORY = './out'
 DEFAULT_ARCHIVE_ALL = False
 DEFAULT_MONITOR_LIVESTREAMS = False
+DEFAULT_LIVESTREAM_DETECTION = 'search'
+DEFAULT_DOWNLOAD_WORKERS = 2
+DEFAULT_DOWNLOAD_SEGMENTS = 1
+DEFAULT_MIN_SEGMENT_SIZE_MB = 8
+DEFAULT_LIVESTREAM_CHUNK_SIZE_KB = 4 * 1024
+DEFAULT_LIVESTREAM_BUFFERS = 4
+DEFAULT_RECONNECT_ATTEMPTS = 10
+DEFAULT_FSYNC_INTERVAL_SEC = 10
+DEFAULT_API_CONCURRENCY = 1
+DEFAULT_API_BACKEND = API_BACKEND_GOOGLEAPICLIENT
+DEFAULT_LOOKUP_ENGINE = 'serial'
+DEFAULT_EVENTS_QUEUE_SIZE = 1000
+DEFAULT_EVENTS_DROP_POLICY = DROP_POLICY_BLOCK
+DEFAULT_INDEX_TYPE = 'set'
+DEFAULT_INDEX_CAPACITY = 10 * 1000 * 1000
+DEFAULT_INDEX_ERROR_RATE = 0.001
+DEFAULT_RESPONSE_CACHE_SIZE = 10000
 
 
 def parse_command_line():
@@ -15,6 +40,38 @@ def parse_command_line():
         default=DEFAULT_REFRESH_TIME_SEC,
         type=int
     )
+    parser.add_argument(
+        '--adaptive',
+        dest='adaptive_polling',
+        help='poll every channel at its own interval, following how often it uploads, the interval stays between '
+             '--min-time and --max-time',
+        default=False,
+        action='store_true'
+    )
+    parser.add_argument(
+        '-b', '--budget',
+        dest='quota_budget',
+        help='daily API quota budget (in units), when given the time between lookups is adjusted to spread '
+             'the budget evenly until the quota reset, by default the time given with -t is always used',
+        default=None,
+        type=int
+    )
+    parser.add_argument(
+        '--min-time',
+        dest='min_refresh_time',
+        help='shortest allowed time between lookups when it is adjusted automatically (in seconds), default: ' +
+             str(DEFAULT_MIN_REFRESH_TIME_SEC),
+        default=DEFAULT_MIN_REFRESH_TIME_SEC,
+        type=int
+    )
+    parser.add_argument(
+        '--max-time',
+        dest='max_refresh_time',
+        help='longest allowed time between lookups when it is adjusted automatically (in seconds), default: ' +
+             str(DEFAULT_MAX_REFRESH_TIME_SEC),
+        default=DEFAULT_MAX_REFRESH_TIME_SEC,
+        type=int
+    )
     parser.add_argument(
         '-o', '--output',
         dest='output_dir',
@@ -36,6 +93,223 @@ def parse_command_line():
         default=DEFAULT_MONITOR_LIVESTREAMS,
         action='store_true'
     )
+    parser.add_argument(
+        '--livestream-detection',
+        dest='livestream_detection',
+        help='how livestreams are detected, "search" costs 100 quota units per channel, "uploads" checks the newest '
+             'uploads of all channels and costs 1 unit per 50 videos, default: ' + DEFAULT_LIVESTREAM_DETECTION,
+        choices=['search', 'uploads'],
+        default=DEFAULT_LIVESTREAM_DETECTION
+    )
+    parser.add_argument(
+        '--livestream-chunk-size',
+        dest='livestream_chunk_size',
+        help='size of a single read from a recorded livestream (in kilobytes), default: ' +
+             str(DEFAULT_LIVESTREAM_CHUNK_SIZE_KB),
+        default=DEFAULT_LIVESTREAM_CHUNK_SIZE_KB,
+        type=int
+    )
+    parser.add_argument(
+        '--livestream-buffers',
+        dest='livestream_buffers',
+        help='number of chunks buffered between reading and writing a livestream, default: ' +
+             str(DEFAULT_LIVESTREAM_BUFFERS),
+        default=DEFAULT_LIVESTREAM_BUFFERS,
+        type=int
+    )
+    parser.add_argument(
+        '--fsync-interval',
+        dest='fsync_interval',
+        help='time between forced writes of recorded livestreams to disk (in seconds), 0 leaves it to the operating '
+             'system, default: ' + str(DEFAULT_FSYNC_INTERVAL_SEC),
+        default=DEFAULT_FSYNC_INTERVAL_SEC,
+        type=float
+    )
+    parser.add_argument(
+        '--reconnect-attempts',
+        dest='reconnect_attempts',
+        help='number of attempts to reconnect to an interrupted livestream before giving up, default: ' +
+             str(DEFAULT_RECONNECT_ATTEMPTS),
+        default=DEFAULT_RECONNECT_ATTEMPTS,
+        type=int
+    )
+    parser.add_argument(
+        '-w', '--workers',
+        dest='download_workers',
+        help='number of videos downloaded concurrently, 0 downloads on the lookup thread, default: ' +
+             str(DEFAULT_DOWNLOAD_WORKERS),
+        default=DEFAULT_DOWNLOAD_WORKERS,
+        type=int
+    )
+    parser.add_argument(
+        '--segments',
+        dest='download_segments',
+        help='number of parallel connections used to download a single video, default: ' +
+             str(DEFAULT_DOWNLOAD_SEGMENTS),
+        default=DEFAULT_DOWNLOAD_SEGMENTS,
+        type=int
+    )
+    parser.add_argument(
+        '--min-segment-size',
+        dest='min_segment_size',
+        help='minimal size of a single segment of a video downloaded over parallel connections (in megabytes), '
+             'default: ' + str(DEFAULT_MIN_SEGMENT_SIZE_MB),
+        default=DEFAULT_MIN_SEGMENT_SIZE_MB,
+        type=int
+    )
+    parser.add_argument(
+        '--bandwidth-limit',
+        dest='bandwidth_limit',
+        help='combined bandwidth of all downloads and recordings (in kilobytes per second), 0 means no limit, '
+             'default: 0',
+        default=0,
+        type=int
+    )
+    parser.add_argument(
+        '--video-bandwidth-limit',
+        dest='video_bandwidth_limit',
+        help='combined bandwidth of video downloads (in kilobytes per second), 0 means no limit, default: 0',
+        default=0,
+        type=int
+    )
+    parser.add_argument(
+        '--livestream-bandwidth-limit',
+        dest='livestream_bandwidth_limit',
+        help='combined bandwidth of livestream recordings (in kilobytes per second), 0 means no limit, default: 0',
+        default=0,
+        type=int
+    )
+    parser.add_argument(
+        '--bandwidth-schedule',
+        dest='bandwidth_schedule',
+        help='combined bandwidth limits for given times of day, overriding --bandwidth-limit, '
+             'in format HH:MM-HH:MM=KB/s separated by commas, such as "08:00-23:00=1024"',
+        default=None,
+        type=_bandwidth_schedule
+    )
+    parser.add_argument(
+        '--api-concurrency',
+        dest='api_concurrency',
+        help='number of API requests issued at the same time, default: ' + str(DEFAULT_API_CONCURRENCY),
+        default=DEFAULT_API_CONCURRENCY,
+        type=int
+    )
+    parser.add_argument(
+        '--api-backend',
+        dest='api_backend',
+        help='how API is called, "googleapiclient" uses the official client library, "http" sends gzipped requests '
+             'for partial responses over a pooled keep-alive session, default: ' + DEFAULT_API_BACKEND,
+        choices=API_BACKENDS,
+        default=DEFAULT_API_BACKEND
+    )
+    parser.add_argument(
+        '--engine',
+        dest='lookup_engine',
+        help='how channels are checked during a lookup, "serial" checks one channel after another, "concurrent" checks '
+             'up to --api-concurrency channels at the same time, default: ' + DEFAULT_LOOKUP_ENGINE,
+        choices=['serial', 'concurrent'],
+        default=DEFAULT_LOOKUP_ENGINE
+    )
+    parser.add_argument(
+        '--index',
+        dest='index_type',
+        help='in-memory index of archived videos, "set" is exact, "bloom" has bounded memory usage and falls back '
+             'to the database on possible matches, default: ' + DEFAULT_INDEX_TYPE,
+        choices=INDEX_TYPES,
+        default=DEFAULT_INDEX_TYPE
+    )
+    parser.add_argument(
+        '--index-capacity',
+        dest='index_capacity',
+        help='expected number of archived videos, used to size the bloom index, default: ' +
+             str(DEFAULT_INDEX_CAPACITY),
+        default=DEFAULT_INDEX_CAPACITY,
+        type=int
+    )
+    parser.add_argument(
+        '--index-error-rate',
+        dest='index_error_rate',
+        help='false positive rate of the bloom index, default: ' + str(DEFAULT_INDEX_ERROR_RATE),
+        default=DEFAULT_INDEX_ERROR_RATE,
+        type=float
+    )
+    parser.add_argument(
+        '--write-batch-size',
+        dest='write_batch_size',
+        help='number of database writes committed in a single transaction, default: ' +
+             str(DEFAULT_WRITE_BATCH_SIZE),
+        default=DEFAULT_WRITE_BATCH_SIZE,
+        type=int
+    )
+    parser.add_argument(
+        '--write-batch-interval',
+        dest='write_batch_interval',
+        help='max time writes wait for their transaction to be committed (in seconds), database is also synced '
+             'at the end of every lookup, default: ' + str(DEFAULT_WRITE_BATCH_INTERVAL_SEC),
+        default=DEFAULT_WRITE_BATCH_INTERVAL_SEC,
+        type=float
+    )
+    parser.add_argument(
+        '--response-cache-size',
+        dest='response_cache_size',
+        help='number of ETags of uploads pages remembered, channels with unchanged newest uploads are skipped, '
+             '0 disables the cache, default: ' + str(DEFAULT_RESPONSE_CACHE_SIZE),
+        default=DEFAULT_RESPONSE_CACHE_SIZE,
+        type=int
+    )
+    parser.add_argument(
+        '--base-url',
+        dest='base_url',
+        help='address of a server replacing YouTube API, video hosting and livestreams, such as the fake server '
+             'from benchmarks, used for testing',
+        default=None,
+        type=str
+    )
+    parser.add_argument(
+        '--profile',
+        dest='profile',
+        help='log time spent in every stage of lookups, in total and per channel',
+        default=False,
+        action='store_true'
+    )
+    parser.add_argument(
+        '--profile-dump',
+        dest='profile_dump',
+        help='with --profile, save cProfile statistics of given number of the slowest lookups to "profiles" '
+             'subdirectory of the output directory, default: 0',
+        default=0,
+        type=int
+    )
+    parser.add_argument(
+        '--metrics-port',
+        dest='metrics_port',
+        help='expose metrics in Prometheus format over HTTP on given port, disabled by default',
+        default=None,
+        type=int
+    )
+    parser.add_argument(
+        '--threaded-events',
+        dest='threaded_events',
+        help='deliver events to plugins from background threads as soon as they happen, every plugin gets its own '
+             'queue, by default events are delivered at the end of every lookup',
+        default=False,
+        action='store_true'
+    )
+    parser.add_argument(
+        '--events-queue-size',
+        dest='events_queue_size',
+        help='capacity of every queue of events when they are delivered from background threads, default: ' +
+             str(DEFAULT_EVENTS_QUEUE_SIZE),
+        default=DEFAULT_EVENTS_QUEUE_SIZE,
+        type=int
+    )
+    parser.add_argument(
+        '--events-drop-policy',
+        dest='events_drop_policy',
+        help='what happens when a queue of events is full, default: ' + DEFAULT_EVENTS_DROP_POLICY,
+        choices=DROP_POLICIES,
+        default=DEFAULT_EVENTS_DROP_POLICY
+    )
     parser.add_argument(
         '-k', '--key',
         dest='api_key',
@@ -65,3 +339,11 @@ def parse_command_line():
 
     config = parser.parse_args()
     return config
+
+
+def _bandwidth_schedule(value: str) -> str:
+    try:
+        parse_bandwidth_schedule(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid bandwidth schedule "{}"'.format(value))
+    return value
@@ -0,0 +1,114 @@
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+from ytarchiver import metrics
+
+RESPONSE_CACHE_FILE = 'response_cache.json'
+
+
+class CachedResponse:
+    """
+    ETag of an API response, along with IDs of videos it contained
+    """
+    def __init__(self, etag: str, videos_ids: List[str]):
+        self.etag = etag
+        self.videos_ids = videos_ids
+
+
+class ResponseCache:
+    """
+    Remembers ETags of API responses, keyed by parameters of the request, so the same request is able to ask
+    for the response only if it changed. Holds at most capacity responses, the least recently used ones are evicted.
+    Is able to persist its state, so ETags survive restarts. Counts hits (unchanged responses) and misses.
+    """
+
+    def __init__(self, path: str=None, capacity: int=10000):
+        self.path = path
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._responses = OrderedDict()
+
+        if path is not None and os.path.isfile(path):
+            self._load()
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        """
+        Returns cached response and marks it as recently used
+
+        :param key: parameters of the request
+        :return: cached response or None
+        """
+        with self._lock:
+            response = self._responses.get(key)
+            if response is not None:
+                self._responses.move_to_end(key)
+            return response
+
+    def put(self, key: str, response: CachedResponse):
+        """
+        Stores response, evicting the least recently used one if the cache is full
+
+        :param key: parameters of the request
+        :param response: response to store
+        """
+        with self._lock:
+            self._responses[key] = response
+            self._responses.move_to_end(key)
+            while len(self._responses) > self.capacity:
+                self._responses.popitem(last=False)
+
+    def notify_hit(self):
+        with self._lock:
+            self.hits += 1
+        metrics.RESPONSE_CACHE_HITS.inc()
+
+    def notify_miss(self):
+        with self._lock:
+            self.misses += 1
+        metrics.RESPONSE_CACHE_MISSES.inc()
+
+    def hit_rate(self) -> float:
+        with self._lock:
+            requests = self.hits + self.misses
+            return self.hits / requests if requests > 0 else 0.0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._responses)
+
+    def save(self):
+        """
+        Writes cached responses to the file given at creation
+        """
+        if self.path is None:
+            return
+
+        with self._lock:
+            document = {
+                'responses': [
+                    [key, response.etag, response.videos_ids]
+                    for key, response in self._responses.items()
+                ]
+            }
+
+        temporary_path = self.path + '.tmp'
+        with open(temporary_path, 'w') as f:
+            json.dump(document, f)
+        os.replace(temporary_path, self.path)
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                document = json.load(f)
+        except (ValueError, OSError):
+            logging.getLogger('ytarchiver').exception('unable to read response cache, starting with empty cache')
+            return
+
+        for key, etag, videos_ids in document.get('responses', [])[-self.capacity:]:
+            self._responses[key] = CachedResponse(etag, videos_ids)
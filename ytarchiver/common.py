@@ -1,7 +1,8 @@
 import logging
 from abc import ABCMeta, abstractmethod
+from collections import deque
 from datetime import datetime
-from typing import Iterator
+from typing import Iterator, List, Set, Dict, Optional, Tuple
 
 
 class ContentItem:
@@ -40,6 +41,24 @@ class ContentItem:
         return self.video_id == other.video_id
 
 
+class ChannelWatermark:
+    """
+    Progress of archiving single channel: the newest archived video and the state of historical backfill
+    """
+
+    def __init__(self,
+                 channel_id: str,
+                 video_id: str=None,
+                 timestamp: str=None,
+                 backfill_page_token: str=None,
+                 backfill_complete: bool=False):
+        self.channel_id = channel_id
+        self.video_id = video_id
+        self.timestamp = timestamp
+        self.backfill_page_token = backfill_page_token
+        self.backfill_complete = backfill_complete
+
+
 class RecordersController(metaclass=ABCMeta):
     """
     Abstraction used to schedule and control recordings of various types of content
@@ -79,6 +98,10 @@ class Storage(metaclass=ABCMeta):
     def video_exist(self, video_id: str):
         pass
 
+    @abstractmethod
+    def find_existing_videos(self, video_ids: List[str]) -> Set[str]:
+        pass
+
     @abstractmethod
     def add_video(self, entry: 'ContentItem'):
         pass
@@ -87,10 +110,58 @@ class Storage(metaclass=ABCMeta):
     def add_livestream(self, entry: 'ContentItem'):
         pass
 
+    @abstractmethod
+    def update_livestream_segments(self, entry: 'ContentItem', segments: List[str]):
+        pass
+
+    @abstractmethod
+    def find_uploads_playlists(self, channels_ids: List[str]) -> Dict[str, str]:
+        pass
+
+    @abstractmethod
+    def add_channel(self, channel_id: str, uploads_playlist_id: str):
+        pass
+
+    @abstractmethod
+    def list_upload_timestamps(self, channel_id: str, limit: int) -> List[int]:
+        pass
+
+    @abstractmethod
+    def get_watermark(self, channel_id: str) -> Optional[ChannelWatermark]:
+        pass
+
+    @abstractmethod
+    def set_watermark(self, watermark: ChannelWatermark):
+        pass
+
+    @abstractmethod
+    def get_download_progress(self, video_id: str) -> Optional[Tuple[int, Optional[int]]]:
+        pass
+
+    @abstractmethod
+    def set_download_progress(self, video_id: str, offset: int, total_size: Optional[int]):
+        pass
+
+    @abstractmethod
+    def add_download_failure(self, video_id: str) -> int:
+        pass
+
+    @abstractmethod
+    def remove_download(self, video_id: str):
+        pass
+
+    @abstractmethod
+    def list_incomplete_downloads(self) -> Iterator[ContentItem]:
+        pass
+
     @abstractmethod
     def commit(self):
         pass
 
+    @abstractmethod
+    def sync(self):
+        pass
+
 
 class StorageManager(metaclass=ABCMeta):
     """
@@ -101,6 +172,14 @@ class StorageManager(metaclass=ABCMeta):
     def open(self, config) -> Storage:
         pass
 
+    @abstractmethod
+    def open_reader(self, config) -> Storage:
+        pass
+
+    @abstractmethod
+    def close(self):
+        pass
+
 
 class Event:
     """
@@ -122,19 +201,25 @@ class Event:
 
 class EventBus:
     """
-    EventBus collects and stores events from entire system
+    EventBus collects and stores events from entire system. Events are retrieved in the order they were added.
     """
 
     def __init__(self):
-        self._queue = []
+        self._queue = deque()
+
+    def begin_cycle(self, is_first_run: bool):
+        pass
 
     def retrieve_events(self) -> Iterator[Event]:
         while len(self._queue) > 0:
-            yield self._queue.pop()
+            yield self._queue.popleft()
 
     def add_event(self, event: Event):
         self._queue.append(event)
 
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
 
 class Plugin(metaclass=ABCMeta):
     """
@@ -175,7 +260,9 @@ class Context:
                  livestream_recorders_controller: RecordersController,
                  storage_manager: StorageManager,
                  bus: EventBus,
-                 plugins: PluginsManager):
+                 plugins: PluginsManager,
+                 bandwidth_limiter=None,
+                 response_cache=None):
         self.config = config
         self.logger = logger
         self.api = api
@@ -184,3 +271,5 @@ class Context:
         self.storage = storage_manager
         self.bus = bus
         self.plugins = plugins
+        self.bandwidth_limiter = bandwidth_limiter
+        self.response_cache = response_cache
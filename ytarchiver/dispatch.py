@@ -0,0 +1,174 @@
+import logging
+import queue
+import threading
+import time
+from typing import Iterator
+
+from ytarchiver import metrics
+from ytarchiver.common import EventBus, Event, PluginsManager, Plugin
+
+DROP_POLICY_BLOCK = 'block'
+DROP_POLICY_DROP_NEWEST = 'drop-newest'
+DROP_POLICY_DROP_OLDEST = 'drop-oldest'
+DROP_POLICIES = [DROP_POLICY_BLOCK, DROP_POLICY_DROP_NEWEST, DROP_POLICY_DROP_OLDEST]
+
+
+class DispatchQueue:
+    """
+    Bounded FIFO queue of events consumed by a single worker thread. When the queue is full, the drop policy
+    decides whether the producer waits, the new event is dropped or the oldest queued event is dropped.
+    Counts published, delivered and dropped events along with delivery latency, and exposes them as metrics
+    labeled with the name of the queue.
+    """
+
+    def __init__(self, name: str, deliver, max_size: int, drop_policy: str):
+        self.name = name
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self._deliver = deliver
+        self._drop_policy = drop_policy
+        self._queue = queue.Queue(maxsize=max_size)
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger('ytarchiver')
+        self._worker = threading.Thread(name='ytarchiver-' + name, target=self._deliver_forever, daemon=True)
+        self._worker.start()
+
+    def put(self, event: Event, is_first_run: bool):
+        entry = (event, is_first_run, time.time())
+        with self._lock:
+            self.published += 1
+        metrics.DISPATCH_PUBLISHED.inc(self.name)
+
+        if self._drop_policy == DROP_POLICY_BLOCK:
+            self._queue.put(entry)
+            self._update_depth()
+            return
+
+        while True:
+            try:
+                self._queue.put_nowait(entry)
+                self._update_depth()
+                return
+            except queue.Full:
+                if self._drop_policy == DROP_POLICY_DROP_NEWEST:
+                    self._count_dropped()
+                    return
+            try:
+                self._queue.get_nowait()
+                self._queue.task_done()
+                self._count_dropped()
+            except queue.Empty:
+                pass
+
+    def join(self):
+        """
+        Blocks until all queued events are delivered
+        """
+        self._queue.join()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'published': self.published,
+                'delivered': self.delivered,
+                'dropped': self.dropped,
+                'average_latency': self.total_latency / self.delivered if self.delivered > 0 else 0.0,
+                'max_latency': self.max_latency
+            }
+
+    def _update_depth(self):
+        metrics.DISPATCH_QUEUE_DEPTH.set(self.name, value=self._queue.qsize())
+
+    def _count_dropped(self):
+        with self._lock:
+            self.dropped += 1
+        metrics.DISPATCH_DROPPED.inc(self.name)
+        self._logger.error('{}: queue is full, event dropped'.format(self.name))
+
+    def _deliver_forever(self):
+        while True:
+            event, is_first_run, published_at = self._queue.get()
+            self._update_depth()
+            try:
+                self._deliver(event, is_first_run)
+            except Exception:
+                self._logger.exception('{}: error while delivering event'.format(self.name))
+            finally:
+                latency = time.time() - published_at
+                with self._lock:
+                    self.delivered += 1
+                    self.total_latency += latency
+                    self.max_latency = max(self.max_latency, latency)
+                metrics.DISPATCH_DELIVERED.inc(self.name)
+                metrics.DISPATCH_LATENCY.observe(self.name, value=latency)
+                self._queue.task_done()
+
+
+class ThreadedPluginsManager(PluginsManager):
+    """
+    Plugins manager which gives every plugin its own queue and worker thread, so a slow plugin does not delay
+    the others
+    """
+
+    def __init__(self, max_queue_size: int, drop_policy: str):
+        super(ThreadedPluginsManager, self).__init__()
+        self._max_queue_size = max_queue_size
+        self._drop_policy = drop_policy
+        self._queues = []
+
+    def register_plugin(self, plugin: Plugin):
+        super(ThreadedPluginsManager, self).register_plugin(plugin)
+        self._queues.append(DispatchQueue(
+            'plugin-{}-{}'.format(len(self._queues), type(plugin).__name__),
+            plugin.on_event,
+            self._max_queue_size,
+            self._drop_policy
+        ))
+
+    def on_event(self, event: Event, is_first_run: bool):
+        for plugin_queue in self._queues:
+            plugin_queue.put(event, is_first_run)
+
+    def join(self):
+        for plugin_queue in self._queues:
+            plugin_queue.join()
+
+    def stats(self) -> dict:
+        """
+        :return: statistics of queues of all plugins, by the name of the queue
+        """
+        return {plugin_queue.name: plugin_queue.stats() for plugin_queue in self._queues}
+
+
+class ThreadedEventBus(EventBus):
+    """
+    EventBus which delivers every event to plugins from a dispatcher thread as soon as it is added, instead of
+    collecting events until the end of the lookup
+    """
+
+    def __init__(self, plugins: PluginsManager, max_queue_size: int, drop_policy: str):
+        super(ThreadedEventBus, self).__init__()
+        self._is_first_run = True
+        self._dispatch_queue = DispatchQueue('event-dispatcher', plugins.on_event, max_queue_size, drop_policy)
+
+    def begin_cycle(self, is_first_run: bool):
+        self._is_first_run = is_first_run
+
+    def retrieve_events(self) -> Iterator[Event]:
+        return iter([])
+
+    def add_event(self, event: Event):
+        self._dispatch_queue.put(event, self._is_first_run)
+
+    def queue_depth(self) -> int:
+        return self._dispatch_queue.stats()['queue_depth']
+
+    def join(self):
+        self._dispatch_queue.join()
+
+    def stats(self) -> dict:
+        return self._dispatch_queue.stats()
@@ -1,18 +1,43 @@
+import io
 import logging
 import os
+import queue
+import threading
 import time
 
-import streamlink
 from datetime import datetime
-from pytube import YouTube
-from pytube.helpers import safe_filename
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+from typing import Callable, List, Optional, Tuple, Union
 
-from ytarchiver.common import ContentItem, Context
+from ytarchiver import metrics
+from ytarchiver.common import ContentItem, Context, Storage
+from ytarchiver.lazy import lazy_import
+from ytarchiver.ratelimit import BandwidthLimiter, PRIORITY_VIDEO, PRIORITY_LIVESTREAM
+
+pytube = lazy_import('pytube')
+pytube_helpers = lazy_import('pytube.helpers')
+requests = lazy_import('requests')
+streamlink = lazy_import('streamlink')
+streamlink_exceptions = lazy_import('streamlink.exceptions')
 
 YOUTUBE_URL_PREFIX = 'https://www.youtube.com/watch?v='
 SUPPORTED_LIVESTREAM_RESOLUTIONS = ['720p', '480p', '360p', '240p', '144p']
 MEGABYTE = 1024 * 1024
 LIVESTREAM_CHUNK_SIZE = 4 * MEGABYTE
+LIVESTREAM_BUFFERS = 4
+PART_FILE_SUFFIX = '.part'
+VIDEO_DOWNLOAD_CHUNK_SIZE = MEGABYTE
+VIDEO_DOWNLOAD_PROGRESS_INTERVAL = 16 * MEGABYTE
+VIDEO_DOWNLOAD_ATTEMPTS = 3
+VIDEO_DOWNLOAD_MAX_FAILURES = 5
+VIDEO_DOWNLOAD_TIMEOUT_SEC = 30
+SEGMENT_PROGRESS_CHECK_SEC = 1
+LIVESTREAM_FSYNC_INTERVAL_SEC = 10
+LIVESTREAM_PROGRESS_INTERVAL_SEC = 60
+LIVESTREAM_REPORT_INTERVAL_SEC = 10
+LIVESTREAM_MAX_RECONNECTS = 10
+LIVESTREAM_RECONNECT_BACKOFF_SEC = 1
+LIVESTREAM_MAX_RECONNECT_BACKOFF_SEC = 30
 
 
 class DownloadError(Exception):
@@ -38,6 +63,10 @@ class LivestreamInterrupted(Exception):
 def download_video(context: Context, video: ContentItem):
     """
     Starts downloading specified video to disk. Blocks.
+    Video is written to a partial file first and its progress is saved in the storage, so an interrupted download is
+    resumed from the last saved offset. Complete file is atomically renamed to its final name.
+    Large videos might be split into config.download_segments byte ranges, downloaded over parallel connections.
+    Failed downloads are counted, after VIDEO_DOWNLOAD_MAX_FAILURES failures the video is not resumed anymore.
 
     :param context: execution context
     :param video: video to download
@@ -48,56 +77,221 @@ def download_video(context: Context, video: ContentItem):
             context=context,
             video=video
         )
-        yt = YouTube(
-            YOUTUBE_URL_PREFIX + video.video_id,
-            on_complete_callback=download_callback.on_complete,
-            on_progress_callback=download_callback.on_progress
-        )
-
-        streams = yt.streams.all()
-        stream = _choose_best_video_stream(streams)
+        stream = _resolve_video_stream(context, video)
         download_callback.total_video_size = stream.filesize
-
-        context.logger.info('started downloading video "{}"'.format(video.title))
-        stream.download(
-            output_path=os.path.dirname(video.filename),
-            filename=os.path.splitext(os.path.basename(video.filename))[0]
-        )
+        part_filename = video.filename + PART_FILE_SUFFIX
+
+        with context.storage.open(context.config) as storage:
+            offset = _resume_offset(storage, video, part_filename, stream.filesize)
+            if offset > 0:
+                context.logger.info('resuming download of video "{}" from {:.2f} MB'.format(
+                    video.title,
+                    offset / MEGABYTE
+                ))
+            else:
+                context.logger.info('started downloading video "{}"'.format(video.title))
+
+            # part file might be complete already, if the download was interrupted right before the rename
+            if stream.filesize is None or offset < stream.filesize:
+                _download_part_file(context, stream, part_filename, offset, storage, video, download_callback)
+
+            os.replace(part_filename, video.filename)
+            storage.remove_download(video.video_id)
+            download_callback.on_complete()
     except Exception as e:
+        _register_failure(context, video)
         raise DownloadError(video.title, e)
 
 
-def download_livestream(livestream: ContentItem, logger: logging.Logger):
+def _download_part_file(context: Context,
+                        stream: '_VideoStream',
+                        part_filename: str,
+                        offset: int,
+                        storage: Storage,
+                        video: ContentItem,
+                        download_callback: '_VideoDownloadCallback'):
+    segments = context.config.download_segments
+    min_segment_size = context.config.min_segment_size * MEGABYTE
+    attempt = 1
+    while True:
+        try:
+            if _should_split(stream.filesize, offset, segments, min_segment_size):
+                _download_segmented(stream.url, part_filename, offset, stream.filesize, segments,
+                                    min_segment_size, storage, video, download_callback,
+                                    context.bandwidth_limiter)
+            else:
+                _download_to_part_file(stream.url, part_filename, offset, stream.filesize, storage, video,
+                                       download_callback, context.bandwidth_limiter)
+            return
+        except _RangesNotSupported:
+            context.logger.info('server does not support ranges, downloading video "{}" sequentially'.format(
+                video.title
+            ))
+            segments = 1
+        except _DownloadInterrupted as e:
+            if attempt == VIDEO_DOWNLOAD_ATTEMPTS:
+                raise e.cause
+            attempt += 1
+            offset = e.offset
+            context.logger.error('download of video "{}" interrupted at {:.2f} MB, resuming'.format(
+                video.title,
+                offset / MEGABYTE
+            ))
+
+
+def _register_failure(context: Context, video: ContentItem):
+    try:
+        with context.storage.open(context.config) as storage:
+            failures = storage.add_download_failure(video.video_id)
+            if failures < VIDEO_DOWNLOAD_MAX_FAILURES:
+                return
+            storage.remove_download(video.video_id)
+        context.logger.error('giving up download of video "{}" after {} failures'.format(video.title, failures))
+        if video.filename is not None and os.path.isfile(video.filename + PART_FILE_SUFFIX):
+            os.remove(video.filename + PART_FILE_SUFFIX)
+    except Exception:
+        context.logger.exception('error while registering failed download of video "{}"'.format(video.title))
+
+
+class _VideoStream:
+    def __init__(self, url: str, filesize: Optional[int]):
+        self.url = url
+        self.filesize = filesize
+
+
+def _resolve_video_stream(context: Context, video: ContentItem) -> _VideoStream:
+    base_url = context.config.base_url
+    if base_url:
+        url = '{}/media/{}.mp4'.format(base_url.rstrip('/'), video.video_id)
+        response = requests.head(url, timeout=VIDEO_DOWNLOAD_TIMEOUT_SEC)
+        response.raise_for_status()
+        length = response.headers.get('Content-Length')
+        return _VideoStream(url, int(length) if length is not None else None)
+
+    yt = pytube.YouTube(YOUTUBE_URL_PREFIX + video.video_id)
+    stream = _choose_best_video_stream(yt.streams.all())
+    return _VideoStream(stream.url, stream.filesize)
+
+
+class RecordingStatistics:
+    """
+    Throughput counters of a single recording
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.chunks = 0
+        self.fsyncs = 0
+
+    def throughput(self) -> float:
+        """
+        :return: average write throughput since the recording started (in bytes per second)
+        """
+        elapsed = time.time() - self.started_at
+        return self.bytes_written / elapsed if elapsed > 0 else 0.0
+
+    def __str__(self):
+        return '{:.2f} MB written in {} chunks, {:.2f} MB/s, {} fsyncs'.format(
+            self.bytes_written / MEGABYTE,
+            self.chunks,
+            self.throughput() / MEGABYTE,
+            self.fsyncs
+        )
+
+
+def download_livestream(livestream: ContentItem,
+                        logger: logging.Logger,
+                        chunk_size: int=LIVESTREAM_CHUNK_SIZE,
+                        buffers: int=LIVESTREAM_BUFFERS,
+                        fsync_interval: float=LIVESTREAM_FSYNC_INTERVAL_SEC,
+                        max_reconnects: int=LIVESTREAM_MAX_RECONNECTS,
+                        on_segment_started: Callable[[str], None]=None,
+                        limiter: BandwidthLimiter=None,
+                        on_progress: Callable[['RecordingStatistics'], None]=None,
+                        base_url: str=None):
     """
     Starts recording given livestream. Blocks until the stream is finished or error occurs.
+    Stream is read and written to disk by separate threads, which exchange a fixed pool of reusable buffers.
+    When the connection is lost, recorder reconnects with growing delay for as long as the broadcast is live.
+    Every reconnection starts a new numbered segment file. Stream which ends without an error is considered finished.
 
     :param livestream: livestream to record
     :param logger: logger to write error messages to
+    :param chunk_size: size of a single buffer (in bytes)
+    :param buffers: number of buffers in the pool
+    :param fsync_interval: time between forced writes to disk (in seconds), 0 disables them
+    :param max_reconnects: number of consecutive reconnections without receiving any data before giving up
+    :param on_segment_started: called with the name of every new segment file
+    :param limiter: limiter of the bandwidth shared with other recorders
+    :param on_progress: called periodically with statistics of the recording
+    :param base_url: address of a server replacing YouTube, serving livestreams as HLS playlists
     :exception DownloadError
     :exception LivestreamInterrupted
     """
-    try:
-        url = YOUTUBE_URL_PREFIX + livestream.video_id
-        available_streams = streamlink.api.streams(url)
-        best_resolution = _choose_best_livestream_resolution(available_streams)
-        if best_resolution is None:
-            logger.error('no supported resolution found for "{}"'.format(livestream.title))
-            return
-
-        stream = available_streams[best_resolution]
+    url = YOUTUBE_URL_PREFIX + livestream.video_id
+    if base_url:
+        url = 'hlsvariant://{}/live/{}/master.m3u8'.format(base_url.rstrip('/'), livestream.video_id)
+    statistics = RecordingStatistics()
+    segment = 0
+    reconnects = 0
+    backoff = LIVESTREAM_RECONNECT_BACKOFF_SEC
 
-        logging.error('recording {}:{} stream of "{}"'.format(stream.shortname(), best_resolution, livestream.title))
-        with open(livestream.filename, 'wb') as out:
-            with stream.open() as handle:
-                while True:
-                    buffer = handle.read(LIVESTREAM_CHUNK_SIZE)
-                    out.write(buffer)
-                    out.flush()
-                    time.sleep(0)
-    except (IOError, EOFError) as e:
-        raise LivestreamInterrupted(livestream.title, e)
+    try:
+        while True:
+            written_before = statistics.bytes_written
+            interruption = None
+            try:
+                available_streams = streamlink.api.streams(url)
+                best_resolution = _choose_best_livestream_resolution(available_streams)
+                if best_resolution is None:
+                    if segment == 0 and reconnects == 0:
+                        logger.error('no supported resolution found for "{}"'.format(livestream.title))
+                    return
+
+                stream = available_streams[best_resolution]
+                filename = generate_segment_filename(livestream.filename, segment)
+
+                logging.error('recording {}:{} stream of "{}" to "{}"'.format(
+                    stream.shortname(),
+                    best_resolution,
+                    livestream.title,
+                    filename
+                ))
+                if on_segment_started is not None:
+                    on_segment_started(filename)
+                with open(filename, 'wb') as out:
+                    with stream.open() as handle:
+                        _record_stream(handle, out, chunk_size, buffers, fsync_interval, statistics, livestream, logger,
+                                       limiter, on_progress)
+                # stream which ends without an error is a finished broadcast, only errors are followed by reconnects
+                return
+            except (IOError, EOFError, streamlink_exceptions.StreamlinkError) as e:
+                interruption = e
+
+            if statistics.bytes_written > written_before:
+                segment += 1
+                reconnects = 0
+                backoff = LIVESTREAM_RECONNECT_BACKOFF_SEC
+            if reconnects >= max_reconnects:
+                raise LivestreamInterrupted(livestream.title, interruption)
+
+            reconnects += 1
+            logger.error('livestream "{}" interrupted, reconnecting in {}s ({}/{})'.format(
+                livestream.title,
+                backoff,
+                reconnects,
+                max_reconnects
+            ))
+            time.sleep(backoff)
+            backoff = min(backoff * 2, LIVESTREAM_MAX_RECONNECT_BACKOFF_SEC)
+    except LivestreamInterrupted:
+        raise
     except Exception as e:
         raise DownloadError(livestream.title, e)
+    finally:
+        logger.info('recording of "{}" finished: {}'.format(livestream.title, statistics))
 
 
 def sanitize_filename(s: str) -> str:
@@ -107,7 +301,7 @@ def sanitize_filename(s: str) -> str:
     :param s: input string
     :return: string safe for filesystem
     """
-    s = safe_filename(s)
+    s = pytube_helpers.safe_filename(s)
     s = s.replace(' ', '_')
     return s.encode('ascii', 'ignore').decode('ascii')
 
@@ -125,6 +319,20 @@ def generate_livestream_filename(output_path: str, livestream: ContentItem):
     return os.path.join(output_path, filename)
 
 
+def generate_segment_filename(livestream_filename: str, segment: int):
+    """
+    Generates path of given segment of the livestream. The first segment is saved under the livestream's filename.
+
+    :param livestream_filename: filename generated for the livestream
+    :param segment: number of the segment, starting from 0
+    :return: path of the segment
+    """
+    if segment == 0:
+        return livestream_filename
+    root, extension = os.path.splitext(livestream_filename)
+    return '{}_segment{}{}'.format(root, segment, extension)
+
+
 def generate_video_filename(output_path: str, video: ContentItem):
     """
     Generates path to save given video. Sanitizes title.
@@ -146,7 +354,7 @@ class _VideoDownloadCallback:
         self.total_video_size = total_video_size
         self.__progress_callback_counter = 0
 
-    def on_progress(self, stream, chunk, handle, bytes_remaining):
+    def on_progress(self, bytes_downloaded: int):
         self.__progress_callback_counter += 1
         if self.__progress_callback_counter != _VideoDownloadCallback.PROGRESS_MESSAGES_LIMIT:
             return
@@ -155,12 +363,12 @@ class _VideoDownloadCallback:
         self._context.logger.debug(
             'downloading video "{}"... {:.2f}/{:.2f} MB'.format(
                 self._video.title,
-                (self.total_video_size - bytes_remaining) / MEGABYTE,
+                bytes_downloaded / MEGABYTE,
                 self.total_video_size / MEGABYTE
             )
         )
 
-    def on_complete(self, stream, handle):
+    def on_complete(self):
         self._context.logger.debug(
             'download of video "{}" is complete'.format(
                 self._video.title
@@ -168,6 +376,322 @@ class _VideoDownloadCallback:
         )
 
 
+class _DownloadInterrupted(Exception):
+    def __init__(self, offset: int, cause: Exception):
+        super(_DownloadInterrupted, self).__init__(offset, cause)
+        self.offset = offset
+        self.cause = cause
+
+
+def _resume_offset(storage: Storage, video: ContentItem, part_filename: str, total_size: int) -> int:
+    progress = storage.get_download_progress(video.video_id)
+    if progress is None or progress[1] != total_size or not os.path.isfile(part_filename):
+        storage.set_download_progress(video.video_id, 0, total_size)
+        storage.sync()
+        return 0
+
+    return min(progress[0], os.path.getsize(part_filename))
+
+
+def _download_to_part_file(url: str,
+                           part_filename: str,
+                           offset: int,
+                           total_size: int,
+                           storage: Storage,
+                           video: ContentItem,
+                           download_callback: _VideoDownloadCallback,
+                           limiter: BandwidthLimiter=None):
+    mode = 'r+b' if offset > 0 else 'wb'
+    with open(part_filename, mode) as out:
+        out.seek(offset)
+        out.truncate()
+        saved_offset = offset
+
+        try:
+            headers = {'Range': 'bytes={}-'.format(offset)} if offset > 0 else {}
+            with requests.get(url, headers=headers, stream=True, timeout=VIDEO_DOWNLOAD_TIMEOUT_SEC) as response:
+                response.raise_for_status()
+                if offset > 0 and response.status_code != 206:
+                    offset = saved_offset = 0
+                    out.seek(0)
+                    out.truncate()
+
+                for chunk in response.iter_content(chunk_size=VIDEO_DOWNLOAD_CHUNK_SIZE):
+                    if limiter is not None:
+                        limiter.acquire(len(chunk), PRIORITY_VIDEO)
+                    out.write(chunk)
+                    metrics.DOWNLOADED_BYTES.inc(amount=len(chunk))
+                    offset += len(chunk)
+                    download_callback.on_progress(offset)
+
+                    if offset - saved_offset >= VIDEO_DOWNLOAD_PROGRESS_INTERVAL:
+                        _save_download_progress(out, storage, video, offset, total_size)
+                        saved_offset = offset
+        except (IOError, requests.RequestException) as e:
+            _save_download_progress(out, storage, video, offset, total_size)
+            raise _DownloadInterrupted(offset, e)
+
+        if total_size is not None and offset < total_size:
+            _save_download_progress(out, storage, video, offset, total_size)
+            raise _DownloadInterrupted(offset, EOFError('stream ended at byte {} of {}'.format(offset, total_size)))
+
+        out.flush()
+        os.fsync(out.fileno())
+
+
+class _RangesNotSupported(Exception):
+    pass
+
+
+def _should_split(total_size: Optional[int], offset: int, segments: int, min_segment_size: int) -> bool:
+    return segments > 1 and total_size is not None and total_size - offset >= 2 * min_segment_size
+
+
+def _split_ranges(offset: int, total_size: int, segments: int, min_segment_size: int) -> List[Tuple[int, int]]:
+    segments = max(min(segments, (total_size - offset) // max(min_segment_size, 1)), 1)
+    segment_size = -(-(total_size - offset) // segments)
+    return [
+        (start, min(start + segment_size, total_size))
+        for start in range(offset, total_size, segment_size)
+    ]
+
+
+def _contiguous_prefix(ranges: List[Tuple[int, int]], progress: List[int]) -> int:
+    for (start, end), downloaded in zip(ranges, progress):
+        if start + downloaded < end:
+            return start + downloaded
+    return ranges[-1][1]
+
+
+def _download_segmented(url: str,
+                        part_filename: str,
+                        offset: int,
+                        total_size: int,
+                        segments: int,
+                        min_segment_size: int,
+                        storage: Storage,
+                        video: ContentItem,
+                        download_callback: _VideoDownloadCallback,
+                        limiter: BandwidthLimiter=None):
+    ranges = _split_ranges(offset, total_size, segments, min_segment_size)
+    progress = [0] * len(ranges)
+    stopped = threading.Event()
+    write_lock = threading.Lock()
+
+    with open(part_filename, 'r+b' if os.path.isfile(part_filename) else 'wb') as out:
+        _preallocate(out, total_size)
+        saved_offset = offset
+
+        with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+            futures = [
+                executor.submit(
+                    _download_range, url, out.fileno(), start, end, progress, i, stopped, write_lock, limiter
+                )
+                for i, (start, end) in enumerate(ranges)
+            ]
+            try:
+                while True:
+                    done, not_done = wait(futures, timeout=SEGMENT_PROGRESS_CHECK_SEC, return_when=FIRST_EXCEPTION)
+                    download_callback.on_progress(offset + sum(progress))
+
+                    prefix = _contiguous_prefix(ranges, progress)
+                    if prefix - saved_offset >= VIDEO_DOWNLOAD_PROGRESS_INTERVAL:
+                        _save_download_progress(out, storage, video, prefix, total_size)
+                        saved_offset = prefix
+                    if len(not_done) == 0 or any(future.exception() is not None for future in done):
+                        break
+            finally:
+                stopped.set()
+
+        errors = [future.exception() for future in futures if future.exception() is not None]
+        prefix = _contiguous_prefix(ranges, progress)
+        if any(isinstance(error, _RangesNotSupported) for error in errors):
+            _save_download_progress(out, storage, video, prefix, total_size)
+            raise _RangesNotSupported()
+        if len(errors) > 0:
+            _save_download_progress(out, storage, video, prefix, total_size)
+            raise _DownloadInterrupted(prefix, errors[0])
+
+        out.flush()
+        os.fsync(out.fileno())
+        file_size = os.fstat(out.fileno()).st_size
+        if prefix != total_size or file_size != total_size:
+            raise IOError('downloaded {} bytes of {}, file has {} bytes'.format(prefix, total_size, file_size))
+
+
+def _preallocate(out, total_size: int):
+    if hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(out.fileno(), 0, total_size)
+            return
+        except OSError:
+            pass
+    out.truncate(total_size)
+
+
+def _download_range(url: str,
+                    fd: int,
+                    start: int,
+                    end: int,
+                    progress: List[int],
+                    index: int,
+                    stopped: threading.Event,
+                    write_lock: threading.Lock,
+                    limiter: BandwidthLimiter=None):
+    headers = {'Range': 'bytes={}-{}'.format(start, end - 1)}
+    with requests.get(url, headers=headers, stream=True, timeout=VIDEO_DOWNLOAD_TIMEOUT_SEC) as response:
+        response.raise_for_status()
+        if response.status_code != 206:
+            raise _RangesNotSupported()
+
+        position = start
+        for chunk in response.iter_content(chunk_size=VIDEO_DOWNLOAD_CHUNK_SIZE):
+            if stopped.is_set():
+                return
+            chunk = chunk[:end - position]
+            if limiter is not None:
+                limiter.acquire(len(chunk), PRIORITY_VIDEO)
+            _write_at(fd, chunk, position, write_lock)
+            metrics.DOWNLOADED_BYTES.inc(amount=len(chunk))
+            position += len(chunk)
+            progress[index] = position - start
+            if position >= end:
+                break
+
+    if position < end:
+        raise EOFError('range {}-{} ended at byte {}'.format(start, end - 1, position))
+
+
+def _write_at(fd: int, data: bytes, position: int, write_lock: threading.Lock):
+    if hasattr(os, 'pwrite'):
+        view = memoryview(data)
+        while len(view) > 0:
+            written = os.pwrite(fd, view, position)
+            view = view[written:]
+            position += written
+        return
+
+    with write_lock:
+        os.lseek(fd, position, os.SEEK_SET)
+        os.write(fd, data)
+
+
+def _save_download_progress(out, storage: Storage, video: ContentItem, offset: int, total_size: int):
+    out.flush()
+    os.fsync(out.fileno())
+    storage.set_download_progress(video.video_id, offset, total_size)
+    storage.sync()
+
+
+class _WriteFailed(Exception):
+    def __init__(self, cause):
+        super(_WriteFailed, self).__init__(cause)
+
+
+def _record_stream(handle,
+                   out,
+                   chunk_size: int,
+                   buffers: int,
+                   fsync_interval: float,
+                   statistics: RecordingStatistics,
+                   livestream: ContentItem,
+                   logger: logging.Logger,
+                   limiter: BandwidthLimiter=None,
+                   on_progress: Callable[[RecordingStatistics], None]=None):
+    # every slot of the pool is a buffer in flight, buffers are allocated on first use and only if the handle
+    # is able to read into them, otherwise chunks returned by read() are queued as they are
+    free_buffers = queue.Queue()
+    filled_buffers = queue.Queue()
+    for _ in range(max(buffers, 2)):
+        free_buffers.put(None)
+
+    writer_errors = []
+    writer = threading.Thread(
+        name='ytarchiver-livestream-writer',
+        target=_write_buffers,
+        args=(out, free_buffers, filled_buffers, fsync_interval, statistics, writer_errors, livestream, logger,
+              on_progress),
+        daemon=True
+    )
+    writer.start()
+
+    try:
+        reuse_buffers = callable(getattr(handle, 'readinto', None))
+        while len(writer_errors) == 0:
+            buffer = free_buffers.get()
+            if reuse_buffers and buffer is None:
+                buffer = bytearray(chunk_size)
+            try:
+                chunk, read = _read_chunk(handle, buffer if reuse_buffers else None, chunk_size)
+            except (NotImplementedError, io.UnsupportedOperation):
+                reuse_buffers = False
+                chunk, read = _read_chunk(handle, None, chunk_size)
+            if read == 0:
+                break
+            statistics.bytes_read += read
+            if limiter is not None:
+                limiter.acquire(read, PRIORITY_LIVESTREAM)
+            filled_buffers.put((chunk, read))
+    finally:
+        filled_buffers.put(None)
+        writer.join()
+
+    if len(writer_errors) > 0:
+        raise _WriteFailed(writer_errors[0])
+
+
+def _read_chunk(handle, buffer: Optional[bytearray], chunk_size: int) -> Tuple[Union[bytearray, bytes], int]:
+    if buffer is not None:
+        read = handle.readinto(buffer)
+        if read is not None:
+            return buffer, read
+
+    data = handle.read(chunk_size)
+    return data, len(data)
+
+
+def _write_buffers(out,
+                   free_buffers: queue.Queue,
+                   filled_buffers: queue.Queue,
+                   fsync_interval: float,
+                   statistics: RecordingStatistics,
+                   writer_errors: list,
+                   livestream: ContentItem,
+                   logger: logging.Logger,
+                   on_progress: Callable[[RecordingStatistics], None]=None):
+    last_fsync = last_progress = last_report = time.time()
+    try:
+        while True:
+            entry = filled_buffers.get()
+            if entry is None:
+                break
+
+            chunk, length = entry
+            with memoryview(chunk) as view:
+                out.write(view[:length])
+            free_buffers.put(chunk if isinstance(chunk, bytearray) else None)
+            statistics.bytes_written += length
+            statistics.chunks += 1
+
+            now = time.time()
+            if fsync_interval > 0 and now - last_fsync >= fsync_interval:
+                out.flush()
+                os.fsync(out.fileno())
+                statistics.fsyncs += 1
+                last_fsync = now
+            if now - last_progress >= LIVESTREAM_PROGRESS_INTERVAL_SEC:
+                logger.debug('recording "{}"... {}'.format(livestream.title, statistics))
+                last_progress = now
+            if on_progress is not None and now - last_report >= LIVESTREAM_REPORT_INTERVAL_SEC:
+                on_progress(statistics)
+                last_report = now
+
+        out.flush()
+    except Exception as e:
+        writer_errors.append(e)
+        free_buffers.put(bytearray(0))
+
+
 def _choose_best_video_stream(streams):
     best_stream = None
     for stream in streams:
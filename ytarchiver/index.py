@@ -0,0 +1,89 @@
+import hashlib
+import math
+from abc import ABCMeta, abstractmethod
+
+INDEX_TYPES = ['set', 'bloom']
+
+
+class VideosIndex(metaclass=ABCMeta):
+    """
+    In-memory index of IDs of already archived videos. Exact indexes answer membership queries on their own,
+    probabilistic ones might report false positives which have to be confirmed against the storage.
+    """
+
+    is_exact = True
+
+    @abstractmethod
+    def add(self, video_id: str):
+        pass
+
+    @abstractmethod
+    def __contains__(self, video_id: str) -> bool:
+        pass
+
+
+class SetVideosIndex(VideosIndex):
+    """
+    Exact index keeping every known ID in a set
+    """
+
+    is_exact = True
+
+    def __init__(self):
+        self._ids = set()
+
+    def add(self, video_id: str):
+        self._ids.add(video_id)
+
+    def __contains__(self, video_id: str) -> bool:
+        return video_id in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+
+class BloomFilterVideosIndex(VideosIndex):
+    """
+    Memory-bounded probabilistic index. Never reports known ID as unknown, but might report unknown ID as known
+    with probability close to error_rate, as long as the number of IDs stays below capacity.
+    """
+
+    is_exact = False
+
+    def __init__(self, capacity: int, error_rate: float):
+        bits = int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self._bits_count = max(bits, 8)
+        self._hashes_count = max(int(round(self._bits_count / capacity * math.log(2))), 1)
+        self._bits = bytearray((self._bits_count + 7) // 8)
+
+    def add(self, video_id: str):
+        for position in self._positions(video_id):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, video_id: str) -> bool:
+        for position in self._positions(video_id):
+            if not self._bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def size_in_bytes(self) -> int:
+        return len(self._bits)
+
+    def _positions(self, video_id: str):
+        digest = hashlib.sha1(video_id.encode('utf-8')).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:16], 'little') | 1
+        for i in range(self._hashes_count):
+            yield (h1 + i * h2) % self._bits_count
+
+
+def create_videos_index(config) -> VideosIndex:
+    """
+    Creates empty index of the type chosen in configuration
+
+    :param config: configuration
+    :return: empty index
+    """
+    if config.index_type == 'bloom':
+        return BloomFilterVideosIndex(config.index_capacity, config.index_error_rate)
+    return SetVideosIndex()
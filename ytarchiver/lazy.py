@@ -0,0 +1,39 @@
+import importlib
+import threading
+import types
+
+
+class LazyModule(types.ModuleType):
+    """
+    Stand-in for a module which is imported on the first access to any of its attributes. Used for heavy
+    dependencies, which are not needed until the first download or recording.
+    """
+
+    def __init__(self, name: str):
+        super(LazyModule, self).__init__(name)
+        self.__dict__['_lazy_lock'] = threading.Lock()
+        self.__dict__['_lazy_module'] = None
+
+    def __getattr__(self, attribute: str):
+        return getattr(self._load(), attribute)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def _load(self) -> types.ModuleType:
+        with self.__dict__['_lazy_lock']:
+            module = self.__dict__['_lazy_module']
+            if module is None:
+                module = importlib.import_module(self.__name__)
+                self.__dict__['_lazy_module'] = module
+            return module
+
+
+def lazy_import(name: str) -> types.ModuleType:
+    """
+    Returns module which is going to be imported on the first use
+
+    :param name: full name of the module, such as "streamlink.exceptions"
+    :return: lazy module
+    """
+    return LazyModule(name)
@@ -1,80 +1,380 @@
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
 
-from ytarchiver.api import YoutubeChannel, APIError
-from ytarchiver.common import Context, Event
+from ytarchiver import metrics, profiling
+from ytarchiver.api import YoutubeChannel, APIError, PLAYLIST_ITEMS_MAX_RESULTS, SEARCH_LIST_COST, \
+    VIDEOS_LIST_COST, VIDEOS_LIST_MAX_IDS
+from ytarchiver.cache import CachedResponse
+from ytarchiver.common import Context, Event, ChannelWatermark, ContentItem
 from ytarchiver.download import generate_livestream_filename, generate_video_filename, DownloadError, \
     LivestreamInterrupted
 from ytarchiver.sqlite import Sqlite3Storage
 
+HEAD_PAGE_SIZE = 5
+LIVESTREAM_DETECTION_SEARCH = 'search'
+LIVESTREAM_DETECTION_UPLOADS = 'uploads'
+LIVESTREAM_CANDIDATES_PER_CHANNEL = 5
 
-def lookup(context: Context, is_first_run: bool):
+
+def lookup(context: Context, is_first_run: bool, channels_ids: List[str]=None):
+    """
+    Checks given channels one after another for new content
+
+    :param context: execution context
+    :param is_first_run: True for the first lookup after the daemon is started
+    :param channels_ids: IDs of channels to check, all configured channels by default
+    """
+    _run_lookup(context, is_first_run, channels_ids, _fetch_channels_serially)
+
+
+def lookup_concurrently(context: Context, is_first_run: bool, channels_ids: List[str]=None):
+    """
+    Checks given channels for new content concurrently, with at most config.api_concurrency channels
+    checked at the same time. Error in one of channels does not stop checking the others.
+
+    :param context: execution context
+    :param is_first_run: True for the first lookup after the daemon is started
+    :param channels_ids: IDs of channels to check, all configured channels by default
+    """
+    _run_lookup(context, is_first_run, channels_ids, _fetch_channels_concurrently)
+
+
+def _run_lookup(context: Context, is_first_run: bool, channels_ids: List[str], fetch_channels):
+    started_at = time.monotonic()
+    profiling.begin_cycle()
     statistics = _Statistics(
         is_first_run=is_first_run,
         monitor_livestreams=context.config.monitor_livestreams
     )
 
-    context.livestream_recorders.update(context)
-    context.video_recorders.update(context)
+    context.bus.begin_cycle(is_first_run)
+    with profiling.stage('recorders_update'):
+        context.livestream_recorders.update(context)
+        context.video_recorders.update(context)
 
     with context.storage.open(context.config) as storage:
         try:
-            channels = context.api.find_channels(context.config.channels_list)
-            for channel in channels:
-                _fetch_channel_content(context, channel, storage, statistics, is_first_run)
-                storage.commit()
-        except APIError:
-            context.logger.exception('error while making API call')
-        except DownloadError:
-            context.logger.exception('error while downloading')
-        except LivestreamInterrupted as e:
-            context.logger.error('livestream "{}" finished unexpectedly'.format(e.livestream_title))
-        except Exception:
-            context.logger.exception('unknown error')
+            if is_first_run:
+                _resume_incomplete_downloads(context, storage)
+            if channels_ids is None:
+                channels_ids = context.config.channels_list
+            channels = _resolve_channels(context, storage, channels_ids)
+            livestream_candidates = fetch_channels(context, channels, storage, statistics, is_first_run)
+            _check_for_livestreams_in_uploads(context, livestream_candidates, statistics, storage)
+        except Exception as e:
+            _log_lookup_error(context, e)
 
     statistics.announce(context.logger)
-    _process_events(context, is_first_run)
+    metrics.LOOKUP_DURATION.observe(value=time.monotonic() - started_at)
+    metrics.EVENTS_QUEUE_DEPTH.set(value=context.bus.queue_depth())
+    with profiling.stage('process_events'):
+        _process_events(context, is_first_run)
+    profiling.end_cycle(context.logger)
+
+
+def _resume_incomplete_downloads(context: Context, storage: Sqlite3Storage):
+    for video in storage.list_incomplete_downloads():
+        if not context.video_recorders.is_recording_active(video.video_id):
+            context.logger.info('resuming interrupted download of video "{}"'.format(video.title))
+            context.video_recorders.start_recording(context, video)
+
+
+def _log_lookup_error(context: Context, e: Exception):
+    if isinstance(e, APIError):
+        context.logger.error('error while making API call', exc_info=e)
+    elif isinstance(e, DownloadError):
+        context.logger.error('error while downloading', exc_info=e)
+    elif isinstance(e, LivestreamInterrupted):
+        context.logger.error('livestream "{}" finished unexpectedly'.format(e.livestream_title))
+    else:
+        context.logger.error('unknown error', exc_info=e)
+
+
+def _fetch_channels_serially(context: Context,
+                             channels: List[YoutubeChannel],
+                             storage: Sqlite3Storage,
+                             statistics: '_Statistics',
+                             is_first_run: bool) -> List[str]:
+    livestream_candidates = []
+    for channel in channels:
+        with profiling.channel(channel.id):
+            livestream_candidates += _fetch_channel_content(context, channel, storage, statistics, is_first_run)
+            with profiling.stage('commit'):
+                storage.commit()
+    return livestream_candidates
+
+
+def _fetch_channels_concurrently(context: Context,
+                                 channels: List[YoutubeChannel],
+                                 storage: Sqlite3Storage,
+                                 statistics: '_Statistics',
+                                 is_first_run: bool) -> List[str]:
+    with ThreadPoolExecutor(max_workers=max(context.config.api_concurrency, 1)) as executor:
+        futures = [
+            executor.submit(_fetch_and_commit_channel_content, context, channel, storage, statistics, is_first_run)
+            for channel in channels
+        ]
+
+    livestream_candidates = []
+    for future in futures:
+        try:
+            livestream_candidates += future.result()
+        except Exception as e:
+            _log_lookup_error(context, e)
+    return livestream_candidates
+
+
+def _fetch_and_commit_channel_content(context: Context,
+                                      channel: YoutubeChannel,
+                                      storage: Sqlite3Storage,
+                                      statistics: '_Statistics',
+                                      is_first_run: bool) -> List[str]:
+    with profiling.channel(channel.id):
+        livestream_candidates = _fetch_channel_content(context, channel, storage, statistics, is_first_run)
+        with profiling.stage('commit'):
+            storage.commit()
+    return livestream_candidates
+
+
+def _resolve_channels(context: Context, storage: Sqlite3Storage, channels_ids: List[str]) -> List[YoutubeChannel]:
+    with profiling.stage('channels_cache'):
+        uploads_playlists = storage.find_uploads_playlists(channels_ids)
+
+    unresolved_channels_ids = [channel_id for channel_id in channels_ids if channel_id not in uploads_playlists]
+    if len(unresolved_channels_ids) > 0:
+        with profiling.stage('find_channels'):
+            channels = list(context.api.find_channels(
+                unresolved_channels_ids,
+                concurrency=context.config.api_concurrency
+            ))
+        for channel in channels:
+            storage.add_channel(channel.id, channel.uploads_playlist_id)
+            uploads_playlists[channel.id] = channel.uploads_playlist_id
+        with profiling.stage('commit'):
+            storage.commit()
+
+        for channel_id in unresolved_channels_ids:
+            if channel_id not in uploads_playlists:
+                context.logger.error('channel "{}" not found'.format(channel_id))
+
+    return [
+        YoutubeChannel(channel_id, uploads_playlists[channel_id])
+        for channel_id in channels_ids
+        if channel_id in uploads_playlists
+    ]
 
 
 def _fetch_channel_content(
         context: Context,
         channel: YoutubeChannel,
         storage: Sqlite3Storage, statistics,
-        is_first_run: bool=False):
+        is_first_run: bool=False) -> List[str]:
     _check_for_livestreams(context, channel, statistics, storage)
-    _check_for_videos(context, channel, is_first_run, statistics, storage)
+    newest_videos_ids = _check_for_videos(context, channel, is_first_run, statistics, storage)
+    return newest_videos_ids[:LIVESTREAM_CANDIDATES_PER_CHANNEL]
 
 
 def _check_for_livestreams(context: Context, channel: YoutubeChannel, statistics: '_Statistics', storage: Sqlite3Storage):
-    if not context.config.monitor_livestreams:
+    if not context.config.monitor_livestreams or \
+            context.config.livestream_detection != LIVESTREAM_DETECTION_SEARCH:
         return
 
-    livestream = context.api.fetch_channel_livestream(channel)
+    with profiling.stage('fetch_channel_livestream'):
+        livestream = context.api.fetch_channel_livestream(channel)
+    statistics.notify_livestream_detection_cost(SEARCH_LIST_COST)
     if livestream is not None:
-        if not context.livestream_recorders.is_recording_active(livestream.video_id):
-            context.logger.info('new livestream "{}"'.format(livestream.title))
-            livestream.filename = generate_livestream_filename(context.config.output_dir, livestream)
-            context.bus.add_event(Event(type=Event.LIVESTREAM_STARTED, content=livestream))
+        _register_livestream(context, livestream, statistics, storage)
+
+
+def _check_for_livestreams_in_uploads(context: Context,
+                                      videos_ids: List[str],
+                                      statistics: '_Statistics',
+                                      storage: Sqlite3Storage):
+    if not context.config.monitor_livestreams or \
+            context.config.livestream_detection != LIVESTREAM_DETECTION_UPLOADS or \
+            len(videos_ids) == 0:
+        return
+
+    with profiling.stage('find_live_videos'):
+        livestreams = context.api.find_live_videos(videos_ids)
+    statistics.notify_livestream_detection_cost(
+        VIDEOS_LIST_COST * ((len(videos_ids) + VIDEOS_LIST_MAX_IDS - 1) // VIDEOS_LIST_MAX_IDS)
+    )
+    for livestream in livestreams:
+        _register_livestream(context, livestream, statistics, storage)
+
+
+def _register_livestream(context: Context, livestream: ContentItem, statistics: '_Statistics', storage: Sqlite3Storage):
+    if not context.livestream_recorders.is_recording_active(livestream.video_id):
+        context.logger.info('new livestream "{}"'.format(livestream.title))
+        livestream.filename = generate_livestream_filename(context.config.output_dir, livestream)
+        context.bus.add_event(Event(type=Event.LIVESTREAM_STARTED, content=livestream))
+        # stored first, so segments reported by the recorder always find their livestream
+        storage.add_livestream(livestream)
+        with profiling.stage('start_recording'):
             context.livestream_recorders.start_recording(context, livestream)
-            storage.add_livestream(livestream)
-        statistics.notify_active_livestream()
+    statistics.notify_active_livestream()
 
 
 def _check_for_videos(context: Context,
                       channel: YoutubeChannel,
                       is_first_run: bool,
                       statistics: '_Statistics',
-                      storage: Sqlite3Storage):
-    for video in context.api.find_channel_uploaded_videos(channel, find_all=is_first_run):
-        video_not_registered = not storage.video_exist(video.video_id) and \
+                      storage: Sqlite3Storage) -> List[str]:
+    with profiling.stage('watermark'):
+        watermark = storage.get_watermark(channel.id) or ChannelWatermark(channel.id)
+    newest_videos_ids = []
+
+    if watermark.video_id is not None:
+        newest_videos_ids = _scan_uploads(context, channel, watermark, is_first_run, statistics, storage,
+                                          stop_at_known=True)
+
+    if is_first_run and not watermark.backfill_complete:
+        first_page_videos_ids = _scan_uploads(
+            context, channel, watermark, is_first_run, statistics, storage,
+            page_token=watermark.backfill_page_token or '',
+            backfill=True
+        )
+        newest_videos_ids = newest_videos_ids or first_page_videos_ids
+    elif watermark.video_id is None:
+        newest_videos_ids = _scan_uploads(context, channel, watermark, is_first_run, statistics, storage)
+
+    return newest_videos_ids
+
+
+def _scan_uploads(context: Context,
+                  channel: YoutubeChannel,
+                  watermark: ChannelWatermark,
+                  is_first_run: bool,
+                  statistics: '_Statistics',
+                  storage: Sqlite3Storage,
+                  page_token: str='',
+                  stop_at_known: bool=False,
+                  backfill: bool=False) -> List[str]:
+    """
+    Walks uploads playlist of the channel starting at given page. With stop_at_known paging stops at the first
+    already archived video, with backfill it continues to the last page and persists the progress after every
+    page, so interrupted backfill is able to resume. Otherwise only a single page is checked.
+    With stop_at_known new videos are stored, and the watermark is moved, only once the scan reaches an archived
+    video or the last page, so interrupted scan is repeated from the newest page by the next lookup. Videos are
+    stored from the oldest one, so a partially committed scan never leaves a gap below the newest stored video.
+    With stop_at_known the newest page is requested conditionally, if its ETag is cached, and the channel is skipped
+    when the page did not change. Returns IDs of videos from the first fetched page.
+    """
+    max_results = HEAD_PAGE_SIZE if stop_at_known else PLAYLIST_ITEMS_MAX_RESULTS
+    first_page_videos_ids = None
+    first_page_etag = None
+    new_videos = []
+    cache_key = None
+    if stop_at_known and page_token == '' and context.response_cache is not None:
+        cache_key = _uploads_cache_key(channel, max_results)
+
+    while True:
+        if cache_key is not None and page_token == '':
+            page, cached = _fetch_cached_uploads_page(context, channel, cache_key, max_results)
+            if page.not_modified:
+                return cached.videos_ids
+        else:
+            with profiling.stage('playlist_page'):
+                page = context.api.fetch_channel_uploads_page(channel, page_token=page_token, max_results=max_results)
+        if first_page_videos_ids is None:
+            first_page_videos_ids = [video.video_id for video in page.items]
+            first_page_etag = page.etag
+        if page_token == '' and len(page.items) > 0:
+            watermark.video_id = page.items[0].video_id
+            watermark.timestamp = page.items[0].timestamp
+
+        reached_known_video = False
+        if stop_at_known:
+            page_new_videos = _take_new_uploads(page.items, statistics, storage)
+            reached_known_video = len(page_new_videos) < len(page.items)
+            new_videos += page_new_videos
+        else:
+            _process_uploads(context, page.items, is_first_run, statistics, storage)
+
+        if backfill:
+            watermark.backfill_page_token = page.next_page_token
+            watermark.backfill_complete = page.next_page_token is None
+            with profiling.stage('watermark'):
+                storage.set_watermark(watermark)
+            with profiling.stage('commit'):
+                storage.commit()
+
+        if reached_known_video or page.next_page_token is None or not (stop_at_known or backfill):
+            break
+        page_token = page.next_page_token
+        max_results = PLAYLIST_ITEMS_MAX_RESULTS
+
+    if not backfill:
+        _process_uploads(context, list(reversed(new_videos)), is_first_run, statistics, storage)
+        with profiling.stage('watermark'):
+            storage.set_watermark(watermark)
+
+    # ETag is remembered only after the whole scan succeeded, interrupted scan must not be skipped as unchanged
+    if cache_key is not None and first_page_etag is not None:
+        context.response_cache.put(cache_key, CachedResponse(first_page_etag, first_page_videos_ids))
+    return first_page_videos_ids
+
+
+def _fetch_cached_uploads_page(context: Context, channel: YoutubeChannel, cache_key: str, max_results: int):
+    cached = context.response_cache.get(cache_key)
+    with profiling.stage('playlist_page'):
+        page = context.api.fetch_channel_uploads_page(
+            channel,
+            page_token='',
+            max_results=max_results,
+            etag=cached.etag if cached is not None else None
+        )
+    if page.not_modified:
+        context.response_cache.notify_hit()
+    else:
+        context.response_cache.notify_miss()
+    return page, cached
+
+
+def _uploads_cache_key(channel: YoutubeChannel, max_results: int) -> str:
+    return 'playlistItems:{}:{}'.format(channel.uploads_playlist_id, max_results)
+
+
+def _take_new_uploads(videos: List[ContentItem],
+                      statistics: '_Statistics',
+                      storage: Sqlite3Storage) -> List[ContentItem]:
+    with profiling.stage('existence_check'):
+        existing_videos = storage.find_existing_videos([video.video_id for video in videos])
+    for i, video in enumerate(videos):
+        if video.video_id in existing_videos:
+            statistics.notify_video(video.channel_id, new=False)
+            return videos[:i]
+    return videos
+
+
+def _process_uploads(context: Context,
+                     videos: List[ContentItem],
+                     is_first_run: bool,
+                     statistics: '_Statistics',
+                     storage: Sqlite3Storage):
+    if len(videos) == 0:
+        return
+    with profiling.stage('existence_check'):
+        existing_videos = storage.find_existing_videos([video.video_id for video in videos])
+    for video in videos:
+        video_not_registered = video.video_id not in existing_videos and \
                                not context.video_recorders.is_recording_active(video.video_id)
         if video_not_registered:
             context.logger.info('new video "{}"'.format(video.title))
             context.bus.add_event(Event(type=Event.NEW_VIDEO, content=video))
             if not is_first_run or context.config.archive_all:
                 video.filename = generate_video_filename(context.config.output_dir, video)
-                context.video_recorders.start_recording(context, video)
-            storage.add_video(video)
-        statistics.notify_video(new=video_not_registered)
+                storage.set_download_progress(video.video_id, 0, None)
+                with profiling.stage('start_recording'):
+                    context.video_recorders.start_recording(context, video)
+            with profiling.stage('add_video'):
+                storage.add_video(video)
+            metrics.VIDEOS.inc(video.channel_id)
+        statistics.notify_video(video.channel_id, new=video_not_registered)
 
 
 def _process_events(context: Context, is_first_run: bool):
@@ -92,21 +392,32 @@ class _Statistics:
         self.total_videos = 0
         self.new_videos = 0
         self.active_livestreams = 0
+        self.livestream_detection_cost = 0
+        self._lock = threading.Lock()
 
-    def notify_video(self, new: bool=False):
-        self.total_videos += 1
+    def notify_video(self, channel_id: str, new: bool=False):
+        with self._lock:
+            self.total_videos += 1
+            if new:
+                self.new_videos += 1
         if new:
-            self.new_videos += 1
+            metrics.NEW_VIDEOS.inc(channel_id)
 
     def notify_active_livestream(self):
-        self.active_livestreams += 1
+        with self._lock:
+            self.active_livestreams += 1
+
+    def notify_livestream_detection_cost(self, units: int):
+        with self._lock:
+            self.livestream_detection_cost += units
 
     def announce(self, logger: logging.Logger):
         logger.info(
-            '{} videos: {}, new: {}, active livestreams: {}'.format(
+            '{} videos: {}, new: {}, active livestreams: {}, livestream detection cost: {}'.format(
                 'total' if self.is_first_run else 'fetched',
                 self.total_videos,
                 self.new_videos,
-                self.active_livestreams if self.monitor_livestreams else 'N/A'
+                self.active_livestreams if self.monitor_livestreams else 'N/A',
+                '{} units'.format(self.livestream_detection_cost) if self.monitor_livestreams else 'N/A'
             )
         )
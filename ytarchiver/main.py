@@ -1,3 +1,4 @@
+import calendar
 import errno
 import logging
 import os
@@ -5,12 +6,20 @@ import sys
 import time
 from datetime import datetime
 
-from ytarchiver.api import YoutubeAPI
+from ytarchiver import metrics, profiling
+from ytarchiver.api import YoutubeAPI, LightweightYoutubeAPI, API_BACKEND_HTTP
 from ytarchiver.args import parse_command_line
+from ytarchiver.cache import ResponseCache, RESPONSE_CACHE_FILE
 from ytarchiver.common import Context, EventBus, PluginsManager
-from ytarchiver.lookup import lookup
+from ytarchiver.dispatch import ThreadedPluginsManager, ThreadedEventBus
+from ytarchiver.lookup import lookup, lookup_concurrently
+from ytarchiver.metrics import start_metrics_server
 from ytarchiver.plugins import load_plugins_configuration
-from ytarchiver.recording import MultiprocessLivestreamRecordersController, SynchronousVideoRecordersController
+from ytarchiver.quota import QuotaLedger, QUOTA_FILE
+from ytarchiver.ratelimit import create_bandwidth_limiter
+from ytarchiver.scheduler import ChannelScheduler, UPLOAD_HISTORY_LENGTH
+from ytarchiver.recording import MultiprocessLivestreamRecordersController, SynchronousVideoRecordersController, \
+    ThreadPoolVideoRecordersController
 from ytarchiver.sqlite import Sqlite3StorageManager
 
 
@@ -21,15 +30,18 @@ def main():
 
     config = parse_command_line()
     logger = create_logger(config)
+    bus, plugins = create_event_bus(config)
     context = Context(
         config,
         logger,
-        api=YoutubeAPI(config.api_key),
-        video_recorders_controller=SynchronousVideoRecordersController(),
+        api=create_api(config),
+        video_recorders_controller=create_video_recorders_controller(config),
         livestream_recorders_controller=MultiprocessLivestreamRecordersController(),
         storage_manager=Sqlite3StorageManager(),
-        bus=EventBus(),
-        plugins=PluginsManager()
+        bus=bus,
+        plugins=plugins,
+        bandwidth_limiter=create_bandwidth_limiter(config),
+        response_cache=create_response_cache(config)
     )
 
     if config.plugins_config_location is not None:
@@ -39,6 +51,65 @@ def main():
     start_monitoring(context)
 
 
+def create_api(config):
+    """
+    Creates client of Youtube API
+
+    :param config: configuration
+    :return: client using API backend given in configuration
+    """
+
+    quota = QuotaLedger(os.path.join(config.output_dir, QUOTA_FILE), daily_budget=config.quota_budget)
+    if config.api_backend == API_BACKEND_HTTP:
+        return LightweightYoutubeAPI(
+            config.api_key,
+            quota=quota,
+            base_url=config.base_url,
+            pool_size=config.api_concurrency
+        )
+    return YoutubeAPI(config.api_key, quota=quota, base_url=config.base_url, discovery_cache_dir=config.output_dir)
+
+
+def create_response_cache(config):
+    """
+    Creates cache of ETags of API responses
+
+    :param config: configuration
+    :return: persistent cache, or None if it's disabled
+    """
+
+    if config.response_cache_size <= 0:
+        return None
+    return ResponseCache(os.path.join(config.output_dir, RESPONSE_CACHE_FILE), capacity=config.response_cache_size)
+
+
+def create_video_recorders_controller(config):
+    """
+    Creates controller for video downloads
+
+    :param config: configuration
+    :return: pooled controller, or synchronous one if no workers are requested
+    """
+
+    if config.download_workers > 0:
+        return ThreadPoolVideoRecordersController(config.download_workers)
+    return SynchronousVideoRecordersController()
+
+
+def create_event_bus(config):
+    """
+    Creates event bus and plugins manager delivering its events
+
+    :param config: configuration
+    :return: tuple of event bus and plugins manager
+    """
+
+    if config.threaded_events:
+        plugins = ThreadedPluginsManager(config.events_queue_size, config.events_drop_policy)
+        return ThreadedEventBus(plugins, config.events_queue_size, config.events_drop_policy), plugins
+    return EventBus(), PluginsManager()
+
+
 def create_logger(config):
     """
     Creates application logger
@@ -75,23 +146,149 @@ def start_monitoring(context: Context):
         context.logger.error('channels list cannot be empty, use -c option to specify at least one channel id')
         sys.exit(1)
 
+    if context.config.profile:
+        profiling.enable(profiling.LookupProfiler(context.config.output_dir, context.config.profile_dump))
+
+    if context.config.metrics_port is not None:
+        start_metrics_server(context.config.metrics_port)
+        context.logger.info('metrics exposed on port {}'.format(context.config.metrics_port))
+
     context.logger.debug('daemon started successfully')
 
     try:
         _trigger_lookup(context, first_run=True)
 
-        # master thread's loop
-        while True:
-            time.sleep(context.config.refresh_time)
-            _trigger_lookup(context)
+        if context.config.adaptive_polling:
+            _run_scheduled_lookups(context)
+        else:
+            _run_periodic_lookups(context)
     except KeyboardInterrupt:
         context.logger.debug('interrupted with ctrl+c')
+    finally:
+        context.storage.close()
+
+
+def _run_periodic_lookups(context: Context):
+    refresh_time = context.config.refresh_time
+
+    # master thread's loop
+    while True:
+        time.sleep(refresh_time)
+        cycle_cost = _trigger_lookup(context)
+        refresh_time = _next_refresh_time(context, cycle_cost)
+
+
+def _run_scheduled_lookups(context: Context):
+    scheduler = ChannelScheduler(
+        min_interval=context.config.min_refresh_time,
+        max_interval=context.config.max_refresh_time,
+        default_interval=context.config.refresh_time
+    )
+    _schedule_channels(context, scheduler, context.config.channels_list, spread=True)
+
+    # master thread's loop, scheduler works on monotonic time, so it's not affected by changes of the wall clock
+    while True:
+        due_time = scheduler.next_due_time()
+        if due_time is None:
+            _schedule_channels(context, scheduler, context.config.channels_list, spread=True)
+            continue
 
+        time.sleep(max(due_time - time.monotonic(), 0))
+        channels_ids = scheduler.pop_due_channels(time.monotonic())
+        if len(channels_ids) == 0:
+            continue
+        cycle_cost = _trigger_lookup(context, channels_ids=channels_ids)
 
-def _trigger_lookup(context, first_run=False):
+        if context.api.quota.daily_budget is not None:
+            scheduler.stretch = max(context.api.quota.spending_ratio(), 1.0)
+        report_quota_usage(context, cycle_cost, 'polling intervals stretched {:.2f}x'.format(scheduler.stretch))
+        _schedule_channels(context, scheduler, channels_ids)
+
+
+def _schedule_channels(context: Context, scheduler: ChannelScheduler, channels_ids, spread: bool=False):
+    utc_now = datetime.utcnow()
+    now = time.monotonic()
+    with context.storage.open(context.config) as storage:
+        for channel_id in channels_ids:
+            upload_timestamps = storage.list_upload_timestamps(channel_id, UPLOAD_HISTORY_LENGTH)
+            interval = scheduler.interval_for(upload_timestamps, utc_now)
+            scheduler.schedule(channel_id, interval, now, spread=spread)
+            context.logger.debug('channel "{}" is going to be polled every {:.0f}s'.format(
+                channel_id,
+                interval * scheduler.stretch
+            ))
+
+
+def _trigger_lookup(context, first_run=False, channels_ids=None) -> int:
     now = datetime.now()
     context.logger.debug('[{}] triggering new lookup...'.format(now.strftime('%Y-%m-%d %H:%M:%S')))
-    lookup(context, first_run)
+
+    charged_before = context.api.quota.charged_total
+    if context.config.lookup_engine == 'concurrent':
+        lookup_concurrently(context, first_run, channels_ids)
+    else:
+        lookup(context, first_run, channels_ids)
+    try:
+        context.api.quota.save()
+    except IOError:
+        context.logger.exception('error while saving quota usage')
+    if context.response_cache is not None:
+        _save_response_cache(context)
+    return context.api.quota.charged_total - charged_before
+
+
+def _save_response_cache(context):
+    cache = context.response_cache
+    context.logger.debug('response cache: {} entries, hit rate: {:.0%}'.format(len(cache), cache.hit_rate()))
+    try:
+        cache.save()
+    except IOError:
+        context.logger.exception('error while saving response cache')
+
+
+def report_quota_usage(context: Context, cycle_cost: int, schedule: str):
+    """
+    Logs quota units spent today along with projected exhaustion of the daily budget and exports both as metrics
+
+    :param context: execution context
+    :param cycle_cost: quota units spent by the last lookup
+    :param schedule: description of the schedule of next lookups
+    """
+
+    quota = context.api.quota
+    used = quota.used_today()
+    exhaustion = quota.projected_exhaustion()
+    metrics.QUOTA_USED_TODAY.set(value=used)
+    metrics.QUOTA_PROJECTED_EXHAUSTION.set(
+        value=calendar.timegm(exhaustion.utctimetuple()) if exhaustion is not None else 0
+    )
+
+    if quota.daily_budget is None:
+        context.logger.debug('quota used today: {} units'.format(used))
+        return
+
+    context.logger.info(
+        'quota used today: {}/{} units, lookup cost: {} units, {}, projected exhaustion: {}'.format(
+            used,
+            quota.daily_budget,
+            cycle_cost,
+            schedule,
+            exhaustion.strftime('%Y-%m-%d %H:%M:%S UTC') if exhaustion is not None else 'none before reset'
+        )
+    )
+
+
+def _next_refresh_time(context, cycle_cost: int) -> float:
+    quota = context.api.quota
+    refresh_time = context.config.refresh_time
+    if quota.daily_budget is not None:
+        refresh_time = quota.suggest_refresh_time(
+            cycle_cost,
+            context.config.min_refresh_time,
+            context.config.max_refresh_time
+        )
+    report_quota_usage(context, cycle_cost, 'next lookup in {:.0f}s'.format(refresh_time))
+    return refresh_time
 
 
 def _ensure_dir_exist(path: str, logger: logging.Logger):
@@ -0,0 +1,266 @@
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from typing import List, Tuple
+
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _Metric:
+    def __init__(self, name: str, description: str, labels: List[str]=None):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels or [])
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def remove(self, *label_values):
+        """
+        Removes series with given label values
+
+        :param label_values: values of all labels, in order of their declaration
+        """
+        with self._lock:
+            self._values.pop(self._key(label_values), None)
+
+    def render(self) -> List[str]:
+        lines = [
+            '# HELP {} {}'.format(self.name, self.description),
+            '# TYPE {} {}'.format(self.name, self.type)
+        ]
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            lines.extend(self._render_series(label_values, value))
+        return lines
+
+    def _render_series(self, label_values: Tuple, value) -> List[str]:
+        return ['{}{} {}'.format(self.name, _format_labels(self.labels, label_values), _format_value(value))]
+
+    def _key(self, label_values: Tuple) -> Tuple:
+        if len(label_values) != len(self.labels):
+            raise ValueError('metric {} expects labels {}'.format(self.name, self.labels))
+        return tuple(str(value) for value in label_values)
+
+
+class Counter(_Metric):
+    """
+    Value which only goes up, such as a number of API calls
+    """
+
+    type = 'counter'
+
+    def inc(self, *label_values, amount: float=1):
+        key = self._key(label_values)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, *label_values) -> float:
+        with self._lock:
+            return self._values.get(self._key(label_values), 0)
+
+
+class Gauge(_Metric):
+    """
+    Value which might go up and down, such as a number of active recorders
+    """
+
+    type = 'gauge'
+
+    def set(self, *label_values, value: float):
+        key = self._key(label_values)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, *label_values) -> float:
+        with self._lock:
+            return self._values.get(self._key(label_values), 0)
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values, such as durations of lookups
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name: str, description: str, labels: List[str]=None, buckets: Tuple=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, *label_values, value: float):
+        key = self._key(label_values)
+        with self._lock:
+            counts, total, count = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            counts = [c + 1 if value <= bound else c for c, bound in zip(counts, self.buckets)]
+            self._values[key] = (counts, total + value, count + 1)
+
+    def count(self, *label_values) -> int:
+        with self._lock:
+            return self._values.get(self._key(label_values), (None, 0.0, 0))[2]
+
+    def _render_series(self, label_values: Tuple, value) -> List[str]:
+        counts, total, count = value
+        lines = []
+        for bound, bucket_count in zip(self.buckets, counts):
+            labels = _format_labels(self.labels + ('le',), label_values + (_format_value(bound),))
+            lines.append('{}_bucket{} {}'.format(self.name, labels, bucket_count))
+        labels = _format_labels(self.labels + ('le',), label_values + ('+Inf',))
+        lines.append('{}_bucket{} {}'.format(self.name, labels, count))
+        labels = _format_labels(self.labels, label_values)
+        lines.append('{}_sum{} {}'.format(self.name, labels, _format_value(total)))
+        lines.append('{}_count{} {}'.format(self.name, labels, count))
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Collection of metrics exposed together
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """
+        :return: all metrics in Prometheus text format
+        """
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+LOOKUP_DURATION = REGISTRY.register(Histogram(
+    'ytarchiver_lookup_duration_seconds', 'Duration of lookup cycles'
+))
+API_CALLS = REGISTRY.register(Counter(
+    'ytarchiver_api_calls_total', 'YouTube API calls', ['method']
+))
+API_ERRORS = REGISTRY.register(Counter(
+    'ytarchiver_api_errors_total', 'Failed YouTube API calls', ['method']
+))
+API_LATENCY = REGISTRY.register(Histogram(
+    'ytarchiver_api_latency_seconds', 'Latency of YouTube API calls', ['method']
+))
+QUOTA_UNITS = REGISTRY.register(Counter(
+    'ytarchiver_quota_units_total', 'YouTube API quota units spent', ['method']
+))
+QUOTA_USED_TODAY = REGISTRY.register(Gauge(
+    'ytarchiver_quota_used_today_units', 'YouTube API quota units spent since the last reset'
+))
+QUOTA_PROJECTED_EXHAUSTION = REGISTRY.register(Gauge(
+    'ytarchiver_quota_projected_exhaustion_timestamp_seconds',
+    'Time when the daily quota budget is projected to run out, 0 if it lasts until the reset'
+))
+VIDEOS = REGISTRY.register(Counter(
+    'ytarchiver_videos_total', 'Videos added to the archive', ['channel']
+))
+NEW_VIDEOS = REGISTRY.register(Counter(
+    'ytarchiver_new_videos_total', 'New videos found by lookups', ['channel']
+))
+ACTIVE_LIVESTREAM_RECORDERS = REGISTRY.register(Gauge(
+    'ytarchiver_active_livestream_recorders', 'Livestreams being recorded'
+))
+ACTIVE_VIDEO_DOWNLOADS = REGISTRY.register(Gauge(
+    'ytarchiver_active_video_downloads', 'Videos being downloaded or waiting for a worker'
+))
+RECORDING_BYTES_WRITTEN = REGISTRY.register(Gauge(
+    'ytarchiver_recording_bytes_written', 'Bytes written by active livestream recordings', ['video_id']
+))
+RECORDING_THROUGHPUT = REGISTRY.register(Gauge(
+    'ytarchiver_recording_throughput_bytes', 'Average write throughput of active livestream recordings', ['video_id']
+))
+DOWNLOADED_BYTES = REGISTRY.register(Counter(
+    'ytarchiver_downloaded_bytes_total', 'Bytes downloaded by video downloads'
+))
+EVENTS_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'ytarchiver_events_queue_depth', 'Events waiting for delivery to plugins'
+))
+DISPATCH_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'ytarchiver_dispatch_queue_depth', 'Events waiting in a dispatch queue', ['queue']
+))
+DISPATCH_PUBLISHED = REGISTRY.register(Counter(
+    'ytarchiver_dispatch_published_total', 'Events published to a dispatch queue', ['queue']
+))
+DISPATCH_DELIVERED = REGISTRY.register(Counter(
+    'ytarchiver_dispatch_delivered_total', 'Events delivered from a dispatch queue', ['queue']
+))
+DISPATCH_DROPPED = REGISTRY.register(Counter(
+    'ytarchiver_dispatch_dropped_total', 'Events dropped by a full dispatch queue', ['queue']
+))
+DISPATCH_LATENCY = REGISTRY.register(Histogram(
+    'ytarchiver_dispatch_latency_seconds', 'Time from publishing of an event to its delivery', ['queue']
+))
+RESPONSE_CACHE_HITS = REGISTRY.register(Counter(
+    'ytarchiver_response_cache_hits_total', 'Conditional API requests answered with unchanged response'
+))
+RESPONSE_CACHE_MISSES = REGISTRY.register(Counter(
+    'ytarchiver_response_cache_misses_total', 'Cacheable API requests answered with a new response'
+))
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int, address: str='', registry: MetricsRegistry=REGISTRY) -> HTTPServer:
+    """
+    Starts HTTP server exposing metrics under /metrics in the background
+
+    :param port: port to listen on, 0 picks a free one
+    :param address: address to listen on, all interfaces by default
+    :param registry: metrics to expose
+    :return: running server
+    """
+    handler = type('MetricsHandler', (_MetricsHandler,), {'registry': registry})
+    server = _ThreadingHTTPServer((address, port), handler)
+    thread = threading.Thread(name='ytarchiver-metrics', target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def _format_labels(names: Tuple, values: Tuple) -> str:
+    if len(names) == 0:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, _escape(value)) for name, value in zip(names, values)) + '}'
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value) if isinstance(value, float) else str(value)
@@ -1,27 +1,83 @@
+import json
 import logging
-
-import yaml
-import requests
+import os
+import threading
+import time
+from collections import deque
+from itertools import islice, takewhile
 
 from ytarchiver.common import PluginsManager, Plugin, Event
+from ytarchiver.dispatch import DROP_POLICY_DROP_NEWEST, DROP_POLICY_DROP_OLDEST
+from ytarchiver.lazy import lazy_import
+
+requests = lazy_import('requests')
+yaml = lazy_import('yaml')
 
 
 class HttpPlugin(Plugin):
     """
     HttpPlugin send HTTP request every time new video or new livestream is fetched from one of monitored channels.
     By default it skips videos that are already uploaded before application is started.
+    Requests are sent from a background thread over a pooled connection, so slow endpoint never blocks lookups.
+    Failed deliveries are retried with exponential backoff. Optionally events are batched into a single request
+    and undelivered events are kept in a spool file, which is read again on restart.
+    At most max_pending events wait for delivery, the drop policy decides whether the newest or the oldest one is
+    dropped when there are more. Spool file is only appended to, by the background thread, and it is rewritten
+    once delivered events take most of it.
     """
 
     DEFAULT_TIMEOUT = 5
+    DEFAULT_BATCH_SIZE = 1
+    DEFAULT_RETRY_BACKOFF = 1
+    DEFAULT_MAX_BACKOFF = 300
+    DEFAULT_MAX_PENDING = 10000
+    DEFAULT_DROP_POLICY = DROP_POLICY_DROP_OLDEST
+    SPOOL_COMPACTION_MIN_LINES = 1000
 
     def __init__(self, config):
         self._config = config
         self._timeout = HttpPlugin.DEFAULT_TIMEOUT
+        self._batch_size = HttpPlugin.DEFAULT_BATCH_SIZE
+        self._retry_backoff = HttpPlugin.DEFAULT_RETRY_BACKOFF
+        self._max_backoff = HttpPlugin.DEFAULT_MAX_BACKOFF
+        self._max_pending = HttpPlugin.DEFAULT_MAX_PENDING
+        self._drop_policy = HttpPlugin.DEFAULT_DROP_POLICY
+        self._spool_path = None
 
-        if 'url' not in self._config:
+        if self._config is None or 'url' not in self._config:
             raise Exception('missing required parameter "url" for http plugin')
         if 'timeout' in self._config:
             self._timeout = int(self._config['timeout'])
+        if 'batch_size' in self._config:
+            self._batch_size = max(int(self._config['batch_size']), 1)
+        if 'retry_backoff' in self._config:
+            self._retry_backoff = float(self._config['retry_backoff'])
+        if 'max_backoff' in self._config:
+            self._max_backoff = float(self._config['max_backoff'])
+        if 'max_pending' in self._config:
+            self._max_pending = max(int(self._config['max_pending']), 1)
+        if 'drop_policy' in self._config:
+            self._drop_policy = self._config['drop_policy']
+        if 'spool' in self._config:
+            self._spool_path = self._config['spool']
+        if self._drop_policy not in [DROP_POLICY_DROP_NEWEST, DROP_POLICY_DROP_OLDEST]:
+            raise Exception('unknown drop_policy "{}" for http plugin'.format(self._drop_policy))
+
+        self.dropped = 0
+        self._logger = logging.getLogger('ytarchiver')
+        self._session = requests.Session()
+        self._pending = deque()
+        self._last_sequence = 0
+        self._spooled_sequence = 0
+        self._delivered_sequence = 0
+        self._spool_lines = 0
+        self._condition = threading.Condition()
+
+        if self._spool_path is not None and os.path.isfile(self._spool_path):
+            self._load_spool()
+
+        self._worker = threading.Thread(name='ytarchiver-http-plugin', target=self._deliver_forever, daemon=True)
+        self._worker.start()
 
     def on_event(self, event: Event, is_first_run: bool):
         if is_first_run:
@@ -38,11 +94,26 @@ class HttpPlugin(Plugin):
             }
         }
 
-        requests.post(
-            self._config['url'],
-            json=payload,
-            timeout=self._timeout
-        )
+        with self._condition:
+            queue_full = len(self._pending) >= self._max_pending
+            if queue_full:
+                self.dropped += 1
+                if self._drop_policy == DROP_POLICY_DROP_OLDEST:
+                    self._pending.popleft()
+            if not queue_full or self._drop_policy == DROP_POLICY_DROP_OLDEST:
+                self._last_sequence += 1
+                self._pending.append((self._last_sequence, payload))
+                self._condition.notify()
+
+        if queue_full:
+            self._logger.error('http plugin: queue is full, event dropped')
+
+    def pending_events(self) -> int:
+        """
+        :return: number of events which are not delivered yet
+        """
+        with self._condition:
+            return len(self._pending)
 
     def _translate_event_type(self, event_type: int) -> str:
         if event_type == Event.NEW_VIDEO:
@@ -54,6 +125,106 @@ class HttpPlugin(Plugin):
         elif event_type == Event.LIVESTREAM_INTERRUPTED:
             return 'livestream_interrupted'
 
+    def _deliver_forever(self):
+        while True:
+            with self._condition:
+                while len(self._pending) == 0:
+                    self._condition.wait()
+                batch = list(islice(self._pending, self._batch_size))
+
+            self._append_to_spool()
+            self._deliver([payload for _, payload in batch])
+
+            with self._condition:
+                # events of the batch might have been dropped in the meantime by drop-oldest policy
+                while len(self._pending) > 0 and self._pending[0][0] <= batch[-1][0]:
+                    self._pending.popleft()
+            self._append_to_spool()
+
+    def _deliver(self, batch: list):
+        payload = batch[0] if self._batch_size == 1 else {'events': batch}
+        backoff = self._retry_backoff
+
+        while True:
+            try:
+                response = self._session.post(self._config['url'], json=payload, timeout=self._timeout)
+                if response.status_code < 400:
+                    return
+                if response.status_code < 500 and response.status_code != 429:
+                    self._logger.error('http plugin: endpoint rejected {} event(s) with status {}, dropping'.format(
+                        len(batch),
+                        response.status_code
+                    ))
+                    return
+                self._logger.error('http plugin: endpoint responded with status {}'.format(response.status_code))
+            except requests.RequestException:
+                self._logger.exception('http plugin: error while sending event(s)')
+
+            self._append_to_spool()
+            time.sleep(backoff)
+            backoff = min(backoff * 2, self._max_backoff)
+
+    def _load_spool(self):
+        # spool holds numbered events and numbers of the newest delivered ones, events are numbered again on load
+        events = []
+        delivered_sequence = 0
+        try:
+            with open(self._spool_path, 'r') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    if 'delivered' in record:
+                        delivered_sequence = max(delivered_sequence, record['delivered'])
+                    else:
+                        events.append((record['sequence'], record['event']))
+        except (IOError, ValueError):
+            self._logger.exception('http plugin: error while loading spool file "{}"'.format(self._spool_path))
+
+        for sequence, payload in events[-self._max_pending:]:
+            if sequence > delivered_sequence:
+                self._last_sequence += 1
+                self._pending.append((self._last_sequence, payload))
+        self._append_to_spool(rewrite=True)
+
+    def _append_to_spool(self, rewrite: bool=False):
+        if self._spool_path is None:
+            return
+
+        with self._condition:
+            compaction_threshold = max(2 * len(self._pending), HttpPlugin.SPOOL_COMPACTION_MIN_LINES)
+            rewrite = rewrite or self._spool_lines >= compaction_threshold or \
+                (len(self._pending) == 0 and self._spool_lines > 0)
+            if rewrite:
+                events = list(self._pending)
+            else:
+                events = list(takewhile(lambda event: event[0] > self._spooled_sequence, reversed(self._pending)))
+                events.reverse()
+            delivered_sequence = self._pending[0][0] - 1 if len(self._pending) > 0 else self._last_sequence
+
+        lines = [json.dumps({'sequence': sequence, 'event': payload}, default=str) for sequence, payload in events]
+        if not rewrite and delivered_sequence > self._delivered_sequence:
+            lines.append(json.dumps({'delivered': delivered_sequence}))
+        if not rewrite and len(lines) == 0:
+            return
+
+        try:
+            if rewrite:
+                temporary_path = self._spool_path + '.tmp'
+                with open(temporary_path, 'w') as f:
+                    f.writelines(line + '\n' for line in lines)
+                os.replace(temporary_path, self._spool_path)
+                self._spool_lines = len(lines)
+            else:
+                with open(self._spool_path, 'a') as f:
+                    f.writelines(line + '\n' for line in lines)
+                self._spool_lines += len(lines)
+            if len(events) > 0:
+                self._spooled_sequence = events[-1][0]
+            self._delivered_sequence = delivered_sequence
+        except IOError:
+            self._logger.exception('http plugin: error while saving spool file "{}"'.format(self._spool_path))
+
 
 PLUGINS = {
     'http': HttpPlugin
@@ -0,0 +1,182 @@
+import cProfile
+import heapq
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional
+
+PROFILES_DIRECTORY = 'profiles'
+SLOWEST_CHANNELS_LOGGED = 5
+
+_active_profiler = None
+
+
+class LookupProfiler:
+    """
+    Measures time spent in stages of every lookup cycle, in total and per channel, and logs the breakdown at the end
+    of the cycle. Optionally runs cProfile during every cycle and keeps pstats dumps of the slowest cycles.
+    cProfile covers only the thread running the lookup, stage timers cover all threads.
+    """
+
+    def __init__(self, output_dir: str, dump_slowest: int=0):
+        self.output_dir = output_dir
+        self.dump_slowest = dump_slowest
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stages = {}
+        self._channels = {}
+        self._cycle_started_at = None
+        self._cprofile = None
+        self._slowest_dumps = []
+
+    def begin_cycle(self):
+        with self._lock:
+            self._stages = {}
+            self._channels = {}
+        self._cycle_started_at = time.monotonic()
+        if self.dump_slowest > 0:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    def end_cycle(self, logger: logging.Logger):
+        if self._cycle_started_at is None:
+            return
+        duration = time.monotonic() - self._cycle_started_at
+        self._cycle_started_at = None
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            self._keep_if_slowest(self._cprofile, duration, logger)
+            self._cprofile = None
+
+        with self._lock:
+            stages = dict(self._stages)
+            channels = {channel_id: dict(stages) for channel_id, stages in self._channels.items()}
+
+        logger.info('lookup profile: {:.3f}s total, {}'.format(duration, _format_stages(stages, duration)))
+        slowest_channels = sorted(channels.items(), key=lambda entry: -entry[1].get(_CHANNEL_TOTAL, 0))
+        for i, (channel_id, channel_stages) in enumerate(slowest_channels):
+            total = channel_stages.pop(_CHANNEL_TOTAL, 0)
+            log = logger.info if i < SLOWEST_CHANNELS_LOGGED else logger.debug
+            log('channel "{}" profile: {:.3f}s total, {}'.format(
+                channel_id,
+                total,
+                _format_stages(channel_stages, total)
+            ))
+
+    @contextmanager
+    def channel(self, channel_id: str):
+        previous = getattr(self._local, 'channel_id', None)
+        self._local.channel_id = channel_id
+        started_at = time.monotonic()
+        try:
+            yield
+        finally:
+            self._local.channel_id = previous
+            self._add(channel_id, _CHANNEL_TOTAL, time.monotonic() - started_at)
+
+    @contextmanager
+    def stage(self, name: str):
+        started_at = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started_at
+            with self._lock:
+                self._stages[name] = self._stages.get(name, 0.0) + elapsed
+            channel_id = getattr(self._local, 'channel_id', None)
+            if channel_id is not None:
+                self._add(channel_id, name, elapsed)
+
+    def _add(self, channel_id: str, name: str, elapsed: float):
+        with self._lock:
+            stages = self._channels.setdefault(channel_id, {})
+            stages[name] = stages.get(name, 0.0) + elapsed
+
+    def _keep_if_slowest(self, profile: cProfile.Profile, duration: float, logger: logging.Logger):
+        if len(self._slowest_dumps) >= self.dump_slowest and duration <= self._slowest_dumps[0][0]:
+            return
+
+        directory = os.path.join(self.output_dir, PROFILES_DIRECTORY)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, 'lookup_{}_{:.3f}s.pstats'.format(
+            datetime.now().strftime('%Y-%m-%dT%H-%M-%S'),
+            duration
+        ))
+        profile.dump_stats(path)
+        heapq.heappush(self._slowest_dumps, (duration, path))
+        logger.debug('profile of lookup saved to "{}"'.format(path))
+
+        while len(self._slowest_dumps) > self.dump_slowest:
+            _, evicted_path = heapq.heappop(self._slowest_dumps)
+            try:
+                os.remove(evicted_path)
+            except OSError:
+                pass
+
+
+class _NoopContext:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_CHANNEL_TOTAL = 'total'
+_NOOP_CONTEXT = _NoopContext()
+
+
+def enable(profiler: Optional[LookupProfiler]):
+    """
+    Makes given profiler measure all further lookups
+
+    :param profiler: profiler, or None to disable profiling
+    """
+    global _active_profiler
+    _active_profiler = profiler
+
+
+def begin_cycle():
+    if _active_profiler is not None:
+        _active_profiler.begin_cycle()
+
+
+def end_cycle(logger: logging.Logger):
+    if _active_profiler is not None:
+        _active_profiler.end_cycle(logger)
+
+
+def channel(channel_id: str):
+    """
+    Attributes stages measured on the current thread to given channel
+
+    :param channel_id: ID of the channel
+    :return: context manager
+    """
+    if _active_profiler is None:
+        return _NOOP_CONTEXT
+    return _active_profiler.channel(channel_id)
+
+
+def stage(name: str):
+    """
+    Measures time spent in a stage of lookup
+
+    :param name: name of the stage
+    :return: context manager
+    """
+    if _active_profiler is None:
+        return _NOOP_CONTEXT
+    return _active_profiler.stage(name)
+
+
+def _format_stages(stages: dict, total: float) -> str:
+    if len(stages) == 0:
+        return 'no stages'
+    return ', '.join(
+        '{}: {:.3f}s ({:.0%})'.format(name, elapsed, elapsed / total if total > 0 else 0)
+        for name, elapsed in sorted(stages.items(), key=lambda entry: -entry[1])
+    )
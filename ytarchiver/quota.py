@@ -0,0 +1,186 @@
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+
+QUOTA_FILE = 'quota.json'
+
+
+def pacific_time(now: datetime) -> datetime:
+    """
+    Converts UTC time to US Pacific time, which is the time zone of YouTube API quota resets.
+
+    :param now: naive UTC time
+    :return: naive Pacific time
+    """
+    dst_start = _nth_sunday(now.year, 3, 2) + timedelta(hours=10)
+    dst_end = _nth_sunday(now.year, 11, 1) + timedelta(hours=9)
+    offset = -7 if dst_start <= now < dst_end else -8
+    return now + timedelta(hours=offset)
+
+
+class QuotaLedger:
+    """
+    Counts quota units spent on API calls during the current quota day (midnight to midnight Pacific time).
+    Is able to persist its state, so the count survives restarts.
+    """
+
+    def __init__(self, path: str=None, daily_budget: int=None):
+        self.path = path
+        self.daily_budget = daily_budget
+        self.charged_total = 0
+        self._lock = threading.Lock()
+        self._day = _quota_day(datetime.utcnow())
+        self._used = 0
+        self._used_by_method = {}
+
+        if path is not None and os.path.isfile(path):
+            self._load()
+
+    def charge(self, method: str, units: int):
+        """
+        Registers cost of a single API call
+
+        :param method: name of the API method, such as "search.list"
+        :param units: cost in quota units
+        """
+        with self._lock:
+            self._roll_over(datetime.utcnow())
+            self._used += units
+            self._used_by_method[method] = self._used_by_method.get(method, 0) + units
+            self.charged_total += units
+
+    def used_today(self) -> int:
+        with self._lock:
+            self._roll_over(datetime.utcnow())
+            return self._used
+
+    def used_by_method(self) -> dict:
+        with self._lock:
+            self._roll_over(datetime.utcnow())
+            return dict(self._used_by_method)
+
+    def seconds_until_reset(self, now: datetime=None) -> float:
+        """
+        :param now: current UTC time
+        :return: seconds until the next quota reset
+        """
+        now = now or datetime.utcnow()
+        pacific_now = pacific_time(now)
+        next_midnight = datetime(pacific_now.year, pacific_now.month, pacific_now.day) + timedelta(days=1)
+        return (next_midnight - pacific_now).total_seconds()
+
+    def projected_exhaustion(self, now: datetime=None) -> Optional[datetime]:
+        """
+        Projects when the daily budget runs out if units are spent at the average rate observed since the last reset.
+
+        :param now: current UTC time
+        :return: UTC time of exhaustion, or None if the budget lasts until the next reset
+        """
+        if self.daily_budget is None:
+            return None
+
+        now = now or datetime.utcnow()
+        used = self.used_today()
+        if used >= self.daily_budget:
+            return now
+
+        pacific_now = pacific_time(now)
+        elapsed = (pacific_now - datetime(pacific_now.year, pacific_now.month, pacific_now.day)).total_seconds()
+        if used == 0 or elapsed <= 0:
+            return None
+
+        seconds_left = (self.daily_budget - used) / (used / elapsed)
+        if seconds_left >= self.seconds_until_reset(now):
+            return None
+        return now + timedelta(seconds=seconds_left)
+
+    def spending_ratio(self, now: datetime=None) -> float:
+        """
+        Compares the average rate of spending since the last reset with the rate which spreads the remaining budget
+        evenly until the next reset.
+
+        :param now: current UTC time
+        :return: ratio of both rates, values above 1 mean the budget is going to run out before the reset
+        """
+        if self.daily_budget is None:
+            return 0.0
+
+        now = now or datetime.utcnow()
+        used = self.used_today()
+        remaining = self.daily_budget - used
+        if remaining <= 0:
+            return float('inf')
+
+        pacific_now = pacific_time(now)
+        elapsed = (pacific_now - datetime(pacific_now.year, pacific_now.month, pacific_now.day)).total_seconds()
+        if elapsed <= 0:
+            return 0.0
+        return (used / elapsed) / (remaining / self.seconds_until_reset(now))
+
+    def suggest_refresh_time(self, cycle_cost: int, min_time: float, max_time: float, now: datetime=None) -> float:
+        """
+        Computes delay between lookups which spreads the remaining budget evenly until the next reset.
+
+        :param cycle_cost: quota units spent by a single lookup
+        :param min_time: lower bound of the delay in seconds
+        :param max_time: upper bound of the delay in seconds
+        :param now: current UTC time
+        :return: delay in seconds
+        """
+        now = now or datetime.utcnow()
+        remaining = self.daily_budget - self.used_today()
+        if remaining <= 0:
+            return max(min(self.seconds_until_reset(now), max_time), min_time)
+
+        refresh_time = cycle_cost * self.seconds_until_reset(now) / remaining
+        return max(min(refresh_time, max_time), min_time)
+
+    def save(self):
+        """
+        Writes current state to the file given at creation
+        """
+        if self.path is None:
+            return
+
+        with self._lock:
+            document = {
+                'day': self._day,
+                'used': self._used,
+                'used_by_method': self._used_by_method
+            }
+
+        temporary_path = self.path + '.tmp'
+        with open(temporary_path, 'w') as f:
+            json.dump(document, f)
+        os.replace(temporary_path, self.path)
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                document = json.load(f)
+        except (ValueError, OSError):
+            logging.getLogger('ytarchiver').exception('unable to read quota usage, assuming no usage today')
+            return
+
+        if document.get('day') == self._day:
+            self._used = document.get('used', 0)
+            self._used_by_method = document.get('used_by_method', {})
+
+    def _roll_over(self, now: datetime):
+        day = _quota_day(now)
+        if day != self._day:
+            self._day = day
+            self._used = 0
+            self._used_by_method = {}
+
+
+def _quota_day(now: datetime) -> str:
+    return pacific_time(now).strftime('%Y-%m-%d')
+
+
+def _nth_sunday(year: int, month: int, n: int) -> datetime:
+    first_day = datetime(year, month, 1)
+    return first_day + timedelta(days=(6 - first_day.weekday()) % 7 + 7 * (n - 1))
@@ -0,0 +1,154 @@
+import multiprocessing
+import time
+from datetime import datetime
+from typing import List, Tuple, Optional
+
+PRIORITY_LIVESTREAM = 'livestream'
+PRIORITY_VIDEO = 'video'
+BURST_SEC = 1.0
+MAX_WAIT_SEC = 1.0
+
+
+class TokenBucket:
+    """
+    Token bucket kept in shared memory, so all processes started after its creation draw from the same budget.
+    Tokens are added continuously at the configured rate, up to one second worth of them.
+    """
+
+    def __init__(self, rate: float):
+        self._lock = multiprocessing.Lock()
+        self._rate = multiprocessing.Value('d', rate, lock=False)
+        self._tokens = multiprocessing.Value('d', rate * BURST_SEC, lock=False)
+        self._updated_at = multiprocessing.Value('d', time.monotonic(), lock=False)
+
+    @property
+    def rate(self) -> float:
+        return self._rate.value
+
+    def set_rate(self, rate: float):
+        """
+        Changes rate of the bucket for all processes
+
+        :param rate: tokens per second, 0 disables the limit
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self._rate.value = rate
+
+    def consume(self, tokens: int, allow_debt: bool=False):
+        """
+        Takes given number of tokens from the bucket. Blocks until they are available.
+
+        :param tokens: number of tokens to take
+        :param allow_debt: take the tokens immediately, even if the bucket goes below zero, which delays other consumers
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._rate.value <= 0 or allow_debt or self._tokens.value >= min(tokens, self._capacity()):
+                    self._tokens.value -= tokens
+                    return
+                missing = min(tokens, self._capacity()) - self._tokens.value
+                delay = missing / self._rate.value
+
+            time.sleep(min(delay, MAX_WAIT_SEC))
+
+    def _capacity(self) -> float:
+        return self._rate.value * BURST_SEC
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated_at.value
+        self._updated_at.value = now
+        if self._rate.value > 0:
+            self._tokens.value = min(self._tokens.value + elapsed * self._rate.value, self._capacity())
+
+
+class BandwidthLimiter:
+    """
+    Limits combined throughput of all recorders, in the main process and in livestream recording processes.
+    Every recorder is limited by the budget of its kind and by the global budget. Livestreams take precedence:
+    they never wait for the global budget, but their transfers are counted in it, so videos slow down instead.
+    Global budget might follow a time of day schedule.
+    """
+
+    def __init__(self,
+                 total_rate: float=0,
+                 video_rate: float=0,
+                 livestream_rate: float=0,
+                 schedule: List[Tuple[int, int, float]]=None):
+        self.default_rate = total_rate
+        self.schedule = schedule or []
+        self._total = TokenBucket(self._scheduled_rate(datetime.now()))
+        self._buckets = {
+            PRIORITY_VIDEO: TokenBucket(video_rate),
+            PRIORITY_LIVESTREAM: TokenBucket(livestream_rate)
+        }
+
+    def acquire(self, nbytes: int, priority: str=PRIORITY_VIDEO):
+        """
+        Blocks until given number of bytes might be transferred
+
+        :param nbytes: number of bytes
+        :param priority: kind of recorder, either "video" or "livestream"
+        """
+        rate = self._scheduled_rate(datetime.now())
+        if rate != self._total.rate:
+            self._total.set_rate(rate)
+
+        self._buckets[priority].consume(nbytes)
+        self._total.consume(nbytes, allow_debt=priority == PRIORITY_LIVESTREAM)
+
+    def _scheduled_rate(self, now: datetime) -> float:
+        minute = now.hour * 60 + now.minute
+        for start, end, rate in self.schedule:
+            if start <= minute < end or (end < start and (minute >= start or minute < end)):
+                return rate
+        return self.default_rate
+
+
+def parse_bandwidth_schedule(schedule: Optional[str]) -> List[Tuple[int, int, float]]:
+    """
+    Parses schedule of bandwidth limits
+
+    :param schedule: comma separated entries in format HH:MM-HH:MM=KB/s, such as "08:00-23:00=1024",
+                     ranges passing midnight are allowed
+    :return: list of tuples with start minute, end minute and rate in bytes per second
+    :exception ValueError
+    """
+    if not schedule:
+        return []
+
+    entries = []
+    for entry in schedule.split(','):
+        time_range, rate = entry.strip().split('=')
+        start, end = time_range.split('-')
+        entries.append((_parse_minute(start), _parse_minute(end), float(rate) * 1024))
+    return entries
+
+
+def create_bandwidth_limiter(config) -> Optional[BandwidthLimiter]:
+    """
+    Creates limiter configured from command line
+
+    :param config: configuration
+    :return: limiter, or None if no limits are configured
+    """
+    schedule = parse_bandwidth_schedule(config.bandwidth_schedule)
+    if config.bandwidth_limit <= 0 and config.video_bandwidth_limit <= 0 and \
+            config.livestream_bandwidth_limit <= 0 and len(schedule) == 0:
+        return None
+
+    return BandwidthLimiter(
+        total_rate=config.bandwidth_limit * 1024,
+        video_rate=config.video_bandwidth_limit * 1024,
+        livestream_rate=config.livestream_bandwidth_limit * 1024,
+        schedule=schedule
+    )
+
+
+def _parse_minute(s: str) -> int:
+    hours, minutes = s.strip().split(':')
+    if not 0 <= int(hours) < 24 or not 0 <= int(minutes) < 60:
+        raise ValueError('invalid time "{}"'.format(s))
+    return int(hours) * 60 + int(minutes)
@@ -1,11 +1,15 @@
 import logging
+import queue
+import threading
 from abc import ABCMeta, abstractmethod
 from multiprocessing import Queue, Process
 from queue import Empty
-from typing import Iterator
+from typing import Iterator, List
 
+from ytarchiver import metrics
 from ytarchiver.common import RecordersController, ContentItem, Context, Event
-from ytarchiver.download import download_livestream, download_video, DownloadError, LivestreamInterrupted
+from ytarchiver.download import download_livestream, download_video, DownloadError, LivestreamInterrupted, \
+    RecordingStatistics
 
 
 class RecorderShutdownMessage:
@@ -17,6 +21,27 @@ class RecorderShutdownMessage:
         self.recorder_to_shutdown = recorder_to_shutdown
 
 
+class RecorderSegmentMessage:
+    """
+    Message send by recorder when it starts writing a new segment of the recording
+    """
+
+    def __init__(self, recording_id: str, filename: str):
+        self.recording_id = recording_id
+        self.filename = filename
+
+
+class RecorderProgressMessage:
+    """
+    Message send periodically by recorder with statistics of the recording
+    """
+
+    def __init__(self, recording_id: str, bytes_written: int, throughput: float):
+        self.recording_id = recording_id
+        self.bytes_written = bytes_written
+        self.throughput = throughput
+
+
 class MultiprocessRecordersQueue:
     """
     Queue to communicate recorders running inside different processes
@@ -34,6 +59,14 @@ class MultiprocessRecordersQueue:
         except Empty:
             pass
 
+    def wait_for_message(self) -> RecorderShutdownMessage:
+        """
+        Blocks until the next message arrives
+
+        :return: received message
+        """
+        return self._queue.get()
+
     def send_message(self, message: RecorderShutdownMessage):
         self._queue.put(message, block=False)
 
@@ -57,22 +90,109 @@ class SynchronousVideoRecordersController(RecordersController):
         context.bus.add_event(Event(type=Event.VIDEO_DOWNLOADED, content=item))
 
 
+class ThreadPoolVideoRecordersController(RecordersController):
+    """
+    Video recorder which downloads videos on a bounded pool of worker threads. Videos are queued and picked up
+    as soon as one of the workers becomes idle, so lookups are never blocked by downloads.
+    """
+
+    def __init__(self, workers: int):
+        self._pending = queue.Queue()
+        self._active_recordings = {}
+        self._lock = threading.Lock()
+        self._workers = []
+
+        for i in range(workers):
+            worker = threading.Thread(
+                name='ytarchiver-video-recorder-{}'.format(i),
+                target=self._worker_loop,
+                daemon=True
+            )
+            worker.start()
+            self._workers.append(worker)
+
+    def update(self, context: Context):
+        pass
+
+    def is_recording_active(self, recording_id: str) -> bool:
+        with self._lock:
+            return recording_id in self._active_recordings
+
+    def start_recording(self, context: Context, item: ContentItem):
+        with self._lock:
+            if item.video_id in self._active_recordings:
+                return
+            self._active_recordings[item.video_id] = item
+            metrics.ACTIVE_VIDEO_DOWNLOADS.set(value=len(self._active_recordings))
+
+        self._pending.put((context, item))
+
+    def pending_recordings(self) -> int:
+        """
+        :return: number of videos which are still waiting for an idle worker
+        """
+        return self._pending.qsize()
+
+    def _worker_loop(self):
+        while True:
+            context, item = self._pending.get()
+            try:
+                download_video(context, item)
+                context.bus.add_event(Event(type=Event.VIDEO_DOWNLOADED, content=item))
+            except DownloadError:
+                context.logger.exception('error while downloading')
+            except Exception:
+                context.logger.exception('unknown error while downloading')
+            finally:
+                with self._lock:
+                    del self._active_recordings[item.video_id]
+                    metrics.ACTIVE_VIDEO_DOWNLOADS.set(value=len(self._active_recordings))
+                self._pending.task_done()
+
+
 class MultiprocessRecordersController(RecordersController, metaclass=ABCMeta):
     """
-    Abstract recorder which is able to control multiple processes.
+    Abstract recorder which is able to control multiple processes. Messages from the processes are handled
+    by a listener thread as soon as they arrive, the listener is started along with the first recording.
     """
 
     def __init__(self):
         self.active_recordings = {}
+        self.recording_segments = {}
         self.recorders_queue = MultiprocessRecordersQueue()
+        self._lock = threading.RLock()
+        self._listener = None
 
     def update(self, context: Context):
         for message in self.recorders_queue.check_for_messages():
-            self.recording_stopped(context, self.active_recordings[message.recorder_to_shutdown])
-            del self.active_recordings[message.recorder_to_shutdown]
+            self._handle_message(context, message)
+
+    def listen(self, context: Context):
+        """
+        Starts a background thread handling messages from recorders, if it's not running yet
+
+        :param context: execution context
+        """
+        with self._lock:
+            if self._listener is not None:
+                return
+            self._listener = threading.Thread(
+                name='ytarchiver-recorders-listener',
+                target=self._listen_forever,
+                args=(context,),
+                daemon=True
+            )
+            self._listener.start()
 
     def is_recording_active(self, recording_id: str) -> bool:
-        return recording_id in self.active_recordings
+        with self._lock:
+            return recording_id in self.active_recordings
+
+    def recording_segment_started(self, context: Context, item: ContentItem, segments: List[str]):
+        pass
+
+    def recording_progress(self, context: Context, item: ContentItem, progress: RecorderProgressMessage):
+        pass
 
     def recording_stopped(self, context: Context, item: ContentItem):
         pass
@@ -81,6 +201,40 @@ class MultiprocessRecordersController(RecordersController, metaclass=ABCMeta):
     def start_recording(self, context: Context, item: ContentItem):
         pass
 
+    def _listen_forever(self, context: Context):
+        while True:
+            try:
+                message = self.recorders_queue.wait_for_message()
+            except (EOFError, OSError):
+                return  # queue is closed on interpreter shutdown
+            try:
+                self._handle_message(context, message)
+            except Exception:
+                context.logger.exception('error while handling message from recorder')
+
+    def _handle_message(self, context: Context, message):
+        if isinstance(message, RecorderProgressMessage):
+            with self._lock:
+                item = self.active_recordings.get(message.recording_id)
+            if item is not None:
+                self.recording_progress(context, item, message)
+        elif isinstance(message, RecorderSegmentMessage):
+            with self._lock:
+                item = self.active_recordings.get(message.recording_id)
+                segments = self.recording_segments.setdefault(message.recording_id, [])
+                if item is None or message.filename in segments:
+                    return
+                segments.append(message.filename)
+                segments = list(segments)
+            self.recording_segment_started(context, item, segments)
+        else:
+            with self._lock:
+                item = self.active_recordings.pop(message.recorder_to_shutdown, None)
+                self.recording_segments.pop(message.recorder_to_shutdown, None)
+                metrics.ACTIVE_LIVESTREAM_RECORDERS.set(value=len(self.active_recordings))
+            if item is not None:
+                self.recording_stopped(context, item)
+
 
 class MultiprocessLivestreamRecordersController(MultiprocessRecordersController):
     """
@@ -90,23 +244,57 @@ class MultiprocessLivestreamRecordersController(MultiprocessRecordersController)
     def __init__(self):
         super(MultiprocessLivestreamRecordersController, self).__init__()
 
+    def recording_segment_started(self, context: Context, item: ContentItem, segments: List[str]):
+        with context.storage.open(context.config) as storage:
+            storage.update_livestream_segments(item, segments)
+
+    def recording_progress(self, context: Context, item: ContentItem, progress: RecorderProgressMessage):
+        metrics.RECORDING_BYTES_WRITTEN.set(item.video_id, value=progress.bytes_written)
+        metrics.RECORDING_THROUGHPUT.set(item.video_id, value=progress.throughput)
+
     def recording_stopped(self, context: Context, item: ContentItem):
+        metrics.RECORDING_BYTES_WRITTEN.remove(item.video_id)
+        metrics.RECORDING_THROUGHPUT.remove(item.video_id)
         context.bus.add_event(Event(type=Event.LIVESTREAM_INTERRUPTED, content=item))
 
     def start_recording(self, context: Context, item: ContentItem):
-        self.active_recordings[item.video_id] = item
+        with self._lock:
+            self.active_recordings[item.video_id] = item
+            metrics.ACTIVE_LIVESTREAM_RECORDERS.set(value=len(self.active_recordings))
+        self.listen(context)
 
+        options = {
+            'chunk_size': context.config.livestream_chunk_size * 1024,
+            'buffers': context.config.livestream_buffers,
+            'fsync_interval': context.config.fsync_interval,
+            'max_reconnects': context.config.reconnect_attempts,
+            'limiter': context.bandwidth_limiter,
+            'base_url': context.config.base_url
+        }
         process = Process(
             name='ytarchiver-livestream-recorder',
             target=_livestream_recorder_task,
-            args=(item, self.recorders_queue, context.logger)
+            args=(item, self.recorders_queue, context.logger, options)
         )
         process.start()
 
 
-def _livestream_recorder_task(item: ContentItem, recorders_queue: MultiprocessRecordersQueue, logger: logging.Logger):
+def _livestream_recorder_task(item: ContentItem,
+                              recorders_queue: MultiprocessRecordersQueue,
+                              logger: logging.Logger,
+                              options: dict):
+    def on_segment_started(filename: str):
+        recorders_queue.send_message(RecorderSegmentMessage(recording_id=item.video_id, filename=filename))
+
+    def on_progress(statistics: RecordingStatistics):
+        recorders_queue.send_message(RecorderProgressMessage(
+            recording_id=item.video_id,
+            bytes_written=statistics.bytes_written,
+            throughput=statistics.throughput()
+        ))
+
     try:
-        download_livestream(item, logger)
+        download_livestream(item, logger, on_segment_started=on_segment_started, on_progress=on_progress, **options)
     except DownloadError:
         logger.exception('error while recording livestream')
     except LivestreamInterrupted as e:
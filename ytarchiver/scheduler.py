@@ -0,0 +1,101 @@
+import heapq
+import random
+from datetime import datetime
+from typing import List, Optional
+
+UPLOAD_HISTORY_LENGTH = 10
+POLLS_PER_UPLOAD = 10
+DEFAULT_JITTER = 0.1
+TIMESTAMP_FORMATS = ['%Y-%m-%dT%H:%M:%S.%fZ', '%Y-%m-%dT%H:%M:%SZ']
+
+
+class ChannelScheduler:
+    """
+    Decides when every channel should be looked up next. Channels are kept in a priority queue ordered by the time
+    they are due. Interval of every channel follows its upload history, so channels which upload often are polled
+    often and inactive ones rarely.
+    """
+
+    def __init__(self,
+                 min_interval: float,
+                 max_interval: float,
+                 default_interval: float,
+                 jitter: float=DEFAULT_JITTER):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.default_interval = default_interval
+        self.jitter = jitter
+        self.stretch = 1.0
+        self._queue = []
+
+    def schedule(self, channel_id: str, interval: float, now: float, spread: bool=False):
+        """
+        Schedules next lookup of the channel
+
+        :param channel_id: ID of the channel
+        :param interval: desired time until the next lookup (in seconds)
+        :param now: current time (in seconds, as returned by time.monotonic())
+        :param spread: place the lookup anywhere within the interval, used to spread initial lookups evenly
+        """
+        interval *= self.stretch
+        if spread:
+            delay = random.uniform(0, interval)
+        else:
+            delay = interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+        heapq.heappush(self._queue, (now + delay, channel_id))
+
+    def next_due_time(self) -> Optional[float]:
+        """
+        :return: time when the next lookup is due (in seconds, as time.monotonic()), or None if nothing is scheduled
+        """
+        if len(self._queue) == 0:
+            return None
+        return self._queue[0][0]
+
+    def pop_due_channels(self, now: float) -> List[str]:
+        """
+        Removes all channels which are due from the queue
+
+        :param now: current time (in seconds, as returned by time.monotonic())
+        :return: IDs of due channels
+        """
+        due_channels = []
+        while len(self._queue) > 0 and self._queue[0][0] <= now:
+            due_channels.append(heapq.heappop(self._queue)[1])
+        return due_channels
+
+    def interval_for(self, upload_timestamps: List[int], now: datetime) -> float:
+        """
+        Computes polling interval of the channel from its upload history
+
+        :param upload_timestamps: timestamps of the newest uploads, the newest first
+        :param now: current UTC time
+        :return: interval in seconds
+        """
+        uploads = [timestamp for timestamp in map(parse_timestamp, upload_timestamps) if timestamp is not None]
+        if len(uploads) < 2:
+            return self.default_interval
+
+        mean_gap = (uploads[0] - uploads[-1]).total_seconds() / (len(uploads) - 1)
+        gap = max(mean_gap, (now - uploads[0]).total_seconds())
+        return max(min(gap / POLLS_PER_UPLOAD, self.max_interval), self.min_interval)
+
+
+def parse_timestamp(timestamp) -> Optional[datetime]:
+    """
+    Parses timestamp of video returned by the API or read from the storage
+
+    :param timestamp: timestamp in ISO 8601 format, or seconds since epoch
+    :return: naive UTC time, or None if the format is not recognized
+    """
+    if isinstance(timestamp, datetime):
+        return timestamp
+    if isinstance(timestamp, (int, float)):
+        return datetime.utcfromtimestamp(timestamp)
+
+    for timestamp_format in TIMESTAMP_FORMATS:
+        try:
+            return datetime.strptime(str(timestamp), timestamp_format)
+        except ValueError:
+            pass
+    return None
@@ -1,102 +1,458 @@
+import json
 import os
 import sqlite3
+import threading
+import time
 from contextlib import contextmanager
-from typing import Iterator
+from typing import Iterator, List, Set, Dict, Optional, Tuple
 
-from ytarchiver.common import ContentItem, StorageManager, Storage
+from ytarchiver.common import ContentItem, StorageManager, Storage, ChannelWatermark
+from ytarchiver.index import VideosIndex, create_videos_index
+
+SQLITE_MAX_VARIABLES = 500
+SQLITE_CACHED_STATEMENTS = 256
+SQLITE_CACHE_SIZE_KB = 64 * 1024
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+SQLITE_BUSY_TIMEOUT_SEC = 30
+DEFAULT_WRITE_BATCH_SIZE = 1000
+DEFAULT_WRITE_BATCH_INTERVAL_SEC = 5
+
+# timestamps are stored as seconds since epoch and read back in ISO 8601 format, like publishedAt of the API
+PARSE_TIMESTAMP = "CAST(strftime('%s', ?) AS INTEGER)"
+FORMAT_TIMESTAMP = "strftime('%Y-%m-%dT%H:%M:%SZ', {}, 'unixepoch')"
+
+SELECT_VIDEOS = 'SELECT video_id, channel_id, {}, title, channel_name, filename FROM VIDEOS'.format(
+    FORMAT_TIMESTAMP.format('timestamp')
+)
+SELECT_LIVESTREAMS = 'SELECT video_id, channel_id, {}, title, channel_name, filename FROM LIVESTREAMS'.format(
+    FORMAT_TIMESTAMP.format('timestamp')
+)
+SELECT_VIDEO_IDS = 'SELECT video_id FROM VIDEOS'
+SELECT_UPLOAD_TIMESTAMPS = 'SELECT timestamp FROM VIDEOS WHERE channel_id=? ORDER BY timestamp DESC LIMIT ?'
+SELECT_VIDEO_EXIST = 'SELECT 1 FROM VIDEOS WHERE video_id=?'
+INSERT_VIDEO = 'INSERT OR IGNORE INTO VIDEOS(video_id, channel_id, timestamp, title, channel_name, filename) ' \
+               'VALUES (?, ?, {}, ?, ?, ?)'.format(PARSE_TIMESTAMP)
+INSERT_CHANNEL = 'INSERT OR REPLACE INTO CHANNELS(channel_id, uploads_playlist_id) VALUES (?, ?)'
+SELECT_WATERMARK = 'SELECT channel_id, video_id, {}, backfill_page_token, backfill_complete ' \
+                   'FROM CHANNEL_WATERMARKS WHERE channel_id=?'.format(FORMAT_TIMESTAMP.format('timestamp'))
+INSERT_WATERMARK = 'INSERT OR REPLACE INTO CHANNEL_WATERMARKS' \
+                   '(channel_id, video_id, timestamp, backfill_page_token, backfill_complete) ' \
+                   'VALUES (?, ?, {}, ?, ?)'.format(PARSE_TIMESTAMP)
+SELECT_DOWNLOAD_PROGRESS = 'SELECT offset, total_size FROM DOWNLOADS WHERE video_id=?'
+SELECT_INCOMPLETE_DOWNLOADS = 'SELECT v.video_id, v.channel_id, {}, v.title, v.channel_name, v.filename ' \
+                              'FROM DOWNLOADS d JOIN VIDEOS v ON v.video_id = d.video_id'.format(
+                                  FORMAT_TIMESTAMP.format('v.timestamp')
+                              )
+INSERT_DOWNLOAD_PROGRESS = 'INSERT OR REPLACE INTO DOWNLOADS(video_id, offset, total_size, failures) ' \
+                           'VALUES (?, ?, ?, COALESCE((SELECT failures FROM DOWNLOADS WHERE video_id=?), 0))'
+UPDATE_DOWNLOAD_FAILURES = 'UPDATE DOWNLOADS SET failures = COALESCE(failures, 0) + 1 WHERE video_id=?'
+SELECT_DOWNLOAD_FAILURES = 'SELECT failures FROM DOWNLOADS WHERE video_id=?'
+DELETE_DOWNLOAD = 'DELETE FROM DOWNLOADS WHERE video_id=?'
+UPDATE_LIVESTREAM_SEGMENTS = 'UPDATE LIVESTREAMS SET segments=? WHERE video_id=? AND filename=?'
+INSERT_LIVESTREAM = 'INSERT OR IGNORE INTO LIVESTREAMS' \
+                    '(video_id, channel_id, timestamp, title, channel_name, filename) ' \
+                    'VALUES (?, ?, {}, ?, ?, ?)'.format(PARSE_TIMESTAMP)
+SELECT_SCHEMA_VERSION = 'SELECT version FROM SCHEMA_VERSION'
 
 
 class Sqlite3StorageManager(StorageManager):
     """
-    Is able to open Sqlite3 storage
+    Is able to open Sqlite3 storage. Storage is opened once, on the first use, and stays open until the manager
+    is closed, so the index of known videos and sqlite page cache survive between lookups.
     """
 
+    def __init__(self):
+        self._storage = None
+        self._lock = threading.Lock()
+
     @contextmanager
     def open(self, config) -> 'Sqlite3Storage':
-        s = Sqlite3Storage(config.output_dir)
+        with self._lock:
+            if self._storage is None:
+                self._storage = Sqlite3Storage(
+                    config.output_dir,
+                    batch_size=config.write_batch_size,
+                    batch_interval=config.write_batch_interval
+                )
+                self._storage.load_index(create_videos_index(config))
+        yield self._storage
+        self._storage.sync()
+
+    @contextmanager
+    def open_reader(self, config) -> 'Sqlite3Storage':
+        s = Sqlite3Storage(config.output_dir, read_only=True)
         yield s
         s.close()
 
+    def close(self):
+        with self._lock:
+            if self._storage is not None:
+                self._storage.close()
+                self._storage = None
+
 
 class Sqlite3Storage(Storage):
     """
-    Storage based on Sqlite3
+    Storage based on Sqlite3. Database works in WAL mode, so read-only storages opened on the same file are able
+    to query it while the writer is active. Instances are safe to share between threads.
+
+    Writes are batched. Videos are buffered and inserted with a single executemany, at every commit and before any
+    query which might need them. commit() ends the transaction only once batch_size rows were written since
+    the previous one or batch_interval seconds passed, sync() ends it unconditionally. Storage manager syncs
+    whenever a lookup or a download releases the storage. Livestreams, progress of downloads and removal of finished
+    downloads are synced immediately, as they can't be recovered by the next lookup.
+    After a crash the database holds everything up to the last finished transaction and nothing of the following
+    one, so at most a batch of writes is lost. Lost videos are found again by the next lookup, as it stops only at
+    the first stored video, and inserts skip videos and livestreams which are already stored, so replaying a batch
+    never fails nor duplicates rows.
     """
 
     STORAGE_FILE = 'storage.sqlite'
 
-    def __init__(self, output_directory: str):
+    def __init__(self,
+                 output_directory: str,
+                 index: VideosIndex=None,
+                 read_only: bool=False,
+                 batch_size: int=DEFAULT_WRITE_BATCH_SIZE,
+                 batch_interval: float=DEFAULT_WRITE_BATCH_INTERVAL_SEC):
         path = os.path.join(output_directory, Sqlite3Storage.STORAGE_FILE)
-        storage_exist = os.path.isfile(path)
 
         self.output_directory = output_directory
-        self.connection = sqlite3.connect(path)
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self._index = index
+        self._lock = threading.RLock()
+        self._pending_videos = []
+        self._uncommitted_rows = 0
+        self._last_commit_at = time.monotonic()
 
-        if not storage_exist:
-            self._initialise_schema()
+        if read_only:
+            self.connection = sqlite3.connect(
+                'file:{}?mode=ro'.format(path),
+                uri=True,
+                timeout=SQLITE_BUSY_TIMEOUT_SEC,
+                check_same_thread=False,
+                cached_statements=SQLITE_CACHED_STATEMENTS
+            )
+            self._configure_connection()
+            return
+
+        self.connection = sqlite3.connect(
+            path,
+            timeout=SQLITE_BUSY_TIMEOUT_SEC,
+            check_same_thread=False,
+            cached_statements=SQLITE_CACHED_STATEMENTS
+        )
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self._configure_connection()
+        self._initialise_schema()
+
+    def load_index(self, index: VideosIndex):
+        """
+        Fills given index with IDs of all stored videos and uses it for further existence checks
+
+        :param index: empty index
+        """
+        with self._lock:
+            for (video_id,) in self.connection.execute(SELECT_VIDEO_IDS):
+                index.add(video_id)
+            self._index = index
 
     def close(self):
-        self.connection.commit()
-        self.connection.close()
+        with self._lock:
+            self.sync()
+            self.connection.close()
 
     def list_videos(self) -> Iterator[ContentItem]:
-        cur = self.connection.cursor()
-        cur.execute('SELECT video_id, channel_id, timestamp, title, channel_name, filename FROM VIDEOS')
-        for columns in cur.fetchall():
+        with self._lock:
+            self._flush()
+            rows = self.connection.execute(SELECT_VIDEOS).fetchall()
+        for columns in rows:
             yield ContentItem(*columns)
 
     def list_livestreams(self) -> Iterator[ContentItem]:
-        cur = self.connection.cursor()
-        cur.execute('SELECT video_id, channel_id, timestamp, title, channel_name, filename FROM LIVESTREAMS')
-        for columns in cur.fetchall():
+        with self._lock:
+            rows = self.connection.execute(SELECT_LIVESTREAMS).fetchall()
+        for columns in rows:
             yield ContentItem(*columns)
 
     def video_exist(self, video_id: str):
-        cur = self.connection.cursor()
-        cur.execute('SELECT 1 FROM VIDEOS WHERE video_id=?', (video_id,))
-        return len(list(cur.fetchall())) > 0
+        if self._index is not None:
+            if video_id not in self._index:
+                return False
+            if self._index.is_exact:
+                return True
+
+        with self._lock:
+            self._flush()
+            return self.connection.execute(SELECT_VIDEO_EXIST, (video_id,)).fetchone() is not None
+
+    def find_existing_videos(self, video_ids: List[str]) -> Set[str]:
+        if self._index is not None:
+            video_ids = [video_id for video_id in video_ids if video_id in self._index]
+            if self._index.is_exact:
+                return set(video_ids)
+
+        existing = set()
+        with self._lock:
+            self._flush()
+            for i in range(0, len(video_ids), SQLITE_MAX_VARIABLES):
+                batch = video_ids[i:i + SQLITE_MAX_VARIABLES]
+                cur = self.connection.execute(
+                    'SELECT video_id FROM VIDEOS WHERE video_id IN ({})'.format(','.join('?' * len(batch))),
+                    batch
+                )
+                existing.update(video_id for (video_id,) in cur)
+        return existing
 
     def add_video(self, entry: 'ContentItem'):
-        cur = self.connection.cursor()
-        cur.execute(
-            'INSERT INTO VIDEOS(video_id, channel_id, timestamp, title, channel_name, filename) '
-            'VALUES (?, ?, ?, ?, ?, ?)',
-            (entry.video_id, entry.channel_id, entry.timestamp, entry.title, entry.channel_name, entry.filename)
-        )
+        with self._lock:
+            self._pending_videos.append(_row(entry))
+            if self._index is not None:
+                self._index.add(entry.video_id)
+            if len(self._pending_videos) >= self.batch_size:
+                self._flush()
 
     def add_livestream(self, entry: 'ContentItem'):
-        cur = self.connection.cursor()
-        cur.execute(
-            'INSERT INTO LIVESTREAMS(video_id, channel_id, timestamp, title, channel_name, filename) '
-            'VALUES (?, ?, ?, ?, ?, ?)',
-            (entry.video_id, entry.channel_id, entry.timestamp, entry.title, entry.channel_name, entry.filename)
-        )
-        self.commit()
+        with self._lock:
+            self._write(INSERT_LIVESTREAM, _row(entry))
+            self.sync()
+
+    def update_livestream_segments(self, entry: 'ContentItem', segments: List[str]):
+        with self._lock:
+            self._write(UPDATE_LIVESTREAM_SEGMENTS, (json.dumps(segments), entry.video_id, entry.filename))
+            self.sync()
+
+    def find_uploads_playlists(self, channels_ids: List[str]) -> Dict[str, str]:
+        playlists = {}
+        with self._lock:
+            for i in range(0, len(channels_ids), SQLITE_MAX_VARIABLES):
+                batch = channels_ids[i:i + SQLITE_MAX_VARIABLES]
+                cur = self.connection.execute(
+                    'SELECT channel_id, uploads_playlist_id FROM CHANNELS WHERE channel_id IN ({})'.format(
+                        ','.join('?' * len(batch))
+                    ),
+                    batch
+                )
+                playlists.update(cur)
+        return playlists
+
+    def add_channel(self, channel_id: str, uploads_playlist_id: str):
+        with self._lock:
+            self._write(INSERT_CHANNEL, (channel_id, uploads_playlist_id))
+
+    def list_upload_timestamps(self, channel_id: str, limit: int) -> List[int]:
+        with self._lock:
+            self._flush()
+            cur = self.connection.execute(SELECT_UPLOAD_TIMESTAMPS, (channel_id, limit))
+            return [timestamp for (timestamp,) in cur]
+
+    def get_watermark(self, channel_id: str) -> Optional[ChannelWatermark]:
+        with self._lock:
+            row = self.connection.execute(SELECT_WATERMARK, (channel_id,)).fetchone()
+        if row is None:
+            return None
+        return ChannelWatermark(*row[:4], backfill_complete=bool(row[4]))
+
+    def set_watermark(self, watermark: ChannelWatermark):
+        with self._lock:
+            self._write(
+                INSERT_WATERMARK,
+                (
+                    watermark.channel_id,
+                    watermark.video_id,
+                    watermark.timestamp,
+                    watermark.backfill_page_token,
+                    int(watermark.backfill_complete)
+                )
+            )
+
+    def get_download_progress(self, video_id: str) -> Optional[Tuple[int, Optional[int]]]:
+        with self._lock:
+            return self.connection.execute(SELECT_DOWNLOAD_PROGRESS, (video_id,)).fetchone()
+
+    def set_download_progress(self, video_id: str, offset: int, total_size: Optional[int]):
+        with self._lock:
+            self._write(INSERT_DOWNLOAD_PROGRESS, (video_id, offset, total_size, video_id))
+
+    def add_download_failure(self, video_id: str) -> int:
+        """
+        Counts failed attempt to download the video
+
+        :param video_id: ID of the video
+        :return: number of failed attempts so far, 0 if the download is not registered
+        """
+        with self._lock:
+            self._write(UPDATE_DOWNLOAD_FAILURES, (video_id,))
+            row = self.connection.execute(SELECT_DOWNLOAD_FAILURES, (video_id,)).fetchone()
+            self.sync()
+        return row[0] if row is not None else 0
+
+    def remove_download(self, video_id: str):
+        with self._lock:
+            self._write(DELETE_DOWNLOAD, (video_id,))
+            self.sync()
+
+    def list_incomplete_downloads(self) -> Iterator[ContentItem]:
+        with self._lock:
+            self._flush()
+            rows = self.connection.execute(SELECT_INCOMPLETE_DOWNLOADS).fetchall()
+        for columns in rows:
+            yield ContentItem(*columns)
 
     def commit(self):
-        self.connection.commit()
+        """
+        Writes buffered rows and ends the transaction, if the batch is full or its time bound passed
+        """
+        with self._lock:
+            self._flush()
+            batch_full = self._uncommitted_rows >= self.batch_size
+            if batch_full or time.monotonic() - self._last_commit_at >= self.batch_interval:
+                self.sync()
+
+    def sync(self):
+        """
+        Writes buffered rows and ends the transaction
+        """
+        with self._lock:
+            self._flush()
+            self.connection.commit()
+            self._uncommitted_rows = 0
+            self._last_commit_at = time.monotonic()
+
+    def _write(self, statement: str, parameters: tuple):
+        self.connection.execute(statement, parameters)
+        self._uncommitted_rows += 1
+
+    def _flush(self):
+        if len(self._pending_videos) > 0:
+            self.connection.executemany(INSERT_VIDEO, self._pending_videos)
+            self._uncommitted_rows += len(self._pending_videos)
+            self._pending_videos = []
+
+    def _configure_connection(self):
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('PRAGMA cache_size=-{}'.format(SQLITE_CACHE_SIZE_KB))
+        self.connection.execute('PRAGMA mmap_size={}'.format(SQLITE_MMAP_SIZE))
 
     def _initialise_schema(self):
-        cur = self.connection.cursor()
-        cur.execute(
-            'CREATE TABLE VIDEOS('
-            'video_id VARCHAR(16) PRIMARY KEY, '
-            'channel_id VARCHAR(32), '
-            'timestamp DATETIME, '
-            'title TEXT, '
-            'channel_name TEXT, '
-            'filename TEXT'
-            ')'
-        )
-        cur.execute(
-            'CREATE TABLE LIVESTREAMS('
-            'id INTEGER PRIMARY KEY AUTOINCREMENT,'
-            'video_id VARCHAR(16), '
-            'channel_id VARCHAR(32), '
-            'timestamp DATETIME, '
-            'title TEXT, '
-            'channel_name TEXT, '
-            'filename TEXT'
-            ')'
+        self.connection.execute('CREATE TABLE IF NOT EXISTS SCHEMA_VERSION(version INTEGER NOT NULL)')
+        row = self.connection.execute(SELECT_SCHEMA_VERSION).fetchone()
+        version = row[0] if row is not None else 0
+
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            try:
+                self.connection.execute('BEGIN')
+                migration(self.connection)
+                self.connection.execute('DELETE FROM SCHEMA_VERSION')
+                self.connection.execute('INSERT INTO SCHEMA_VERSION(version) VALUES (?)', (number,))
+                self.connection.commit()
+            except Exception:
+                self.connection.rollback()
+                raise
+
+
+def _row(entry: ContentItem) -> tuple:
+    return (
+        entry.video_id,
+        entry.channel_id,
+        entry.timestamp,
+        entry.title,
+        entry.channel_name,
+        entry.filename
+    )
+
+
+def _create_tables(connection: sqlite3.Connection):
+    # databases created before schema versioning already have some of the tables
+    cur = connection.cursor()
+    cur.execute(
+        'CREATE TABLE IF NOT EXISTS VIDEOS('
+        'video_id VARCHAR(16) PRIMARY KEY, '
+        'channel_id VARCHAR(32), '
+        'timestamp DATETIME, '
+        'title TEXT, '
+        'channel_name TEXT, '
+        'filename TEXT'
+        ')'
+    )
+    cur.execute(
+        'CREATE TABLE IF NOT EXISTS LIVESTREAMS('
+        'id INTEGER PRIMARY KEY AUTOINCREMENT,'
+        'video_id VARCHAR(16), '
+        'channel_id VARCHAR(32), '
+        'timestamp DATETIME, '
+        'title TEXT, '
+        'channel_name TEXT, '
+        'filename TEXT, '
+        'segments TEXT'
+        ')'
+    )
+    _ensure_column(connection, 'LIVESTREAMS', 'segments', 'TEXT')
+    cur.execute(
+        'CREATE TABLE IF NOT EXISTS CHANNELS('
+        'channel_id VARCHAR(32) PRIMARY KEY, '
+        'uploads_playlist_id VARCHAR(34)'
+        ')'
+    )
+    cur.execute(
+        'CREATE TABLE IF NOT EXISTS CHANNEL_WATERMARKS('
+        'channel_id VARCHAR(32) PRIMARY KEY, '
+        'video_id VARCHAR(16), '
+        'timestamp DATETIME, '
+        'backfill_page_token TEXT, '
+        'backfill_complete INTEGER'
+        ')'
+    )
+    cur.execute(
+        'CREATE TABLE IF NOT EXISTS DOWNLOADS('
+        'video_id VARCHAR(16) PRIMARY KEY, '
+        'offset INTEGER, '
+        'total_size INTEGER'
+        ')'
+    )
+
+
+def _create_indexes(connection: sqlite3.Connection):
+    connection.execute('CREATE INDEX IF NOT EXISTS VIDEOS_CHANNEL_TIMESTAMP ON VIDEOS(channel_id, timestamp)')
+    connection.execute('CREATE INDEX IF NOT EXISTS VIDEOS_TIMESTAMP ON VIDEOS(timestamp)')
+    connection.execute('CREATE INDEX IF NOT EXISTS LIVESTREAMS_VIDEO_ID ON LIVESTREAMS(video_id)')
+
+
+def _make_livestreams_unique(connection: sqlite3.Connection):
+    # recordings of the same livestream differ by filename, duplicates are left by replayed inserts
+    connection.execute(
+        'DELETE FROM LIVESTREAMS WHERE id NOT IN (SELECT MIN(id) FROM LIVESTREAMS GROUP BY video_id, filename)'
+    )
+    connection.execute(
+        'CREATE UNIQUE INDEX IF NOT EXISTS LIVESTREAMS_VIDEO_ID_FILENAME ON LIVESTREAMS(video_id, filename)'
+    )
+
+
+def _convert_timestamps_to_integers(connection: sqlite3.Connection):
+    # publishedAt strings become seconds since epoch, columns of DATETIME type keep integers as they are
+    for table in ['VIDEOS', 'LIVESTREAMS', 'CHANNEL_WATERMARKS']:
+        connection.execute(
+            "UPDATE {} SET timestamp = CAST(strftime('%s', timestamp) AS INTEGER) "
+            "WHERE typeof(timestamp) = 'text'".format(table)
         )
-        self.connection.commit()
+
+
+def _count_download_failures(connection: sqlite3.Connection):
+    _ensure_column(connection, 'DOWNLOADS', 'failures', 'INTEGER DEFAULT 0')
+
+
+def _ensure_column(connection: sqlite3.Connection, table: str, column: str, column_type: str):
+    columns = [row[1] for row in connection.execute('PRAGMA table_info({})'.format(table))]
+    if column not in columns:
+        connection.execute('ALTER TABLE {} ADD COLUMN {} {}'.format(table, column, column_type))
+
+
+# applied in order, every database stores the number of applied migrations in SCHEMA_VERSION table
+MIGRATIONS = [
+    _create_tables,
+    _create_indexes,
+    _convert_timestamps_to_integers,
+    _make_livestreams_unique,
+    _count_download_failures
+]